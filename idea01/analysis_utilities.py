@@ -1,5 +1,6 @@
-import json
 from typing import Optional, Any
+from google.genai import types
+from shared_backend import MusicFeatures, parse_music_features
 
 class MusicAnalyzer:
     """
@@ -56,14 +57,22 @@ FOCUS ON: Extracting features that convey the music's **emotional trajectory, ph
             "description": "A consistent, simple beat.",
             "duration": "2 measures"
         }}
-    ]
+    ],
+    "tempo_changes": [{{ "measure": 23, "description": "ritardando (gradually slowing down)" }}],
+    "dynamic_changes": [{{ "measure": 33, "level": "pp", "description": "pianissimo (very soft)" }}]
 }}
 --- END OF RESPONSE FORMAT ---
 
 Return ONLY the JSON object. Do not include any explanation or markdown text outside the JSON block.
 """
 
-    def extract_features(self, uploaded_file: Any) -> Optional[dict]:
+        # Constrained decoding: the model must answer with JSON in the MusicFeatures shape
+        self.config = types.GenerateContentConfig(
+            response_mime_type="application/json",
+            response_schema=MusicFeatures,
+        )
+
+    def extract_features(self, uploaded_file: Any) -> Optional[MusicFeatures]:
         """
         Calls the Gemini model to analyze the file and extract structured musical features.
 
@@ -71,7 +80,7 @@ Return ONLY the JSON object. Do not include any explanation or markdown text out
             uploaded_file: The client.files.File object returned by FileUploader.
 
         Returns:
-            A Python dictionary containing the extracted features, or None on failure.
+            A validated MusicFeatures object, or None on failure.
         """
         if uploaded_file is None:
             return None
@@ -82,26 +91,20 @@ Return ONLY the JSON object. Do not include any explanation or markdown text out
             response = self.client.models.generate_content(
                 model=self.model,
                 contents=[uploaded_file, self.prompt_template],
+                config=self.config,
             )
-            
-            # The model is strictly instructed to return ONLY the JSON object
-            raw_text = response.text.strip()
-            
-            # Attempt to parse the JSON output
-            # Clean up potential markdown code block wrappers (e.g., ```json...```)
-            if raw_text.startswith("```json"):
-                raw_text = raw_text.lstrip("```json").rstrip("```")
-            elif raw_text.startswith("```"):
-                raw_text = raw_text.lstrip("```").rstrip("```")
-                
-            music_features = json.loads(raw_text)
-            print("SUCCESS: Musical features extracted and parsed.")
-            return music_features
-            
-        except json.JSONDecodeError as e:
+        except Exception as e:
+            print(f"ERROR: Gemini API call failed during feature extraction: {e}")
+            return None
+
+        # Strict JSON is expected; anything else goes through the repair parser so
+        # a slightly malformed answer doesn't waste the whole file analysis
+        raw_text = response.text or ""
+        try:
+            music_features = parse_music_features(raw_text)
+        except ValueError as e:
             print(f"ERROR: Failed to parse model output as JSON. Check model's adherence to format: {e}")
             print(f"Raw Output (First 200 chars): {raw_text[:200]}...")
             return None
-        except Exception as e:
-            print(f"ERROR: Gemini API call failed during feature extraction: {e}")
-            return None
\ No newline at end of file
+        print("SUCCESS: Musical features extracted and parsed.")
+        return music_features
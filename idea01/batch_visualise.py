@@ -0,0 +1,254 @@
+# --- ASSUMED IMPORTS ---
+import shared_backend  # noqa: F401  (puts the idea02 backend package on sys.path)
+from backend.music_features import MusicFeatures
+from backend.note_array import prompt_features
+from backend.services.gemini_client import get_client
+from backend.services.narration_service import NarrationService
+from backend.utils.local_db import LocalDatabase
+from file_utilities import FileUploader
+from analysis_utilities import MusicAnalyzer
+from score_processor import ScoreProcessor, response_art_config, CONSISTENCY_DISCLAIMER
+from viz_graphics_prompts import GraphicScorePrompts
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional
+import argparse
+import hashlib
+import json
+import os
+import pathlib
+import threading
+import time
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS = [1, 2, 5, 10, 30, 60]
+STAGES = ["upload", "analysis", "narration", "image"]
+# Stages sampled once per score rather than once per style
+SHARED_STAGES = {"narration": "one batched call per score, shared by its styles"}
+
+
+# ====================================================================
+# I N P U T S   A N D   C H E C K P O I N T
+# ====================================================================
+def collect_scores(source: str) -> list[pathlib.Path]:
+    """
+    Resolves the batch input: a directory (every *.pdf inside, recursively) or a
+    manifest file (a JSON list of paths, or one path per line; '#' starts a comment).
+    Relative manifest entries are resolved against the manifest's directory.
+    """
+    source_path = pathlib.Path(source)
+    if source_path.is_dir():
+        return sorted(source_path.rglob("*.pdf"))
+
+    text = source_path.read_text()
+    if source_path.suffix == ".json":
+        entries = json.loads(text)
+    else:
+        entries = [line.split("#", 1)[0].strip() for line in text.splitlines()]
+    return [source_path.parent / entry for entry in entries if entry]
+
+
+def file_sha256(path: pathlib.Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Checkpoint:
+    """
+    Append-only JSON-lines record of finished (score, style) pairs. Scores are
+    identified by content hash, so renaming or moving a PDF doesn't redo it.
+    A pair only counts as done while its image still exists on disk.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._done: set[tuple[str, str]] = set()
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue # A run killed mid-write leaves a partial last line
+                    if os.path.exists(record.get("image", "")):
+                        self._done.add((record["score"], record["style"]))
+
+    def is_done(self, score_hash: str, style: str) -> bool:
+        return (score_hash, style) in self._done
+
+    def mark_done(self, score_hash: str, score_path: str, style: str, image_path: str) -> None:
+        record = {"score": score_hash, "path": score_path, "style": style, "image": image_path, "completed_at": time.time()}
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+            self._done.add((score_hash, style))
+
+
+# ====================================================================
+# B A T C H   R U N N E R
+# ====================================================================
+class BatchRunner:
+    """
+    Runs FileUploader -> MusicAnalyzer -> ScoreProcessor over many scores with
+    at most `concurrency` scores in flight. Each score gets its own output
+    directory holding features.json and one PNG per style; styles already in
+    the checkpoint are skipped, and saved features skip upload and analysis.
+    """
+    def __init__(self, uploader: FileUploader, analyzer: MusicAnalyzer, processor: ScoreProcessor,
+                 output_dir: str, checkpoint: Checkpoint, concurrency: int = 4):
+        self.uploader = uploader
+        self.analyzer = analyzer
+        self.processor = processor
+        self.output_dir = output_dir
+        self.checkpoint = checkpoint
+        self.concurrency = concurrency
+        self.latencies: dict[str, list[float]] = {stage: [] for stage in STAGES}
+        self._latency_lock = threading.Lock()
+
+    def _record(self, stage: str, seconds: float) -> None:
+        with self._latency_lock:
+            self.latencies[stage].append(seconds)
+
+    def _load_features(self, score_path: pathlib.Path, score_dir: str) -> Optional[MusicFeatures]:
+        """Reuses features saved by an earlier run, otherwise uploads and analyzes the score."""
+        features_path = os.path.join(score_dir, "features.json")
+        if os.path.exists(features_path):
+            with open(features_path) as f:
+                return MusicFeatures.from_dict(json.load(f))
+
+        started = time.perf_counter()
+        uploaded_file = self.uploader.upload_local_file(str(score_path))
+        self._record("upload", time.perf_counter() - started)
+        if not uploaded_file:
+            return None
+
+        started = time.perf_counter()
+        music_features = self.analyzer.extract_features(uploaded_file)
+        self._record("analysis", time.perf_counter() - started)
+        self.uploader.delete_uploaded_file(uploaded_file)
+        if not music_features:
+            return None
+
+        with open(features_path + ".tmp", "w") as f:
+            json.dump(music_features.to_dict(), f, indent=4)
+        os.replace(features_path + ".tmp", features_path)
+        return music_features
+
+    def process_score(self, score_path: pathlib.Path) -> str:
+        """Renders the missing styles of one score; returns 'done', 'skipped' or 'failed'."""
+        score_hash = file_sha256(score_path)
+        pending = [
+            (name, prompt) for name, prompt in self.processor.prompts_class.get_prompt_list()
+            if not self.checkpoint.is_done(score_hash, name)
+        ]
+        if not pending:
+            return "skipped"
+
+        score_dir = os.path.join(self.output_dir, f"{score_path.stem}-{score_hash[:8]}")
+        os.makedirs(score_dir, exist_ok=True)
+        music_features = self._load_features(score_path, score_dir)
+        if not music_features:
+            print(f"ERROR: Could not analyze {score_path}")
+            return "failed"
+
+        def on_result(result: dict) -> None:
+            for stage, seconds in result["timings"].items():
+                self._record(stage, seconds)
+            if result["image_path"]:
+                self.checkpoint.mark_done(score_hash, str(score_path), result["name"], result["image_path"])
+
+        results = self.processor.process_and_generate(
+            sheet_data=music_features,
+            sheet_data_raw_string=json.dumps(prompt_features(music_features)),
+            output_dir=score_dir,
+            prompts=pending,
+            on_result=on_result,
+            # One batched narration call covers every style, so it is one sample per score
+            on_narrated=lambda seconds: self._record("narration", seconds),
+        )
+        return "done" if all(result["image_path"] for result in results) else "failed"
+
+    def run(self, score_paths: list[pathlib.Path]) -> dict[str, int]:
+        """Processes every score and returns how many ended up done, skipped or failed."""
+        outcomes = {"done": 0, "skipped": 0, "failed": 0}
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="batch-score") as pool:
+            futures = {pool.submit(self.process_score, path): path for path in score_paths}
+            for future in as_completed(futures):
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    print(f"ERROR: Batch processing failed for {futures[future]}: {e}")
+                    outcome = "failed"
+                outcomes[outcome] += 1
+                print(f"[{sum(outcomes.values())}/{len(score_paths)}] {outcome.upper()}: {futures[future]}")
+        return outcomes
+
+
+# ====================================================================
+# S U M M A R Y
+# ====================================================================
+def format_histogram(samples: list[float], width: int = 40) -> list[str]:
+    """Renders latency samples as one text bar per bucket."""
+    labels = [f"<= {bound}s" for bound in LATENCY_BUCKETS] + [f"> {LATENCY_BUCKETS[-1]}s"]
+    counts = [0] * len(labels)
+    for seconds in samples:
+        counts[next((i for i, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound), len(LATENCY_BUCKETS))] += 1
+    peak = max(counts) or 1
+    return [f"  {label:>7} | {'#' * round(count / peak * width):<{width}} {count}" for label, count in zip(labels, counts)]
+
+
+def print_summary(outcomes: dict[str, int], latencies: dict[str, list[float]], elapsed: float) -> None:
+    processed = outcomes["done"] + outcomes["failed"]
+    print("\n=== BATCH SUMMARY ===")
+    print(f"Scores: {outcomes['done']} done, {outcomes['skipped']} skipped (checkpoint), {outcomes['failed']} failed")
+    print(f"Elapsed: {elapsed:.1f}s, throughput: {processed / (elapsed / 60) if elapsed else 0:.2f} scores/minute")
+    for stage, samples in latencies.items():
+        if not samples:
+            continue
+        ordered = sorted(samples)
+        p50 = ordered[len(ordered) // 2]
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        label = f"{stage} ({SHARED_STAGES[stage]})" if stage in SHARED_STAGES else stage
+        print(f"\n{label}: n={len(ordered)}, p50={p50:.2f}s, p95={p95:.2f}s, max={ordered[-1]:.2f}s")
+        print("\n".join(format_histogram(samples)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Pre-render graphic score visualizations for a library of PDFs.")
+    parser.add_argument("source", help="Directory of PDFs, or a manifest (.json list or one path per line)")
+    parser.add_argument("--output-dir", default="batch_output", help="Root directory for per-score outputs")
+    parser.add_argument("--concurrency", type=int, default=4, help="Scores processed at the same time")
+    parser.add_argument("--style-workers", type=int, default=4, help="Styles generated in parallel per score")
+    parser.add_argument("--style-timeout", type=float, default=180.0, help="Seconds allowed per style")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <output-dir>/checkpoint.jsonl)")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    score_paths = collect_scores(args.source)
+    checkpoint = Checkpoint(args.checkpoint or os.path.join(args.output_dir, "checkpoint.jsonl"))
+
+    client = get_client()
+    # Narrations are cached next to the outputs, so resumed runs don't pay for them again
+    narrator = NarrationService(client, GraphicScorePrompts.json_string,
+                                db=LocalDatabase(os.path.join(args.output_dir, "narrations.db")))
+    runner = BatchRunner(
+        FileUploader(client),
+        MusicAnalyzer(client),
+        ScoreProcessor(client, GraphicScorePrompts, response_art_config, CONSISTENCY_DISCLAIMER,
+                       max_workers=args.style_workers, style_timeout=args.style_timeout, narrator=narrator),
+        output_dir=args.output_dir,
+        checkpoint=checkpoint,
+        concurrency=args.concurrency,
+    )
+
+    print(f"--- STARTING BATCH: {len(score_paths)} scores, concurrency {args.concurrency} ---")
+    started = time.perf_counter()
+    outcomes = runner.run(score_paths)
+    print_summary(outcomes, runner.latencies, time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    main()
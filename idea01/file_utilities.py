@@ -41,6 +41,16 @@ class FileUploader:
             print(f"ERROR: Failed to upload file to client.files.upload: {e}")
             return None
 
+    def delete_uploaded_file(self, uploaded_file) -> None:
+        """
+        Deletes a file previously uploaded with upload_local_file, so batch runs
+        don't accumulate remote copies of every score.
+        """
+        try:
+            self.client.files.delete(name=uploaded_file.name)
+        except Exception as e:
+            print(f"WARNING: Failed to delete uploaded file {uploaded_file.name}: {e}")
+
 # Example Usage (replace with your actual client initialization)
 # client = initialize_your_gemini_client()
 # uploader = FileUploader(client)
@@ -1,12 +1,13 @@
 import pathlib
 import os
 from google import genai
+from shared_backend import get_client
 from google.genai import types
 from PIL import Image
 from io import BytesIO
 
 # Initialize Gemini client
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+client = get_client(api_key=os.getenv("GEMINI_API_KEY"))
 
 # 1️⃣ Upload the sheet music file (PDF, MusicXML, etc.)
 file_path = pathlib.Path("/workspaces/g-api-scratch/idea01/inaccessible-toile.pdf")
@@ -0,0 +1,47 @@
+# --- ASSUMED IMPORTS ---
+import shared_backend  # noqa: F401  (puts the idea02 backend package on sys.path)
+from backend.music_features import MusicFeatures
+from backend.prompt_encoder import count_prompt_tokens, encode_features
+from backend.services.gemini_client import get_client
+from viz_graphics_prompts import GraphicScorePrompts
+import argparse
+import json
+
+IMAGE_MODEL = "gemini-2.0-flash-exp-image-generation"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Compare image prompt input tokens with the full features JSON versus the compact encoding."
+    )
+    parser.add_argument("features", help="Features JSON, e.g. inaccessible-toile.json")
+    parser.add_argument("--styles", nargs="+", help="Styles to compare (default: all)")
+    parser.add_argument("--show", action="store_true", help="Print the compact encoding of each style")
+    args = parser.parse_args()
+
+    with open(args.features, encoding="utf-8") as f:
+        raw = json.load(f)
+    music_features = MusicFeatures.from_dict(raw)
+    raw_string = json.dumps(raw, indent=4)
+    client = get_client()
+
+    total_before = total_after = 0
+    for name, prompt in GraphicScorePrompts.get_prompt_list():
+        if args.styles and name not in args.styles:
+            continue
+        compact = encode_features(music_features, name)
+        before = count_prompt_tokens(client, IMAGE_MODEL, prompt.replace(GraphicScorePrompts.json_string, raw_string))
+        after = count_prompt_tokens(client, IMAGE_MODEL, prompt.replace(GraphicScorePrompts.json_string, compact))
+        if before is None or after is None:
+            continue
+        total_before += before
+        total_after += after
+        print(f"{name:<36} {before:>7} -> {after:>6} tokens ({100 * (before - after) / before:.0f}% fewer)")
+        if args.show:
+            print(compact + "\n")
+    if total_before:
+        print(f"{'TOTAL':<36} {total_before:>7} -> {total_after:>6} tokens ({100 * (total_before - total_after) / total_before:.0f}% fewer)")
+
+
+if __name__ == "__main__":
+    main()
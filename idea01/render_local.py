@@ -0,0 +1,43 @@
+# --- ASSUMED IMPORTS ---
+import shared_backend  # noqa: F401  (puts the idea02 backend package on sys.path)
+from backend.music_features import MusicFeatures
+from backend.services.local_renderer import LOCAL_STYLES, render_score
+import argparse
+import json
+import os
+import time
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Render the data-mapped styles (constellation, waveform, micro-notation) locally from note data."
+    )
+    parser.add_argument("features", help="Features JSON with a 'notes_sample' list, e.g. inaccessible-toile.json")
+    parser.add_argument("--output-dir", default="images_local", help="Directory for the PNG and SVG files")
+    parser.add_argument("--styles", nargs="+", choices=sorted(LOCAL_STYLES), default=list(LOCAL_STYLES),
+                        help="Styles to render (default: all)")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    args = parser.parse_args()
+
+    with open(args.features, encoding="utf-8") as f:
+        music_features = MusicFeatures.from_dict(json.load(f))
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    for style in args.styles:
+        started = time.perf_counter()
+        try:
+            rendered = render_score(style, music_features, args.width, args.height)
+        except ValueError as e:
+            print(f"ERROR: {style}: {e}")
+            continue
+        base = os.path.join(args.output_dir, style)
+        with open(base + ".png", "wb") as f:
+            f.write(rendered.png)
+        with open(base + ".svg", "w", encoding="utf-8") as f:
+            f.write(rendered.svg)
+        print(f"{style}: {base}.png, {base}.svg ({(time.perf_counter() - started) * 1000:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
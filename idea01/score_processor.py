@@ -1,4 +1,5 @@
 from google import genai
+from shared_backend import get_client, MusicFeatures, NarrationService, can_render, encode_features, render_score
 import json
 from file_utilities import FileUploader
 from analysis_utilities import MusicAnalyzer
@@ -6,7 +7,9 @@ from google.genai import types
 from PIL import Image
 from io import BytesIO
 import json
-import traceback
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Optional
 from viz_graphics_prompts import GraphicScorePrompts
 
 # --- SETUP (Replace MockClient with your actual client initialization) ---
@@ -72,7 +75,7 @@ class MockTypes:
         def __init__(self, response_modalities):
             self.response_modalities = response_modalities
 
-client = genai.Client()
+client = get_client()
 # Assume FileUploader and MusicAnalyzer are the classes defined above
 uploader = FileUploader(client)
 analyzer = MusicAnalyzer(client)
@@ -94,127 +97,227 @@ response_art_config = types.GenerateContentConfig(
 
 # --- EXECUTION FLOW ---
 
-# 1. Define the input file path (Simulating user upload of a PDF)
-file_path_pdf = "/workspaces/g-api-scratch/idea01/beethoven-ludwig-van-sonata-282.pdf"
+# Running this module directly performs a single upload + analysis as a smoke test;
+# importing it (e.g. from visualise.py or batch_visualise.py) only defines ScoreProcessor.
+if __name__ == "__main__":
+    # 1. Define the input file path (Simulating user upload of a PDF)
+    file_path_pdf = "/workspaces/g-api-scratch/idea01/beethoven-ludwig-van-sonata-282.pdf"
 
-print("--- 1. File Upload Stage ---")
-uploaded_file = uploader.upload_local_file(file_path_pdf)
+    print("--- 1. File Upload Stage ---")
+    uploaded_file = uploader.upload_local_file(file_path_pdf)
 
-# 2. Extract musical features
-if uploaded_file:
-    music_features_dict = analyzer.extract_features(uploaded_file)
+    # 2. Extract musical features
+    if uploaded_file:
+        music_features = analyzer.extract_features(uploaded_file)
     
-    if music_features_dict:
-        # 3. Output the result in a readable format
-        print("\n=== FINAL EXTRACTED MUSICAL FEATURES (JSON) ===")
-        # The dictionary can now be passed directly to the visualization class/function
-        print(json.dumps(music_features_dict, indent=4))
+        if music_features:
+            # 3. Output the result in a readable format
+            print("\n=== FINAL EXTRACTED MUSICAL FEATURES (JSON) ===")
+            # The dictionary can now be passed directly to the visualization class/function
+            print(json.dumps(music_features.to_dict(), indent=4))
+        else:
+            print("\nPROCESS HALTED: Could not generate structured musical features.")
     else:
-        print("\nPROCESS HALTED: Could not generate structured musical features.")
-else:
-    print("\nPROCESS HALTED: Could not upload the source file.")
-    
+        print("\nPROCESS HALTED: Could not upload the source file.")
+
 class ScoreProcessor:
     """
     Handles the final stage of the pipeline: generating narration and images 
     for all available prompts based on the extracted music features.
+
+    Styles are independent, so they are generated in parallel on a bounded
+    thread pool (`max_workers`), each with its own `style_timeout`. Images are
+    still saved in prompt order, and one summary is printed at the end. All
+    narrations come from one batched call to the NarrationService up front.
+
+    With `compact_prompts`, each image prompt carries the compact encoding of
+    the features for its style (encode_features) instead of the raw JSON.
     """
-    def __init__(self, client, prompts_class, art_config, disclaimer):
+    def __init__(self, client, prompts_class, art_config, disclaimer, max_workers: int = 4, style_timeout: float = 180.0,
+                 narrator: Optional[NarrationService] = None, compact_prompts: bool = True):
         self.client = client
         self.prompts_class = prompts_class
         self.art_config = art_config
         self.disclaimer = disclaimer
+        self.max_workers = max_workers
+        self.style_timeout = style_timeout
+        self.narrator = narrator or NarrationService(client, prompts_class.json_string)
+        self.compact_prompts = compact_prompts
 
-    def process_and_generate(self, sheet_data: dict[str, any], sheet_data_raw_string: str, output_dir: str = "/workspaces/g-api-scratch/idea01/images"):
+    def process_and_generate(self, sheet_data: MusicFeatures, sheet_data_raw_string: str, output_dir: str = "/workspaces/g-api-scratch/idea01/images",
+                             prompts: Optional[list[tuple[str, str]]] = None,
+                             on_result: Optional[Callable[[dict[str, any]], None]] = None,
+                             on_narrated: Optional[Callable[[float], None]] = None) -> list[dict[str, any]]:
         """
         Runs the full visualization generation loop.
 
+        Narrations for all styles are fetched in one call, then every image is
+        dispatched at once; a progress line is printed as each one finishes. Images are written (and `on_result` is called) in prompt
+        order as soon as all earlier styles are done, so output never depends
+        on which call happened to return first.
+
         Args:
-            sheet_data: The parsed music features (Python dict).
-            sheet_data_raw_string: The raw JSON string of the features (used for image prompt).
+            sheet_data: The validated music features.
+            sheet_data_raw_string: The raw JSON string of the features (used for image prompts when compact_prompts is off).
             output_dir: The directory to save the generated images.
+            prompts: Optional subset of (name, prompt) tuples to render; defaults to every prompt.
+            on_result: Optional callback invoked with each style's result once it is saved.
+            on_narrated: Optional callback invoked once with the seconds the batched
+                narration call took. It is shared by every style, so it is not in their timings.
+
+        Returns:
+            One result dict per style, in prompt order: name, narration, image_path
+            (None if no image was saved), error (None on success) and timings
+            (seconds spent on the style's own image call).
         """
-        for name, prompt in self.prompts_class.get_prompt_list():
-            
-            # 1. DYNAMICALLY EXTRACT KEY DATA FOR NARRATION
-            try:
-                # Safely extract data for narration, using generic keys
-                data_summary = {
-                    "title": sheet_data.get("title", "The Music"),
-                    "key_mood": sheet_data.get("key_signature", "Neutral").split(" ")[0],
-                    "time_signature": sheet_data.get("time_signature", "N/A").split(" ")[0],
-                    "initial_tempo_desc": sheet_data.get("initial_tempo", {}).get("description", "A moderate pace"),
-                    "initial_tempo_term": sheet_data.get("initial_tempo", {}).get("term", "Moderato").strip("()"), # Use 'term' from the constrained JSON
-                    "initial_dynamics_desc": sheet_data.get("initial_dynamics", {}).get("description", "Quiet"),
-                    "initial_dynamics_term": sheet_data.get("initial_dynamics", {}).get("level", "p"),
-                    "initial_articulation_term": sheet_data.get("initial_dynamics", {}).get("articulation", "smoothly"),
-                    # Adjusting to the new JSON structure for motifs
-                    "rhythm_highlight": sheet_data.get("repeating_motifs", [{}])[0].get("description", "A consistent, simple beat."),
-                }
-            except Exception as e:
-                print(f"\n--- ERROR in Data Extraction for {name} ---")
-                print(f"FAILED to extract data using dictionary access: {e}")
-                print("Traceback:\n" + traceback.format_exc())
-                continue # Skip visualization for this prompt
-                
-            # 2. ASSEMBLE GENERIC NARRATION PROMPT
-            narration_prompt_text = f"""
-            Based on the following musical summary for '{data_summary['title']}' 
-            and the visual style described in the visualization prompt below, create a unique, 
-            creative, and helpful narration (maximum 70 words) for a beginner/non-musician/deaf user. 
-            
-            The narration MUST use language that emphasizes the STRUCTURAL MAPPING (e.g., 'The waves rise and fall with the pitch contour...') rather than just emotional flair.
-            
-            IMPORTANT: Include the exact technical musical term in parentheses (e.g., 'soft (p)') 
-            next to its beginner-friendly description, using the terms provided in the summary.
-            
-            --- MUSIC SUMMARY ---
-            Style: {data_summary['key_mood']} Key, {data_summary['time_signature']} time.
-            Start: {data_summary['initial_tempo_desc']} ({data_summary['initial_tempo_term']}), {data_summary['initial_dynamics_desc']} ({data_summary['initial_dynamics_term']}), {data_summary['initial_articulation_term']} texture.
-            Highlight: {data_summary['rhythm_highlight']}
-            
-            --- VISUALIZATION PROMPT STYLE ---
-            {prompt.format(json_string='[... music data is mapped here to the visualization rules specified in the prompt ...]')}
-            """
-            
-            # 3. Call the text model for narration
-            try:
-                response_narration = self.client.models.generate_content(
-                    model="gemini-2.5-flash", 
-                    contents=[narration_prompt_text]
-                )
-                narration = response_narration.text.strip()
-            except Exception as e:
-                narration = f"[Error generating narration from API: {e}]"
-                
+        prompts = self.prompts_class.get_prompt_list() if prompts is None else prompts
+
+        # 1. NARRATE EVERY STYLE IN ONE CALL (cached styles are not re-sent)
+        started = time.perf_counter()
+        try:
+            narrations = self.narrator.narrate(sheet_data, prompts)
+        except Exception as e:
+            print(f"ERROR: Batched narration failed: {e}")
+            narrations = {}
+        narration_seconds = time.perf_counter() - started
+        if on_narrated:
+            on_narrated(narration_seconds)
+
+        results: list[Optional[dict[str, any]]] = [None] * len(prompts)
+        next_to_save = 0
+        started_at: dict[int, float] = {}
+
+        def run_style(index: int, name: str, prompt: str) -> dict[str, any]:
+            started_at[index] = time.monotonic()
+            narration = narrations.get(name, "[Error generating narration from API: no narration returned]")
+            data_string = encode_features(sheet_data, name) if self.compact_prompts else sheet_data_raw_string
+            return self.generate_style(data_string, name, prompt, narration)
+
+        pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="score-style")
+        futures = {pool.submit(run_style, i, name, prompt): i for i, (name, prompt) in enumerate(prompts)}
+        pending = set(futures)
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+                now = time.monotonic()
+                for future in list(pending):
+                    index = futures[future]
+                    if index in started_at and now - started_at[index] > self.style_timeout:
+                        # The call can't be interrupted; its late result is simply ignored
+                        pending.discard(future)
+                        future.cancel()
+                        done.add(future)
+
+                for future in done:
+                    index = futures[future]
+                    name = prompts[index][0]
+                    if not future.done():
+                        result = self._failed_result(name, f"timed out after {self.style_timeout:.0f}s")
+                    elif future.exception():
+                        result = self._failed_result(name, str(future.exception()))
+                    else:
+                        result = future.result()
+                    if not result.get("image") and can_render(name, sheet_data):
+                        result = self._render_locally(result, sheet_data, narrations.get(name))
+                    results[index] = result
+                    finished = sum(r is not None for r in results)
+                    print(f"[{finished}/{len(prompts)}] {name}: {'ready' if result.get('image') else 'FAILED'}")
+
+                # Save the finished prefix in prompt order
+                while next_to_save < len(results) and results[next_to_save] is not None:
+                    result = results[next_to_save]
+                    result["image_path"] = self._save_image(result, output_dir)
+                    if on_result:
+                        on_result(result)
+                    next_to_save += 1
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        # 4. PRINT SINGLE SUMMARY AND DISCLAIMER
+        self._print_summary(results, narration_seconds)
+        print(self.disclaimer)
+        return results
+
+    @staticmethod
+    def _render_locally(result: dict[str, any], sheet_data: MusicFeatures, narration: Optional[str]) -> dict[str, any]:
+        """Falls back to the local renderer for data-mapped styles whose image call failed or timed out."""
+        try:
+            rendered = render_score(result["name"], sheet_data)
+        except ValueError as e:
+            print(f"WARNING: Local rendering of {result['name']} failed: {e}")
+            return result
+        print(f"WARNING: {result['name']}: image model failed ({result['error']}); using the local rendering.")
+        return {**result, "narration": result["narration"] or narration, "image": (rendered.png, "image/png"),
+                "svg": rendered.svg, "error": None, "fallback": "local"}
+
+    @staticmethod
+    def _failed_result(name: str, error: str) -> dict[str, any]:
+        return {"name": name, "narration": None, "image": None, "image_path": None, "error": error, "timings": {}}
+
+    def generate_style(self, sheet_data_raw_string: str, name: str, prompt: str, narration: str) -> dict[str, any]:
+        """
+        Generates the image for one style without touching the filesystem and
+        pairs it with the style's narration. `image` holds (bytes, mime_type),
+        or None with `error` set.
+        """
+        timings = {}
+
+        # 2. GENERATE IMAGE (with the score data in place of the prompt's placeholder)
+        image, error = None, None
+        started = time.perf_counter()
+        try:
+            response_art = self.client.models.generate_content(
+                model="gemini-2.0-flash-exp-image-generation",
+                contents=[prompt.replace(self.prompts_class.json_string, sheet_data_raw_string)], 
+                config=self.art_config
+            )
+            for part in response_art.candidates[0].content.parts:
+                if part.inline_data:
+                    image = (part.inline_data.data, part.inline_data.mime_type)
+                    break 
+            if not image:
+                error = "No image data found in the response."
+        except Exception as e:
+            error = f"Failed to generate image: {e}"
+        timings["image"] = time.perf_counter() - started
+
+        return {"name": name, "narration": narration, "image": image, "image_path": None, "error": error, "timings": timings}
+
+    def _save_image(self, result: dict[str, any], output_dir: str) -> Optional[str]:
+        """3. SAVE IMAGE: writes a style's image to `<output_dir>/<name>.png` and returns the path."""
+        if not result.get("image"):
+            return None
+        image_bytes, mime_type = result["image"]
+        image_filename = f"{output_dir}/{result['name']}.png"
+        try:
+            if mime_type == "image/png":
+                # Already a PNG: write the bytes as-is instead of decoding and re-encoding
+                with open(image_filename, "wb") as image_file:
+                    image_file.write(image_bytes)
+            else:
+                image = Image.open(BytesIO(image_bytes))
+                image.save(image_filename)
+            if result.get("svg"):
+                # Local renderings also come as scalable vector graphics
+                with open(f"{output_dir}/{result['name']}.svg", "w") as svg_file:
+                    svg_file.write(result["svg"])
+        except Exception as e:
+            result["error"] = f"Failed to save image: {e}"
+            return None
+        return image_filename
+
+    def _print_summary(self, results: list[dict[str, any]], narration_seconds: float) -> None:
+        for result in results:
             print(f"\n=======================================================")
-            print(f"--- Visualization: {name} ---")
-            print(f"NARRATION: {narration}")
-            
-            # 4. GENERATE IMAGE (using the raw JSON string)
-            try:
-                response_art = self.client.models.generate_content(
-                    model="gemini-2.0-flash-exp-image-generation",
-                    contents=[prompt.format(json_string=sheet_data_raw_string)], 
-                    config=self.art_config
-                )
-
-                # 5. SAVE IMAGE
-                image_saved = False
-                for part in response_art.candidates[0].content.parts:
-                    if part.inline_data:
-                        image = Image.open(BytesIO(part.inline_data.data))
-                        image_filename = f"{output_dir}/{name}.png"
-                        image.save(image_filename)
-                        print(f"STATUS: Image saved as {image_filename}")
-                        image_saved = True
-                        break 
-                
-                if not image_saved:
-                    print("STATUS: No image data found in the response.")
-
-            except Exception as e:
-                print(f"ERROR: Failed to generate or save image for {name}: {e}")
-            
-        # 6. PRINT SINGLE-BLOCK DISCLAIMER
-        print(self.disclaimer)
\ No newline at end of file
+            print(f"--- Visualization: {result['name']} ---")
+            if result.get("narration"):
+                print(f"NARRATION: {result['narration']}")
+            if result.get("image_path"):
+                print(f"STATUS: Image saved as {result['image_path']}")
+            else:
+                print(f"ERROR: {result.get('error')}")
+
+        saved = sum(1 for result in results if result.get("image_path"))
+        image_seconds = [result["timings"]["image"] for result in results if "image" in result["timings"]]
+        print(f"\n=== {saved}/{len(results)} visualizations saved; narration {narration_seconds:.1f}s (one call, shared)"
+              + (f"; slowest image call {max(image_seconds):.1f}s" if image_seconds else "") + " ===")
@@ -0,0 +1,30 @@
+"""
+Makes the idea02 backend package importable from the idea01 scripts, so both
+projects share one implementation of common infrastructure.
+
+Only the names the original idea01 scripts use are re-exported here. Newer
+scripts import this module for the path setup alone and then import from the
+`backend` modules directly.
+"""
+import pathlib
+import sys
+
+_IDEA02_DIR = pathlib.Path(__file__).resolve().parents[1] / "idea02"
+if str(_IDEA02_DIR) not in sys.path:
+    sys.path.insert(0, str(_IDEA02_DIR))
+
+# Shared, resilient Gemini client (connection reuse, retries, rate limiting, circuit breaker)
+from backend.services.gemini_client import get_client  # noqa: E402
+# Batched multi-style narration with a per-style cache
+from backend.services.narration_service import NarrationService  # noqa: E402
+# Typed analysis result shared by both analyzers
+from backend.music_features import MusicFeatures, parse_music_features  # noqa: E402
+# Local, deterministic renderer for the data-mapped styles (preview and fallback)
+from backend.services.local_renderer import can_render, render_score  # noqa: E402
+# Vectorized note statistics (contour, density, register, loudness, key) added to the prompt data
+from backend.note_array import prompt_features  # noqa: E402
+# Compact per-style score encoding for image prompts
+from backend.prompt_encoder import encode_features  # noqa: E402
+# Single, versioned registry of the image prompt templates (backend/prompt_templates/*.txt)
+from backend.prompt_registry import PROMPTS  # noqa: E402
+from backend.prompts import GraphicScorePrompts  # noqa: E402
@@ -1,25 +1,76 @@
-from google import genai
-from google.genai import types
-import httpx
+import shared_backend  # noqa: F401  (puts the idea02 backend package on sys.path)
+from backend.services.gemini_client import get_client
+from backend.services.score_qa import ScoreQAService
+import argparse
 import pathlib
 import os
 
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+prompt_basic = "Summarize this document"
+prompt_test = "Can you help me understand the attached score and what the notes mean?"
+prompt_further = "I don't know music. Help me understand what this sheet music is doing and how I can familiarise myself with it."
+prompt_translate = "Can you give carnatic music notes for this sheet music?"
 
-# Retrieve and encode the PDF byte
-file_path = pathlib.Path("/workspaces/g-api-scratch/idea01/inaccessible-toile.pdf")
 
-# Upload the PDF using the File API
-sample_file = client.files.upload(
-  file=file_path,
-)
+class MockClient:
+    """Local stand-in for the Gemini client, so the Q&A flow can run offline."""
+    def __init__(self):
+        self.files = self
+        self.models = self
+        self.caches = MockCaches()
+    def upload(self, file, config=None):
+        class MockFile:
+            name = f"files/{pathlib.Path(str(getattr(file, 'name', file))).stem}"
+        print(f"MOCK: Uploading file: {MockFile.name}")
+        return MockFile()
+    def delete(self, name):
+        print(f"MOCK: Deleting file: {name}")
+    def generate_content(self, model, contents, config=None):
+        cached = bool(config and config.cached_content)
+        class MockResponse:
+            class usage_metadata:
+                # The cached score counts towards the prompt, but is billed at the cached rate
+                prompt_token_count = 2000 + len(str(contents[-1])) // 4
+                cached_content_token_count = 2000 if cached else 0
+                candidates_token_count = 50
+            text = f"MOCK answer to: {contents[-1]}"
+        return MockResponse()
+
+
+class MockCaches:
+    def create(self, model, config):
+        class MockCache:
+            name = f"cachedContents/{config.display_name}"
+        print(f"MOCK: Caching {len(config.contents)} file(s) for {config.ttl}")
+        return MockCache()
+    def update(self, name, config):
+        print(f"MOCK: Extending {name} to {config.ttl}")
+    def delete(self, name):
+        print(f"MOCK: Deleting cache: {name}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Ask several questions about one score, sending the file only once.")
+    parser.add_argument("score", nargs="?", default=str(pathlib.Path(__file__).with_name("inaccessible-toile.pdf")))
+    parser.add_argument("--question", action="append", help="Question to ask (repeatable; default: the built-in prompts)")
+    parser.add_argument("--offline", action="store_true", help="Use a local stand-in client instead of the Gemini API")
+    args = parser.parse_args()
+
+    client = MockClient() if args.offline else get_client(api_key=os.getenv("GEMINI_API_KEY"))
+    questions = args.question or [prompt_basic, prompt_test, prompt_further, prompt_translate]
+
+    # The score and the tutor instructions are cached once; each question then only sends itself
+    qa_service = ScoreQAService(client)
+    session = qa_service.open(args.score, mime_type="application/pdf")
+    if not session:
+        return
+    with session:
+        for question in questions:
+            print(f"\n>>> {question}\n{session.ask(question)}")
+        usage = session.usage
+        print(f"\nTokens: {usage['prompt_tokens']} prompt ({usage['cached_tokens']} from cache), "
+              f"{usage['output_tokens']} output, over {session.questions} questions "
+              f"({'cached' if session.cached else 'uncached'} context).")
 
-prompt_basic = "Summarize this document"
-prompt_test = "You are an expert musician. I am a novice. Can you help me understand the attached score and what the notes mean?"
-prompt_further = "You are an expert musician. I don't know music. Help me understand what this sheet music is doing and how I can familiarise myself with it."
-prompt_translate = "Can you give carnatic music notes for this sheet music?"
 
-response = client.models.generate_content(
-  model="gemini-2.5-flash",
-  contents=[sample_file, prompt_translate])
-print(response.text)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 # --- ASSUMED IMPORTS ---
 from google import genai
+from shared_backend import get_client, prompt_features
 from google.genai import types
 from file_utilities import FileUploader
 from analysis_utilities import MusicAnalyzer
@@ -7,7 +8,7 @@ from score_processor import ScoreProcessor, response_art_config, CONSISTENCY_DIS
 from viz_graphics_prompts import GraphicScorePrompts
 import json
 
-client = genai.Client() 
+client = get_client()
 file_path_pdf = "/workspaces/g-api-scratch/idea01/beethoven-ludwig-van-sonata-282.pdf"
 output_image_dir = "/workspaces/g-api-scratch/idea01/images"
 
@@ -43,23 +44,23 @@ def run_music_visualization_pipeline():
     # STAGE 2: FEATURE EXTRACTION (MusicAnalyzer)
     # ------------------------------------------
     print("\n[STAGE 2/3] Feature Extraction and Structuring...")
-    music_features_dict = analyzer.extract_features(uploaded_file)
+    music_features = analyzer.extract_features(uploaded_file)
     
-    if not music_features_dict:
+    if not music_features:
         print("PIPELINE ABORTED: Structured feature extraction failed.")
         return
 
     # Prepare raw string for the image model (Stage 3)
-    music_features_raw_string = json.dumps(music_features_dict)
+    music_features_raw_string = json.dumps(prompt_features(music_features))
     
     print("\n=== STAGE 2 RESULT: Extracted Data ===")
-    print(json.dumps(music_features_dict, indent=4))
+    print(json.dumps(music_features.to_dict(), indent=4))
 
     # STAGE 3: VISUALIZATION PROCESSING (ScoreProcessor)
     # --------------------------------------------------
     print("\n[STAGE 3/3] Generating Narrations and Visualizations...")
     processor.process_and_generate(
-        sheet_data=music_features_dict,
+        sheet_data=music_features,
         sheet_data_raw_string=music_features_raw_string,
         output_dir=output_image_dir
     )
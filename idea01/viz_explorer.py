@@ -1,19 +1,22 @@
 import pathlib
 import os
-import traceback
 from google import genai
+from shared_backend import get_client, MusicFeatures
 from google.genai import types
 from PIL import Image
 from io import BytesIO
 import json
 from viz_graphics_prompts import GraphicScorePrompts
 
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+client = get_client(api_key=os.getenv("GEMINI_API_KEY"))
 
 with open("/workspaces/g-api-scratch/idea01/inaccessible-toile.json", 'r', encoding='utf-8') as f:
 	sheet_data_raw_string = f.read()
 	sheet_data = json.loads(sheet_data_raw_string)
 
+# 2a. EXTRACT KEY DATA FOR NARRATION (validated once, shared by every prompt)
+data_summary = MusicFeatures.from_dict(sheet_data).narration_summary()
+
 CONSISTENCY_DISCLAIMER = (
 	"\n"
 	"=========================================================\n"
@@ -31,27 +34,6 @@ response_art_config = types.GenerateContentConfig(
 
 for name, prompt in GraphicScorePrompts.get_prompt_list():
 	
-	# 2a. DYNAMICALLY EXTRACT KEY DATA FOR NARRATION
-		try:
-			# Safely extract data for narration, using generic keys
-			data_summary = {
-				"title": sheet_data.get("title", "The Music"),
-				"key_mood": sheet_data.get("key_signature", "Neutral").split(" ")[0],
-				"time_signature": sheet_data.get("time_signature", "N/A").split(" ")[0],
-				"initial_tempo_desc": sheet_data.get("initial_tempo", {}).get("description", "A moderate pace"),
-				"initial_tempo_term": sheet_data.get("initial_tempo", {}).get("description", "A moderate pace").split(" ")[0].strip("()"),
-				"initial_dynamics_desc": sheet_data.get("initial_dynamics", {}).get("description", "Quiet"),
-				"initial_dynamics_term": sheet_data.get("initial_dynamics", {}).get("level", "p"),
-				"initial_articulation_term": sheet_data.get("initial_dynamics", {}).get("articulation", "smoothly"),
-				"rhythm_highlight": sheet_data.get("repeating_motifs", [{}])[0].get("description", "A consistent, simple beat."),
-			}
-		except Exception as e:
-			# Use traceback for descriptive error printing if data access fails unexpectedly
-			print(f"\n--- ERROR in Data Extraction for {name} ---")
-			print(f"FAILED to extract data using dictionary access: {e}")
-			print("Traceback:\n" + traceback.format_exc())
-			continue # Skip visualization for this prompt
-			
 		# 2b. ASSEMBLE GENERIC NARRATION PROMPT
 		narration_prompt_text = f"""
 		Based on the following musical summary for '{data_summary['title']}' 
@@ -69,7 +51,7 @@ for name, prompt in GraphicScorePrompts.get_prompt_list():
 		Highlight: {data_summary['rhythm_highlight']}
 		
 		--- VISUALIZATION PROMPT STYLE ---
-		{prompt.format(json_string='[... music data is mapped here to the visualization rules specified in the prompt ...]')}
+		{prompt.replace(GraphicScorePrompts.json_string, '[... music data is mapped here to the visualization rules specified in the prompt ...]')}
 		"""
 		
 		# 2c. Call the text model for narration
@@ -90,7 +72,7 @@ for name, prompt in GraphicScorePrompts.get_prompt_list():
 		try:
 			response_art = client.models.generate_content(
 				model="gemini-2.0-flash-exp-image-generation",
-				contents=[prompt.format(json_string=sheet_data_raw_string)], 
+				contents=[prompt.replace(GraphicScorePrompts.json_string, sheet_data_raw_string)], 
 				config=response_art_config
 			)
 
@@ -0,0 +1,16 @@
+"""
+Development server: `python -m backend` from idea02/.
+
+The app is only imported under the main guard. Image variant workers start
+from a forkserver (or spawn), which re-imports this module as __mp_main__;
+there it does nothing, so workers never build the app, its database
+connections or its clients.
+"""
+import os
+
+if __name__ == "__main__":
+    from .app import UPLOAD_FOLDER, app
+
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    # The application will run on port 5000 inside the dev container
+    app.run(host="0.0.0.0", port=5000, debug=True)
@@ -1,17 +1,32 @@
 import os
 import json
 import random
-from flask import Flask, request, jsonify
-from werkzeug.utils import secure_filename
-from google import genai
-from typing import Any, Dict, Optional, Tuple, List
+import uuid
+from flask import Flask, Response, request, jsonify, g, send_file, stream_with_context
+from typing import Any, Iterator, Optional, Tuple
 from flask_cors import CORS
 
 # Import Modular Services
-from .utils.file_management import FileManagement
+from .utils.file_management import FileManagement, SpooledUpload
+from .utils.file_registry import RemoteFileRegistry
 from .services.analysis_service import MusicAnalyzer 
 from .services.visualization_service import VisualizationGenerator
-from .prompts import GraphicScorePrompts, CONSISTENCY_DISCLAIMER
+from .services.narration_service import NarrationService
+from .services.pipeline_service import MusicPipeline
+from .services.prefetch_service import StylePrefetcher
+from .services.trivia_service import TriviaPool, FALLBACK_TRIVIA
+from .services.gemini_client import get_client
+from .services.score_qa import ScoreQAService
+from .utils.job_queue import JobQueue, QueueFullError, Job
+from .utils.local_db import LocalDatabase
+from .utils.feature_cache import FeatureCache, features_hash
+from .utils.session_store import SessionStore
+from .utils.image_store import ImageStore, ORIGINAL, SVG
+from .utils.image_variants import ImageVariantProcessor
+from .prompts import CONSISTENCY_DISCLAIMER
+from .prompt_registry import PROMPTS
+from .music_features import MusicFeatures
+from .note_array import prompt_features
 
 # ====================================================================
 # A. FLASK SETUP AND INITIALIZATION
@@ -21,19 +36,82 @@ app = Flask(__name__)
 CORS(app)
 UPLOAD_FOLDER = '/tmp'
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# Uploads up to this size stay in memory; larger ones spill to a unique temp file in UPLOAD_FOLDER
+app.config['UPLOAD_SPOOL_MAX_BYTES'] = int(os.getenv('SCORESENSE_UPLOAD_SPOOL_MAX_BYTES', str(16 * 1024 * 1024)))
+# Background worker pool for /api/process-music (size and waiting-queue depth)
+app.config['JOB_WORKERS'] = int(os.getenv('SCORESENSE_JOB_WORKERS', '2'))
+app.config['JOB_QUEUE_DEPTH'] = int(os.getenv('SCORESENSE_JOB_QUEUE_DEPTH', '8'))
+# Local persistent state (SQLite, shared by all workers on the host)
+app.config['DATA_DIR'] = os.getenv('SCORESENSE_DATA_DIR', '/tmp/scoresense')
+# Content-addressed cache of extracted features, keyed by upload hash + analyzer model/prompt
+app.config['FEATURE_CACHE_MAX_ENTRIES'] = int(os.getenv('SCORESENSE_FEATURE_CACHE_MAX_ENTRIES', '1000'))
+app.config['FEATURE_CACHE_MAX_BYTES'] = int(os.getenv('SCORESENSE_FEATURE_CACHE_MAX_BYTES', str(50 * 1024 * 1024)))
+app.config['FEATURE_CACHE_TTL_SECONDS'] = int(os.getenv('SCORESENSE_FEATURE_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+# Per-session score state: in-memory LRU front (entry/byte caps) over the shared database
+app.config['SESSION_TTL_SECONDS'] = int(os.getenv('SCORESENSE_SESSION_TTL_SECONDS', '3600'))
+app.config['SESSION_CACHE_MAX_ENTRIES'] = int(os.getenv('SCORESENSE_SESSION_CACHE_MAX_ENTRIES', '256'))
+app.config['SESSION_CACHE_MAX_BYTES'] = int(os.getenv('SCORESENSE_SESSION_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+app.config['IMAGE_VARIANT_WORKERS'] = int(os.getenv('SCORESENSE_IMAGE_VARIANT_WORKERS', '2'))
+# Speculative generation of alternate styles for /api/regenerate: styles kept ready per
+# session, generations allowed per uploaded score, and concurrent prefetch workers
+app.config['PREFETCH_STYLES'] = int(os.getenv('SCORESENSE_PREFETCH_STYLES', '2'))
+app.config['PREFETCH_BUDGET'] = int(os.getenv('SCORESENSE_PREFETCH_BUDGET', '4'))
+app.config['PREFETCH_WORKERS'] = int(os.getenv('SCORESENSE_PREFETCH_WORKERS', '2'))
+# Draw the data-mapped styles locally as an instant preview and a fallback for the image model
+app.config['LOCAL_RENDERING'] = os.getenv('SCORESENSE_LOCAL_RENDERING', '1') == '1'
+# Compact, per-style score encoding in image prompts instead of the full JSON; optionally log token counts
+app.config['COMPACT_PROMPTS'] = os.getenv('SCORESENSE_COMPACT_PROMPTS', '1') == '1'
+app.config['REPORT_PROMPT_TOKENS'] = os.getenv('SCORESENSE_REPORT_PROMPT_TOKENS', '0') == '1'
+# Uploaded scores are kept on the File API and reused for this long (must stay below its 48h expiry);
+# a background janitor deletes expired uploads in batches every REMOTE_FILE_JANITOR_SECONDS
+app.config['REMOTE_FILE_TTL_SECONDS'] = int(os.getenv('SCORESENSE_REMOTE_FILE_TTL_SECONDS', str(46 * 3600)))
+app.config['REMOTE_FILE_JANITOR_SECONDS'] = float(os.getenv('SCORESENSE_REMOTE_FILE_JANITOR_SECONDS', '300'))
+# Score Q&A: the uploaded score is held in a context cache for this long after the last question
+app.config['QA_TTL_SECONDS'] = int(os.getenv('SCORESENSE_QA_TTL_SECONDS', '600'))
+# Scores (and PDF chunks) up to this size are sent inline with the analysis request instead of
+# through the File API upload/delete round-trips (0 = always use the File API)
+app.config['INLINE_UPLOAD_MAX_BYTES'] = int(os.getenv('SCORESENSE_INLINE_UPLOAD_MAX_BYTES', str(8 * 1024 * 1024)))
+# Long PDFs are analyzed in parallel chunks of this many pages (0 = always analyze the whole file)
+app.config['ANALYSIS_PAGES_PER_CHUNK'] = int(os.getenv('SCORESENSE_ANALYSIS_PAGES_PER_CHUNK', '4'))
+SESSION_COOKIE = 'scoresense_session'
+IMAGE_MAX_AGE_SECONDS = 365 * 24 * 3600
 
 # Initialize the Gemini Client
 try:
-    client = genai.Client() 
+    client = get_client()
 except Exception as e:
     print(f"FATAL: Failed to initialize Gemini Client. Check API Key environment variable. Error: {e}")
     client = None
 
+# Trivia shown while loading; filled in batches by a background thread
+trivia_pool: Optional[TriviaPool] = None
+if client:
+    trivia_pool = TriviaPool(client)
+    trivia_pool.start()
+
+local_db = LocalDatabase(os.path.join(app.config['DATA_DIR'], 'scoresense.db'))
+
+# Generated images, content-addressed by sha256 and served from /api/images/<hash>
+image_store = ImageStore(os.path.join(app.config['DATA_DIR'], 'images'))
+# Thumbnail/WebP variants are built in a separate process pool, off the request thread
+variant_processor = ImageVariantProcessor(image_store, max_workers=app.config['IMAGE_VARIANT_WORKERS'])
+
 # Initialize modular service instances
 if client:
     file_manager = FileManagement(client)
+    # One upload per score, shared by the analysis and Q&A of every worker
+    file_registry = RemoteFileRegistry(local_db, file_manager, ttl_seconds=app.config['REMOTE_FILE_TTL_SECONDS'],
+                                       janitor_interval=app.config['REMOTE_FILE_JANITOR_SECONDS'])
+    file_registry.start()
     analyzer = MusicAnalyzer(client)
-    generator = VisualizationGenerator(client)
+    # Narrations for all styles of a score come from one batched call, cached per style
+    narrator = NarrationService(client, PROMPTS.placeholder, db=local_db)
+    generator = VisualizationGenerator(client, image_store, variant_processor=variant_processor, narrator=narrator,
+                                       local_rendering=app.config['LOCAL_RENDERING'],
+                                       compact_prompts=app.config['COMPACT_PROMPTS'],
+                                       report_prompt_tokens=app.config['REPORT_PROMPT_TOKENS'])
+    # Follow-up questions about a score reuse one cached context instead of resending the file
+    qa_service = ScoreQAService(client, ttl_seconds=app.config['QA_TTL_SECONDS'], file_registry=file_registry)
 else:
     # Use placeholder classes if client fails to initialize
     class MockService:
@@ -41,12 +119,112 @@ else:
         def __call__(self, *args, **kwargs): return {"error": "Client unavailable"}, 503
     
     file_manager = MockService(None)
+    file_registry = None
     analyzer = MockService(None)
     generator = MockService(None)
+    qa_service = MockService(None)
+
+feature_cache = FeatureCache(
+    local_db,
+    max_entries=app.config['FEATURE_CACHE_MAX_ENTRIES'],
+    max_bytes=app.config['FEATURE_CACHE_MAX_BYTES'],
+    ttl_seconds=app.config['FEATURE_CACHE_TTL_SECONDS'],
+)
+pipeline = MusicPipeline(file_manager, analyzer, generator, feature_cache=feature_cache,
+                         pages_per_chunk=app.config['ANALYSIS_PAGES_PER_CHUNK'], file_registry=file_registry,
+                         inline_max_bytes=app.config['INLINE_UPLOAD_MAX_BYTES'])
+# Job status and events are shared through the database, so any worker can answer /api/jobs/<id>
+job_queue = JobQueue(max_workers=app.config['JOB_WORKERS'], max_queue_depth=app.config['JOB_QUEUE_DEPTH'], db=local_db)
+
+# Per-session state: {"features": <analyzed score>, "last_prompt_name": <last style shown>}
+session_store = SessionStore(
+    local_db,
+    max_entries=app.config['SESSION_CACHE_MAX_ENTRIES'],
+    max_bytes=app.config['SESSION_CACHE_MAX_BYTES'],
+    ttl_seconds=app.config['SESSION_TTL_SECONDS'],
+)
+
+
+
+def _is_current_score(session_id: str, score_id: str) -> bool:
+    session_state = session_store.get(session_id)
+    return bool(session_state) and session_state.get("score_id") == score_id
+
+
+prefetcher = StylePrefetcher(
+    generator,
+    local_db,
+    is_current=_is_current_score,
+    buffer_size=app.config['PREFETCH_STYLES'],
+    budget_per_score=app.config['PREFETCH_BUDGET'],
+    max_workers=app.config['PREFETCH_WORKERS'],
+    ttl_seconds=app.config['SESSION_TTL_SECONDS'],
+)
+
+
+def _session_id() -> str:
+    """Returns the caller's session id, issuing a new one (sent back as a cookie) if needed."""
+    if 'session_id' not in g:
+        session_id = request.cookies.get(SESSION_COOKIE, '')
+        if len(session_id) != 32 or not session_id.isalnum():
+            session_id = uuid.uuid4().hex
+            g.new_session = True
+        g.session_id = session_id
+    return g.session_id
+
+
+@app.after_request
+def _set_session_cookie(response):
+    if g.get('new_session'):
+        response.set_cookie(SESSION_COOKIE, g.session_id, max_age=app.config['SESSION_TTL_SECONDS'],
+                            httponly=True, samesite='Lax')
+    return response
+
+
+def _process_music_job(job: Job, upload: SpooledUpload, session_id: str) -> None:
+    """Background job body: runs the pipeline and publishes its result to the session."""
+    def store_features(music_features: MusicFeatures) -> None:
+        features_dict = music_features.to_dict()
+        session_store.put(session_id, {
+            "features": features_dict,
+            "score_id": features_hash(features_dict),
+            "last_prompt_name": None,
+        })
+
+    # Styles prefetched for the previous score are no longer wanted. This runs in the job,
+    # not the request, so a rejected upload keeps them and this job's own prefetch is never cancelled.
+    prefetcher.cancel(session_id)
+    outcome = pipeline.run(job, upload, on_features=store_features)
+    if not outcome:
+        return
+
+    music_features, result = outcome
+    session_state = session_store.update(session_id, last_prompt_name=result.get("prompt_name"))
+    if session_state:
+        # Get the next styles ready while the user looks at this one
+        prefetcher.start(session_id, session_state["score_id"], music_features, result.get("prompt_name"))
+    result["disclaimer"] = CONSISTENCY_DISCLAIMER
+    job.finish(result)
+
+# Seconds between keep-alive comments on an idle event stream, so proxies don't drop it
+SSE_KEEPALIVE_SECONDS = 15
+
+def _sse(event: str, data: Any, event_id: Optional[int] = None) -> str:
+    """Formats one Server-Sent Event; data is sent as a single line of JSON."""
+    prefix = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{prefix}event: {event}\ndata: {json.dumps(data)}\n\n"
 
-# Store persistent data (in a real app, use a secure DB/Cache)
-music_data_store: Dict[str, Any] = {} 
-last_prompt_name: Optional[str] = None
+def _sse_response(events: Iterator[str]) -> Response:
+    response = Response(stream_with_context(events), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no" # Don't let nginx buffer the stream
+    return response
+
+def _pick_regenerate_prompt(last_prompt_name: Optional[str]) -> Tuple[str, str]:
+    """Picks a random style, different from the last one shown when possible."""
+    all_prompts = PROMPTS.prompt_list()
+    available_prompts = [p for p in all_prompts if p[0] != last_prompt_name]
+    return random.choice(available_prompts) if available_prompts else random.choice(all_prompts)
 
 # ====================================================================
 # B. API ROUTES
@@ -54,25 +232,19 @@ last_prompt_name: Optional[str] = None
 
 @app.route("/api/trivia", methods=["GET"])
 def get_music_trivia():
-    """Endpoint for fetching a quick music fact during the loading process."""
-    if not client:
-        return jsonify({"trivia": "Music is the space between the notes. - Claude Debussy"}), 200
-    try:
-        trivia_prompt = "Generate one single 10-second digestible snippet/trivia from the music world. Start directly with the fact, no salutations or headings."
-        response = client.models.generate_content(model="gemini-2.5-flash", contents=[trivia_prompt])
-        return jsonify({"trivia": response.text.strip()})
-    except Exception as e:
-        print(f"Trivia error: {e}")
-        return jsonify({"trivia": "Music is the space between the notes. - Claude Debussy"}), 200
+    """Endpoint for fetching a quick music fact during the loading process (served from the pool)."""
+    trivia = trivia_pool.next() if trivia_pool else None
+    return jsonify({"trivia": trivia or FALLBACK_TRIVIA}), 200
 
 
 @app.route("/api/process-music", methods=["POST"])
 def process_music_file():
     """
-    Handles file upload, feature extraction, and initial visualization generation.
+    Accepts the upload and queues feature extraction and initial visualization
+    generation as a background job. Poll /api/jobs/<job_id> for progress.
+    PDFs and images are analyzed by the model; MusicXML (.musicxml/.xml/.mxl)
+    and MIDI files are parsed locally, skipping the upload stage.
     """
-    global last_prompt_name
-    
     if not client:
         return jsonify({"error": "Gemini client not initialized. Check API Key."}), 503
         
@@ -80,39 +252,156 @@ def process_music_file():
         return jsonify({"error": "No file selected."}), 400
     
     file = request.files['file']
-    filename = secure_filename(file.filename)
     
-    # 1. Local File Management (Non-AI)
-    filepath = file_manager.save_local_file(file, filename, app.config['UPLOAD_FOLDER'])
-    
-    # 2. API File Upload (Non-AI)
-    uploaded_file = file_manager.upload_to_api(filepath)
-    file_manager.cleanup_local_file(filepath) # Clean up temporary local file
+    # 1. Buffer the upload (Non-AI). The request stream is gone once we return.
+    upload = file_manager.spool_upload(file, app.config['UPLOAD_SPOOL_MAX_BYTES'], app.config['UPLOAD_FOLDER'])
 
-    if not uploaded_file:
-        return jsonify({"error": "Failed to upload file to processing API."}), 500
+    try:
+        job = job_queue.submit(MusicPipeline.STAGES, _process_music_job, upload, _session_id())
+    except QueueFullError as e:
+        # The previous score stays current, so its prefetched styles are kept
+        upload.close()
+        return jsonify({"error": str(e)}), 429
 
-    # 3. Feature Extraction (AI Service 1)
-    music_features_dict = analyzer.extract_features(uploaded_file)
-    
-    file_manager.delete_api_file(uploaded_file) # Clean up the Gemini File API resource
-    
-    if not music_features_dict:
-        return jsonify({"error": "Failed to extract structured musical features."}), 500
+    return jsonify({"job_id": job.id, "status": job.status, "status_url": f"/api/jobs/{job.id}"}), 202
 
-    # 4. Visualization Generation (AI Service 2)
-    music_data_store['current_score'] = music_features_dict 
-    last_prompt_name = None 
-    
-    music_features_raw_string = json.dumps(music_features_dict)
-    result = generator.generate_visualization(music_features_dict, music_features_raw_string)
-    
-    if result.get("status") != 200:
-        return jsonify({"error": result.get("error")}), result.get("status")
 
-    last_prompt_name = result.get("prompt_name")
-    result["disclaimer"] = CONSISTENCY_DISCLAIMER
-    return jsonify(result), 200
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def get_job_status(job_id: str):
+    """Reports per-stage progress of a processing job and, once done, its result."""
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({"error": "Unknown or expired job id."}), 404
+    return jsonify(job.to_dict()), 200
+
+@app.route("/api/jobs/<job_id>/events", methods=["GET"])
+def stream_job_events(job_id: str):
+    """
+    Streams a job's progress as Server-Sent Events: 'stage' changes, 'style',
+    'narration' fragments, 'narration_done' and 'image' as they happen, then
+    'done' with the full result or 'error'. Reconnecting clients resume after
+    the Last-Event-ID they received; EventSource does this automatically.
+    """
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({"error": "Unknown or expired job id."}), 404
+    last_event_id = request.headers.get("Last-Event-ID", "")
+    cursor = int(last_event_id) + 1 if last_event_id.isdigit() else 0
+
+    def events():
+        nonlocal cursor
+        while True:
+            batch, next_cursor = job.wait_events(cursor, timeout=SSE_KEEPALIVE_SECONDS)
+            if not batch:
+                if job.finished:
+                    return
+                yield ": keep-alive\n\n"
+                continue
+            for offset, (event, data) in enumerate(batch):
+                yield _sse(event, data, cursor + offset)
+                if event in ("done", "error"):
+                    return
+            cursor = next_cursor
+
+    return _sse_response(events())
+
+@app.route("/api/images/<image_hash>", methods=["GET"])
+def get_image(image_hash: str):
+    """
+    Serves a generated image by its content hash. `?variant=` selects a smaller
+    rendition (e.g. 'thumb', 'web', or 'svg' for local renderings); the default
+    is the lossless original.
+    The bytes behind a hash/variant never change, so responses may be cached
+    forever; conditional and Range requests are handled by send_file.
+    """
+    variant = request.args.get("variant", ORIGINAL)
+    if variant not in (ORIGINAL, SVG) and variant not in variant_processor.variant_names():
+        return jsonify({"error": f"Unknown image variant '{variant}'."}), 400
+
+    found = image_store.find(image_hash, variant)
+    cacheable = found is not None
+    if not found and variant != ORIGINAL:
+        # The variant is still being rendered: serve the original, but don't let it be cached as the variant
+        found = image_store.find(image_hash)
+        variant = ORIGINAL
+    if not found:
+        return jsonify({"error": "Image not found."}), 404
+
+    path, mime_type = found
+    etag = image_hash if variant == ORIGINAL else f"{image_hash}.{variant}"
+    response = send_file(path, mimetype=mime_type, conditional=True, etag=etag, max_age=IMAGE_MAX_AGE_SECONDS)
+    response.headers["Cache-Control"] = (
+        f"public, max-age={IMAGE_MAX_AGE_SECONDS}, immutable" if cacheable else "no-cache"
+    )
+    response.headers["X-Image-Variant"] = variant
+    return response
+
+@app.route("/api/stats", methods=["GET"])
+def get_stats():
+    """Reports cache, prefetch and model-call counters, e.g. how often the same score is uploaded again."""
+    return jsonify({
+        "feature_cache": feature_cache.stats(),
+        "prefetch": prefetcher.stats(),
+        "gemini": client.stats() if client else {},
+        "single_flight": {
+            "analysis": pipeline.analysis_flights.stats(),
+            "generation": generator.flights.stats() if client else {},
+        },
+        "narration": narrator.stats() if client else {},
+        "qa": qa_service.stats() if client else {},
+        "remote_files": file_registry.stats() if file_registry else {},
+        "upload_paths": pipeline.upload_stats(),
+    }), 200
+
+@app.route("/api/qa/sessions", methods=["POST"])
+def open_qa_session():
+    """
+    Starts a Q&A session about an uploaded score: the file and the tutor
+    instructions are cached once, so each question only sends the question.
+    Sessions live in this worker's memory and close after QA_TTL_SECONDS idle.
+    """
+    if not client:
+        return jsonify({"error": "Gemini client not initialized. Check API Key."}), 503
+    if 'file' not in request.files or request.files['file'].filename == '':
+        return jsonify({"error": "No file selected."}), 400
+
+    upload = file_manager.spool_upload(request.files['file'], app.config['UPLOAD_SPOOL_MAX_BYTES'], app.config['UPLOAD_FOLDER'])
+    try:
+        qa_session = qa_service.open(upload.file, mime_type=upload.mime_type, owner=_session_id(),
+                                     content_hash=upload.sha256)
+    finally:
+        upload.close()
+    if not qa_session:
+        return jsonify({"error": "Failed to upload file to processing API."}), 500
+    return jsonify(qa_session.to_dict()), 201
+
+@app.route("/api/qa/sessions/<qa_session_id>/questions", methods=["POST"])
+def ask_qa_question(qa_session_id: str):
+    """Answers one question about the session's score. Body: {"question": "..."}."""
+    if not client:
+        return jsonify({"error": "Gemini client not initialized. Check API Key."}), 503
+    qa_session = qa_service.get(qa_session_id, owner=_session_id())
+    if not qa_session:
+        return jsonify({"error": "Unknown or expired Q&A session."}), 404
+    question = ((request.get_json(silent=True) or {}).get("question") or "").strip()
+    if not question:
+        return jsonify({"error": "No question given."}), 400
+    try:
+        answer = qa_session.ask(question)
+    except Exception as e:
+        print(f"ERROR: Q&A question failed: {e}")
+        return jsonify({"error": "Failed to answer the question."}), 500
+    return jsonify({"answer": answer, **qa_session.to_dict()}), 200
+
+@app.route("/api/qa/sessions/<qa_session_id>", methods=["DELETE"])
+def close_qa_session(qa_session_id: str):
+    """Ends a Q&A session, deleting its cached context and uploaded file."""
+    if not client:
+        return jsonify({"error": "Gemini client not initialized. Check API Key."}), 503
+    if not qa_service.get(qa_session_id, owner=_session_id()):
+        return jsonify({"error": "Unknown or expired Q&A session."}), 404
+    qa_service.close(qa_session_id)
+    return "", 204
 
 @app.route("/api/regenerate", methods=["POST"])
 def regenerate_visual():
@@ -120,40 +409,70 @@ def regenerate_visual():
     Generates a new, random visualization using the previously analyzed music data.
     This hits only the Visualization Generator Service (AI Service 2).
     """
-    global last_prompt_name
-    
     if not client:
         return jsonify({"error": "Gemini client not initialized. Check API Key."}), 503
         
-    music_features_dict = music_data_store.get('current_score')
-    if not music_features_dict:
+    session_id = _session_id()
+    session_state = session_store.get(session_id)
+    if not session_state:
         return jsonify({"error": "No music data found. Please upload a file first."}), 400
 
-    music_features_raw_string = json.dumps(music_features_dict)
-    
-    # Logic to ensure the *new* prompt is different from the *last* one
-    all_prompts = GraphicScorePrompts.get_prompt_list()
-    available_prompts = [p for p in all_prompts if p[0] != last_prompt_name]
-    
-    # Pick a prompt
-    prompt_to_use = random.choice(available_prompts) if available_prompts else random.choice(all_prompts)
-
-    # Visualization Generation (AI Service 2)
-    result = generator.generate_visualization(
-        music_features_dict, 
-        music_features_raw_string, 
-        prompt_to_use=prompt_to_use
-    )
+    music_features = MusicFeatures.from_dict(session_state["features"])
+    last_prompt_name = session_state.get("last_prompt_name")
+
+    # Serve a style prefetched in the background if one is ready, otherwise generate on demand
+    result = prefetcher.take(session_id, session_state.get("score_id", ""), last_prompt_name)
+    if not result:
+        # Visualization Generation (AI Service 2)
+        result = generator.generate_visualization(
+            music_features, 
+            json.dumps(prompt_features(music_features)), 
+            prompt_to_use=_pick_regenerate_prompt(last_prompt_name)
+        )
 
     if result.get("status") != 200:
         return jsonify({"error": result.get("error")}), result.get("status")
 
-    last_prompt_name = result.get("prompt_name")
+    session_store.update(session_id, last_prompt_name=result.get("prompt_name"))
     result["disclaimer"] = CONSISTENCY_DISCLAIMER
     return jsonify(result), 200
 
-if __name__ == '__main__':
-    if not os.path.exists(UPLOAD_FOLDER):
-        os.makedirs(UPLOAD_FOLDER)
-    # The application will run on port 5000 inside the dev container
-    app.run(host='0.0.0.0', port=5000, debug=True)
+@app.route("/api/regenerate/stream", methods=["POST"])
+def regenerate_visual_stream():
+    """
+    Streaming variant of /api/regenerate: the same events as /api/jobs/<id>/events,
+    so the narration appears word by word while the image is still rendering.
+    A prefetched style is replayed from its stored result.
+    """
+    if not client:
+        return jsonify({"error": "Gemini client not initialized. Check API Key."}), 503
+
+    # Resolved before streaming starts; the request context is not available to every yield
+    session_id = _session_id()
+    session_state = session_store.get(session_id)
+    if not session_state:
+        return jsonify({"error": "No music data found. Please upload a file first."}), 400
+
+    last_prompt_name = session_state.get("last_prompt_name")
+    result = prefetcher.take(session_id, session_state.get("score_id", ""), last_prompt_name)
+    if result:
+        source = generator.result_events(result)
+    else:
+        music_features = MusicFeatures.from_dict(session_state["features"])
+        source = generator.stream_visualization(
+            music_features,
+            json.dumps(prompt_features(music_features)),
+            prompt_to_use=_pick_regenerate_prompt(last_prompt_name),
+        )
+
+    def events():
+        for event_id, (event, data) in enumerate(source):
+            if event == "done":
+                session_store.update(session_id, last_prompt_name=data.get("prompt_name"))
+                data = {**data, "disclaimer": CONSISTENCY_DISCLAIMER}
+            yield _sse(event, data, event_id)
+
+    return _sse_response(events())
+
+# Not runnable as a script: start the dev server with `python -m backend` (backend/__main__.py),
+# or serve backend.app:app from a WSGI server
@@ -0,0 +1,369 @@
+import json
+import re
+from dataclasses import asdict, dataclass, field, fields
+from typing import Any, Dict, List, Optional, Tuple
+
+# Bump whenever a field changes, so features cached under the old shape are not reused
+SCHEMA_VERSION = 4
+
+
+@dataclass(slots=True)
+class Tempo:
+    bpm: str = ""
+    description: str = ""
+    term: str = ""
+    note_value: str = ""  # The note the bpm counts, e.g. 'dotted quarter note' in 6/8
+
+
+@dataclass(slots=True)
+class Dynamics:
+    level: str = ""
+    description: str = ""
+    articulation: str = ""
+
+
+@dataclass(slots=True)
+class Section:
+    section_id: str = ""
+    feature_focus: str = ""
+    description: str = ""
+    pitch_range_midinotes: Optional[str] = None
+    pattern_notation: Optional[str] = None
+
+
+@dataclass(slots=True)
+class Motif:
+    type: str = ""
+    description: str = ""
+    duration: str = ""
+    name: str = ""
+
+
+@dataclass(slots=True)
+class Change:
+    """A tempo or dynamics marking after the opening, e.g. measure=23, description='ritardando'."""
+    measure: int = 0
+    description: str = ""
+    level: Optional[str] = None
+
+
+@dataclass(slots=True)
+class Note:
+    """
+    One note of the opening passage, e.g. hand='RH', measure=1, beat=1.0, pitch='F#4', duration='dotted quarter note'.
+    `beat` is where the note starts in its measure, counted from 1 in the main beat (see note_array.beat_length):
+    quarter notes in 4/4, so 2.5 is the eighth after beat 2, and dotted quarters in 6/8, so 2 starts the bar's second half.
+    """
+    hand: str = ""
+    measure: int = 0
+    beat: float = 0.0
+    pitch: str = ""
+    duration: str = ""
+    dynamic: Optional[str] = None
+
+
+@dataclass(slots=True)
+class MusicFeatures:
+    """
+    Structured analysis of one score, as returned by MusicAnalyzer.
+
+    The class doubles as the `response_schema` of the analysis call, so the
+    model is constrained to this shape. Anything coming from outside (model
+    output, cache, session) goes through `from_dict` once; code downstream can
+    then rely on every field being present and typed.
+
+    `beat_unit` is set only by the symbolic parser, whose sampled beats are
+    exact written positions of that many quarter notes each. It stays None
+    for model analyses, which are asked for the same beats but may just count
+    notes.
+    """
+    title: str = ""
+    composer: str = ""
+    key_signature: str = ""
+    time_signature: str = ""
+    initial_tempo: Tempo = field(default_factory=Tempo)
+    initial_dynamics: Dynamics = field(default_factory=Dynamics)
+    overall_mood: str = ""
+    structural_analysis: List[Section] = field(default_factory=list)
+    repeating_motifs: List[Motif] = field(default_factory=list)
+    tempo_changes: List[Change] = field(default_factory=list)
+    dynamic_changes: List[Change] = field(default_factory=list)
+    notes_sample: List[Note] = field(default_factory=list)
+    notes_overview: str = ""
+    beat_unit: Optional[float] = None
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "MusicFeatures":
+        """
+        Builds features from loosely shaped JSON: missing keys are defaulted and
+        scalars coerced to str. Older spellings ('bpm_approx', 'motif_name',
+        'measures') are read into their fields; anything else unknown is
+        dropped with a warning.
+        """
+        if not isinstance(data, dict):
+            raise ValueError(f"Expected a JSON object, got {type(data).__name__}")
+        data = {**data, "initial_tempo": _renamed(data.get("initial_tempo"), {"bpm_approx": "bpm"}),
+                "repeating_motifs": [_renamed(item, {"motif_name": "name", "measures": "duration"})
+                                     for item in _items(data.get("repeating_motifs"))]}
+        _warn_dropped(cls, data)
+        return cls(
+            title=_text(data.get("title")),
+            composer=_text(data.get("composer")),
+            key_signature=_text(data.get("key_signature")),
+            time_signature=_text(data.get("time_signature")),
+            initial_tempo=_record(Tempo, data.get("initial_tempo")),
+            initial_dynamics=_record(Dynamics, data.get("initial_dynamics")),
+            overall_mood=_text(data.get("overall_mood")),
+            structural_analysis=[_record(Section, item) for item in _items(data.get("structural_analysis"))],
+            repeating_motifs=[_record(Motif, item) for item in _items(data.get("repeating_motifs"))],
+            tempo_changes=[_record(Change, item) for item in _items(data.get("tempo_changes"))],
+            dynamic_changes=[_record(Change, item) for item in _items(data.get("dynamic_changes"))],
+            notes_sample=[_record(Note, item) for item in _items(data.get("notes_sample"))],
+            notes_overview=_text(data.get("notes_overview")),
+            beat_unit=_number(data.get("beat_unit"), float) or None,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    def narration_summary(self) -> Dict[str, str]:
+        """The handful of fields the narration prompts use, with beginner-friendly fallbacks."""
+        return {
+            "title": self.title or "The Music",
+            "key_mood": (self.key_signature or "Neutral").split(" ")[0],
+            "time_signature": (self.time_signature or "N/A").split(" ")[0],
+            "initial_tempo_desc": self.initial_tempo.description or "A moderate pace",
+            "initial_tempo_term": (self.initial_tempo.term or "Moderato").strip("()"),
+            "initial_dynamics_desc": self.initial_dynamics.description or "Quiet",
+            "initial_dynamics_term": self.initial_dynamics.level or "p",
+            "initial_articulation_term": self.initial_dynamics.articulation or "smoothly",
+            "rhythm_highlight": (self.repeating_motifs[0].description if self.repeating_motifs else "")
+                                or "A consistent, simple beat.",
+        }
+
+
+def merge_features(parts: List[Tuple[int, int, MusicFeatures]]) -> MusicFeatures:
+    """
+    Combines the analyses of consecutive page chunks, given as (first_page,
+    last_page, features), into one document. The result depends only on the
+    inputs, never on the order the chunks finished in:
+
+    - Identity fields (title, composer, key, time signature), the initial
+      tempo, dynamics and mood, and the notes overview come from the earliest
+      chunk that has them.
+    - Sections are concatenated in page order, each id tagged with its pages,
+      so the 'A' of one chunk is not mistaken for the 'A' of another.
+    - A chunk whose opening tempo or dynamics differ from the previous chunk's
+      adds a 'Tempo' or 'Dynamics' section marking the change.
+    - Motifs are unioned in page order, dropping exact repeats; tempo and
+      dynamics changes and sampled notes are concatenated in page order.
+    """
+    parts = sorted(parts, key=lambda part: part[0])
+    if not parts:
+        return MusicFeatures()
+
+    def first(getter) -> Any:
+        return next((value for value in (getter(features) for _, _, features in parts) if value), None)
+
+    merged = MusicFeatures(
+        title=first(lambda f: f.title) or "",
+        composer=first(lambda f: f.composer) or "",
+        key_signature=first(lambda f: f.key_signature) or "",
+        time_signature=first(lambda f: f.time_signature) or "",
+        initial_tempo=first(lambda f: f.initial_tempo if any(asdict(f.initial_tempo).values()) else None) or Tempo(),
+        initial_dynamics=first(lambda f: f.initial_dynamics if any(asdict(f.initial_dynamics).values()) else None) or Dynamics(),
+        overall_mood=first(lambda f: f.overall_mood) or "",
+        notes_overview=first(lambda f: f.notes_overview) or "",
+    )
+
+    previous: Optional[MusicFeatures] = None
+    seen_motifs = set()
+    for first_page, last_page, features in parts:
+        pages = f"pp. {first_page}-{last_page}" if first_page != last_page else f"p. {first_page}"
+        if previous:
+            tempo, last_tempo = features.initial_tempo, previous.initial_tempo
+            if tempo.term and tempo.term.lower() != last_tempo.term.lower():
+                merged.structural_analysis.append(Section(
+                    section_id=f"Tempo ({pages})", feature_focus="Tempo",
+                    description=f"The pace changes to {_labelled(tempo.description, tempo.term)}.",
+                ))
+            dynamics, last_dynamics = features.initial_dynamics, previous.initial_dynamics
+            if dynamics.level and dynamics.level.lower() != last_dynamics.level.lower():
+                merged.structural_analysis.append(Section(
+                    section_id=f"Dynamics ({pages})", feature_focus="Dynamics",
+                    description=f"The volume changes to {_labelled(dynamics.description, dynamics.level)}.",
+                ))
+        for section in features.structural_analysis:
+            merged.structural_analysis.append(Section(
+                section_id=f"{section.section_id or '?'} ({pages})",
+                feature_focus=section.feature_focus,
+                description=section.description,
+                pitch_range_midinotes=section.pitch_range_midinotes,
+                pattern_notation=section.pattern_notation,
+            ))
+        for motif in features.repeating_motifs:
+            signature = (motif.type.lower(), " ".join(motif.description.lower().split()))
+            if signature not in seen_motifs:
+                seen_motifs.add(signature)
+                merged.repeating_motifs.append(motif)
+        merged.tempo_changes.extend(features.tempo_changes)
+        merged.dynamic_changes.extend(features.dynamic_changes)
+        merged.notes_sample.extend(features.notes_sample)
+        previous = features
+    return merged
+
+
+def _renamed(value: Any, aliases: Dict[str, str]) -> Any:
+    """A copy of the record with old key names moved to their field, unless the field is already set."""
+    if not isinstance(value, dict):
+        return value
+    value = dict(value)
+    for old, new in aliases.items():
+        if old in value:
+            old_value = value.pop(old)
+            if value.get(new) in (None, ""):
+                value[new] = old_value
+    return value
+
+
+# Nested records of MusicFeatures, to report unknown keys inside them too
+_RECORD_FIELDS = {"initial_tempo": Tempo, "initial_dynamics": Dynamics, "structural_analysis": Section,
+                  "repeating_motifs": Motif, "tempo_changes": Change, "dynamic_changes": Change, "notes_sample": Note}
+
+
+def _warn_dropped(cls: type, data: Dict[str, Any]) -> None:
+    """Prints one WARNING naming every key from_dict has no field for, so lost data doesn't go unnoticed."""
+    known = {f.name for f in fields(cls)}
+    dropped = set(data) - known
+    for name, record in _RECORD_FIELDS.items():
+        record_known = {f.name for f in fields(record)}
+        for item in _items(data.get(name)):
+            dropped.update(f"{name}.{key}" for key in set(item) - record_known)
+    if dropped:
+        print(f"WARNING: Ignoring analysis fields MusicFeatures has no place for: {', '.join(sorted(dropped))}")
+
+
+def _labelled(description: str, term: str) -> str:
+    """'gently fast (Allegretto)', in the beginner-plus-term style of the narrations."""
+    return f"{description} ({term})" if description and description != term else term
+
+
+def _text(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return str(value).strip()
+
+
+def _items(value: Any) -> List[Dict[str, Any]]:
+    if isinstance(value, dict):
+        value = [value]
+    return [item for item in value if isinstance(item, dict)] if isinstance(value, list) else []
+
+
+def _number(value: Any, kind: type) -> Any:
+    """Coerces '3', 3.0 or 'm. 3' to a number of the field's type; 0 when nothing numeric is there."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return kind(value)
+    match = re.search(r"-?\d+(?:\.\d+)?", _text(value))
+    return kind(float(match.group())) if match else kind(0)
+
+
+def _record(cls: type, value: Any) -> Any:
+    value = value if isinstance(value, dict) else {}
+    kwargs = {}
+    for f in fields(cls):
+        raw = value.get(f.name)
+        if raw is None and f.default is None:
+            kwargs[f.name] = None
+        elif f.type in (int, float):
+            kwargs[f.name] = _number(raw, f.type)
+        else:
+            kwargs[f.name] = _text(raw)
+    return cls(**kwargs)
+
+
+def repair_json(text: str) -> Any:
+    """
+    Best-effort parse of almost-JSON model output: strips markdown fences and
+    surrounding prose, smart quotes used as delimiters, trailing commas and
+    comments, and closes strings/brackets left open by a truncated response.
+    Text inside string literals is left as it is. Raises ValueError if nothing
+    usable remains.
+    """
+    text = text.strip()
+    fenced = re.search(r"```(?:json)?\s*(.*?)(?:```|$)", text, re.S)
+    if fenced:
+        text = fenced.group(1)
+    start = text.find("{")
+    if start < 0:
+        raise ValueError("No JSON object found in model output.")
+    text = text[start:]
+
+    # Walk the text once, dropping // comments and trailing commas, turning smart quotes
+    # used as delimiters into '"' and tracking open strings and brackets. String contents
+    # (including smart quotes inside them) are copied unchanged.
+    out, stack, in_string, escaped, i = [], [], False, False, 0
+    closing = '"'
+    while i < len(text):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == closing or (closing != '"' and ch in '"“”'):
+                in_string = False
+                ch = '"'
+            out.append(ch)
+        elif ch in '"“”':
+            in_string = True
+            closing = '"' if ch == '"' else "”"
+            out.append('"')
+        elif ch == "/" and text[i:i + 2] == "//":
+            while i < len(text) and text[i] != "\n":
+                i += 1
+            continue
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+            out.append(ch)
+        elif ch in "}]":
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            if stack:
+                stack.pop()
+            out.append(ch)
+            if not stack:
+                break  # End of the top-level object; ignore trailing prose
+        else:
+            out.append(ch)
+        i += 1
+
+    repaired = "".join(out)
+    if in_string:
+        repaired += '"'
+    if stack and stack[-1] == "}":
+        # A key cut off before its value: drop it
+        repaired = re.sub(r'([{,])\s*"[^"]*"\s*$', r"\1", repaired)
+    repaired = re.sub(r",\s*$", "", repaired.rstrip())
+    repaired = re.sub(r'[:]\s*$', ': null', repaired)
+    repaired += "".join(reversed(stack))
+    try:
+        return json.loads(repaired)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Model output could not be repaired into JSON: {e}") from e
+
+
+def parse_music_features(text: str) -> MusicFeatures:
+    """Parses analysis output, trying strict JSON first and the repair parser only if that fails."""
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        data = repair_json(text)
+    features = MusicFeatures.from_dict(data)
+    # Only the symbolic parser can vouch for exact beat positions
+    features.beat_unit = None
+    return features
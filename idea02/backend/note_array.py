@@ -0,0 +1,314 @@
+import re
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .music_features import MusicFeatures, Note
+
+# One row per note; onset and duration are in quarter-note beats from the start of the sample
+NOTE_DTYPE = np.dtype([
+    ("onset", "f8"),
+    ("duration", "f8"),
+    ("midi", "i2"),
+    ("velocity", "f4"),
+    ("voice", "i2"),
+    ("measure", "i4"),
+])
+
+# Dynamic marking -> relative loudness in 0..1 (pp = 20%, ff = 100%, as in the style prompts)
+DYNAMIC_LEVELS = {"ppp": 0.1, "pp": 0.2, "p": 0.35, "mp": 0.5, "mf": 0.65, "f": 0.8, "ff": 1.0, "fff": 1.0}
+
+# Note value -> length in quarter-note beats
+NOTE_VALUES = {
+    "whole": 4.0, "half": 2.0, "quarter": 1.0, "eighth": 0.5, "sixteenth": 0.25,
+    "thirty-second": 0.125, "32nd": 0.125, "16th": 0.25, "8th": 0.5,
+}
+
+_PITCH_PATTERN = re.compile(r"^\s*([A-Ga-g])\s*(#|b|♯|♭|x|bb)?\s*(-?\d+)\s*$")
+_SEMITONES = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11}
+_ACCIDENTALS = {None: 0, "#": 1, "♯": 1, "x": 2, "b": -1, "♭": -1, "bb": -2}
+_PITCH_NAMES = ["C", "C#", "D", "Eb", "E", "F", "F#", "G", "Ab", "A", "Bb", "B"]
+
+# Krumhansl-Kessler key profiles: how strongly each scale degree (from the tonic) implies the key
+MAJOR_PROFILE = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+MINOR_PROFILE = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+
+
+def _key_profiles() -> np.ndarray:
+    """24 x 12 matrix: rows 0-11 are the major keys on C..B, rows 12-23 the minor keys, each z-scored."""
+    degrees = (np.arange(12)[None, :] - np.arange(12)[:, None]) % 12
+    profiles = np.vstack([MAJOR_PROFILE[degrees], MINOR_PROFILE[degrees]])
+    return (profiles - profiles.mean(axis=1, keepdims=True)) / profiles.std(axis=1, keepdims=True)
+
+
+_KEY_PROFILES = _key_profiles()
+
+
+@lru_cache(maxsize=512)
+def parse_pitch(name: str) -> Optional[int]:
+    """'C4' -> 60, 'F#3' -> 54, 'Bb2' -> 46; a bare MIDI number passes through. None if unreadable."""
+    name = (name or "").strip()
+    if name.isdigit():
+        return int(name)
+    match = _PITCH_PATTERN.match(name)
+    if not match:
+        return None
+    letter, accidental, octave = match.groups()
+    return (int(octave) + 1) * 12 + _SEMITONES[letter.upper()] + _ACCIDENTALS[accidental]
+
+
+@lru_cache(maxsize=512)
+def duration_beats(text: str) -> float:
+    """'dotted quarter note' -> 1.5, 'eighth triplet' -> 1/3, '2' -> 2.0; unknown values count as one beat."""
+    text = (text or "").lower()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    beats = next((value for name, value in NOTE_VALUES.items() if name in text), 1.0)
+    if "double dotted" in text or "double-dotted" in text:
+        beats *= 1.75
+    elif "dotted" in text:
+        beats *= 1.5
+    if "triplet" in text:
+        beats *= 2 / 3
+    return beats
+
+
+def pitch_name(midi: int) -> str:
+    """60 -> 'C4'."""
+    return f"{_PITCH_NAMES[int(midi) % 12]}{int(midi) // 12 - 1}"
+
+
+def measure_beats(time_signature: str) -> Optional[float]:
+    """'6/8 (...)' -> 3.0 quarter-note beats per measure; None if there is no fraction."""
+    match = re.search(r"(\d+)\s*/\s*(\d+)", time_signature or "")
+    if not match or int(match.group(2)) == 0:
+        return None
+    return int(match.group(1)) * 4 / int(match.group(2))
+
+
+def beat_length(time_signature: str) -> Optional[float]:
+    """
+    '6/8' -> 1.5: the main (counted) beat in quarter notes, which is what
+    Note.beat counts. Compound meters (6/8, 9/8, 12/8) are counted in dotted
+    beats, all others in the lower number. None if there is no fraction.
+    """
+    match = re.search(r"(\d+)\s*/\s*(\d+)", time_signature or "")
+    if not match or int(match.group(2)) == 0:
+        return None
+    beats, beat_type = int(match.group(1)), int(match.group(2))
+    unit = 4 / beat_type
+    return unit * 3 if beat_type >= 8 and beats > 3 and beats % 3 == 0 else unit
+
+
+@dataclass(slots=True)
+class KeyEstimate:
+    """Best-matching key for the pitch-class distribution, with its correlation (-1..1) to the key profile."""
+    tonic: str
+    mode: str
+    correlation: float
+
+    @property
+    def name(self) -> str:
+        return f"{self.tonic} {self.mode}"
+
+
+@dataclass(slots=True)
+class NoteArray:
+    """Sampled notes as a structured array sorted by onset, plus the voice (hand) names its `voice` column indexes."""
+    notes: np.ndarray
+    voices: List[str]
+    measure_length: float
+
+    def __len__(self) -> int:
+        return len(self.notes)
+
+    @property
+    def total_beats(self) -> float:
+        return float(np.max(self.notes["onset"] + self.notes["duration"])) if len(self.notes) else 0.0
+
+    def measure_index(self) -> np.ndarray:
+        """0-based measure of each note, counted from the first sampled measure."""
+        return (self.notes["measure"] - self.notes["measure"].min()).astype(np.intp)
+
+    def contour(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(onsets, pitches) of the top line: the highest note sounding at each distinct onset."""
+        onsets, starts = np.unique(self.notes["onset"], return_index=True)
+        return onsets, np.maximum.reduceat(self.notes["midi"], starts) if len(starts) else self.notes["midi"][:0]
+
+    def density(self) -> np.ndarray:
+        """Notes started per beat in each measure (empty measures are 0)."""
+        return np.bincount(self.measure_index()) / self.measure_length
+
+    def register(self) -> Dict[str, int]:
+        """Lowest, median and highest MIDI pitch, and the span in semitones."""
+        midi = self.notes["midi"]
+        low, high = int(midi.min()), int(midi.max())
+        return {"low": low, "median": int(np.median(midi)), "high": high, "span": high - low}
+
+    def dynamics_curve(self) -> np.ndarray:
+        """Mean relative loudness (0..1) of each measure; measures without notes carry the previous value."""
+        index = self.measure_index()
+        counts = np.bincount(index)
+        sums = np.bincount(index, weights=self.notes["velocity"])
+        curve = np.divide(sums, counts, out=np.full(len(counts), np.nan), where=counts > 0)
+        filled = np.where(counts > 0, np.arange(len(counts)), 0)
+        return curve[np.maximum.accumulate(filled)]
+
+    def estimate_key(self) -> Optional[KeyEstimate]:
+        """
+        Krumhansl-Schmuckler key finding: correlates the duration-weighted
+        pitch-class histogram with the 24 rotated major/minor profiles and
+        picks the best match. None when fewer than two pitch classes occur.
+        """
+        histogram = np.bincount(self.notes["midi"] % 12, weights=self.notes["duration"], minlength=12)
+        if np.count_nonzero(histogram) < 2:
+            return None
+        scores = _KEY_PROFILES @ ((histogram - histogram.mean()) / histogram.std()) / 12
+        best = int(np.argmax(scores))
+        return KeyEstimate(_PITCH_NAMES[best % 12], "major" if best < 12 else "minor", round(float(scores[best]), 3))
+
+
+@dataclass(slots=True)
+class NoteStatistics:
+    """Quantitative summary of the sampled notes, for prompts and narration. Measures are score measure numbers."""
+    estimated_key: Optional[str]
+    key_confidence: Optional[float]
+    lowest_note: str
+    highest_note: str
+    melody_direction: str
+    melody_peak_measure: int
+    notes_per_beat: List[float]
+    busiest_measure: int
+    loudness: List[float]
+    loudest_measure: int
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    def describe(self) -> str:
+        """One plain sentence for the narration prompt."""
+        key = f"Sounds like {self.estimated_key}. " if self.estimated_key else ""
+        busiest = (f"busiest in measure {self.busiest_measure}" if max(self.notes_per_beat) - min(self.notes_per_beat) > 0.01
+                   else "an even flow of notes")
+        loudest = (f"loudest in measure {self.loudest_measure}" if max(self.loudness) - min(self.loudness) > 0.01
+                   else "a steady volume")
+        return (f"{key}Melody spans {self.lowest_note}-{self.highest_note}, {self.melody_direction} and peaking in measure "
+                f"{self.melody_peak_measure}; {busiest}, {loudest}.")
+
+
+def note_statistics(features: MusicFeatures) -> Optional[NoteStatistics]:
+    """Contour, density, register, loudness and key estimate of features.notes_sample; None without usable notes."""
+    data = note_array(features.notes_sample, features.time_signature, features.initial_dynamics.level or "mf",
+                      features.beat_unit)
+    if len(data) < 2:
+        return None
+    first_measure = int(data.notes["measure"].min())
+    onsets, melody = data.contour()
+    steps = np.diff(melody)
+    # A net move larger than the typical step (and at least a whole tone) is a clear rise or fall
+    net = int(melody[-1]) - int(melody[0])
+    if abs(net) > max(2.0, float(np.abs(steps).mean()) if len(steps) else 0.0):
+        direction = "rising overall" if net > 0 else "falling overall"
+    else:
+        direction = "returning near where it started"
+    peak_onset = onsets[int(np.argmax(melody))]
+    peak_measure = int(data.notes["measure"][np.searchsorted(data.notes["onset"], peak_onset)])
+
+    register = data.register()
+    density = data.density()
+    loudness = data.dynamics_curve()
+    key = data.estimate_key()
+    return NoteStatistics(
+        estimated_key=key.name if key else None,
+        key_confidence=key.correlation if key else None,
+        lowest_note=pitch_name(register["low"]),
+        highest_note=pitch_name(register["high"]),
+        melody_direction=direction,
+        melody_peak_measure=peak_measure,
+        notes_per_beat=np.round(density, 2).tolist(),
+        busiest_measure=first_measure + int(np.argmax(density)),
+        loudness=np.round(loudness, 2).tolist(),
+        loudest_measure=first_measure + int(np.argmax(loudness)),
+    )
+
+
+def prompt_features(features: MusicFeatures) -> Dict[str, Any]:
+    """features.to_dict() plus a 'note_statistics' entry when notes were sampled, for injecting into prompts."""
+    data = features.to_dict()
+    statistics = note_statistics(features)
+    if statistics:
+        data["note_statistics"] = statistics.to_dict()
+    return data
+
+
+def note_array(notes: List[Note], time_signature: str = "", default_dynamic: str = "mf",
+               beat_unit: Optional[float] = None) -> NoteArray:
+    """
+    Converts sampled notes into a NoteArray. Onsets follow each hand through its
+    measure: notes sharing (hand, measure, beat) form a chord and start together,
+    and each new beat starts where the previous beat's longest note ended. The
+    measure length comes from the time signature, or from the fullest measure.
+    Notes with unreadable pitches are dropped.
+
+    `beat_unit` (quarter notes per beat) is only given when the beats are known
+    to be exact written positions, as the symbolic parser writes them. Each
+    note then starts at (beat - 1) x beat_unit, so rests and tuplets keep their
+    place, wherever a hand's beats in a measure all fall inside it. Model
+    output has no such guarantee and keeps the running sum.
+    """
+    voices: Dict[str, int] = {}
+    rows = []
+    for note in notes:
+        midi = parse_pitch(note.pitch)
+        if midi is None:
+            continue
+        voice = voices.setdefault(note.hand or "voice", len(voices))
+        level = DYNAMIC_LEVELS.get((note.dynamic or default_dynamic).strip(), DYNAMIC_LEVELS["mf"])
+        rows.append((voice, note.measure, note.beat, midi, duration_beats(note.duration), level))
+    if not rows:
+        return NoteArray(np.zeros(0, dtype=NOTE_DTYPE), list(voices), measure_beats(time_signature) or 4.0)
+
+    columns = np.array(rows, dtype=np.float64)
+    voice, measure, beat, midi, duration, level = columns.T
+
+    # Each (voice, measure, beat) chord starts where the chords before it in its measure end:
+    # an exclusive running sum of chord lengths (longest note) restarted at every (voice, measure)
+    order = np.lexsort((beat, measure, voice))
+    keys = columns[order][:, :3]
+    new_chord = np.r_[True, np.any(keys[1:] != keys[:-1], axis=1)]
+    chord_starts = np.flatnonzero(new_chord)
+    chord_length = np.maximum.reduceat(duration[order], chord_starts)
+    chord_keys = keys[chord_starts]
+    new_measure = np.r_[True, np.any(chord_keys[1:, :2] != chord_keys[:-1, :2], axis=1)]
+    ends = np.cumsum(chord_length)
+    measure_start = np.maximum.accumulate(np.where(new_measure, ends - chord_length, 0))
+    chord_offset = np.round(ends - chord_length - measure_start, 9)  # Drop the running sum's rounding noise
+    offsets = np.empty(len(rows))
+    offsets[order] = chord_offset[np.cumsum(new_chord) - 1]
+
+    meter_length = measure_beats(time_signature)
+    if meter_length and beat_unit:
+        # Written positions win for every (voice, measure) whose beats all fall inside the measure
+        positions = np.round((beat - 1) * beat_unit, 9)
+        fits = (beat >= 1) & (positions < meter_length - 1e-9)
+        new_group = np.r_[True, np.any(keys[1:, :2] != keys[:-1, :2], axis=1)]
+        group_fits = np.logical_and.reduceat(fits[order], np.flatnonzero(new_group))
+        use_position = np.empty(len(rows), dtype=bool)
+        use_position[order] = group_fits[np.cumsum(new_group) - 1]
+        offsets = np.where(use_position, positions, offsets)
+
+    first_measure = measure.min()
+    fill = np.maximum.reduceat(chord_offset + chord_length, np.flatnonzero(new_measure))
+    length = meter_length or float(fill.max())
+    array = np.zeros(len(rows), dtype=NOTE_DTYPE)
+    array["onset"] = (measure - first_measure) * length + offsets
+    array["duration"] = duration
+    array["midi"] = midi
+    array["velocity"] = level
+    array["voice"] = voice
+    array["measure"] = measure
+    return NoteArray(array[np.lexsort((array["midi"], array["voice"], array["onset"]))], list(voices), length)
@@ -0,0 +1,166 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .music_features import MusicFeatures
+from .note_array import NoteArray, note_array, note_statistics, pitch_name
+
+# Field groups the compact encoding can contain; the score header (key, meter, tempo) is always sent
+PITCH, DURATION, DYNAMICS, ARTICULATION, CONTOUR, DENSITY, SECTIONS, MOTIFS, MOOD = (
+    "pitch", "duration", "dynamics", "articulation", "contour", "density", "sections", "motifs", "mood"
+)
+ALL_FIELDS = (PITCH, DURATION, DYNAMICS, ARTICULATION, CONTOUR, DENSITY, SECTIONS, MOTIFS, MOOD)
+
+# The data each style's mapping rules actually refer to (styles of both prompt sets); others get everything
+STYLE_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "chromatic_landscape": (PITCH, DURATION, DYNAMICS, ARTICULATION, MOOD),
+    "constellation_score": (PITCH, DURATION, DYNAMICS),
+    "watercolor_flow_prompt": (PITCH, DURATION, DYNAMICS, CONTOUR, MOOD),
+    "panoramic_waveform_prompt": (PITCH, DURATION, DYNAMICS, ARTICULATION),
+    "light_painting_dynamic_score": (PITCH, DURATION, DYNAMICS, CONTOUR),
+    "abstract_3d_ribbon_score": (PITCH, DYNAMICS, DENSITY),
+    "data_cityscape": (PITCH, DENSITY),
+    "geometric_tapestry": (DENSITY, SECTIONS, MOOD),
+    "fractal_growth_score": (DYNAMICS, SECTIONS),
+    "bio_luminescent_path": (DYNAMICS, CONTOUR),
+    "layered_graphic_score": (PITCH, DURATION, ARTICULATION),
+    "solar_chronometer_score_strokes": (PITCH, DURATION, DYNAMICS, CONTOUR),
+    "geometric_micro_notation_score": (PITCH, DURATION, DYNAMICS, DENSITY),
+    "mandelbrot_music_prompt": (DYNAMICS, DENSITY, SECTIONS, MOTIFS, MOOD),
+}
+
+MAX_DESCRIPTION_CHARS = 80
+
+LEGEND = ("Notes per voice, bars split by '|', chords joined by '+', 'x*n' = x repeated n times, '(bar)*n' = bar repeated; "
+          "beats are quarter notes; loudness is 0 (silent) to 9 (ff) per measure.")
+
+
+def _run_length(tokens: Sequence[str]) -> str:
+    """['G4', 'G4', 'A4'] -> 'G4*2 A4'."""
+    out: List[str] = []
+    previous, count = None, 0
+    for token in list(tokens) + [None]:
+        if token == previous:
+            count += 1
+            continue
+        if previous is not None:
+            out.append(previous if count == 1 else f"{previous}*{count}")
+        previous, count = token, 1
+    return " ".join(out)
+
+
+def _bars(bars: List[List[str]]) -> str:
+    """Run-length encodes each bar, then runs of identical bars: '(G4*2)*3 | A4 B4'."""
+    encoded = [_run_length(bar) for bar in bars]
+    out: List[str] = []
+    index = 0
+    while index < len(encoded):
+        run = 1
+        while index + run < len(encoded) and encoded[index + run] == encoded[index]:
+            run += 1
+        out.append(encoded[index] if run == 1 else f"({encoded[index]})*{run}")
+        index += run
+    return " | ".join(out)
+
+
+def _beats(value: float) -> str:
+    """1.5 -> '1.5', 0.5 -> '.5', 0.333.. -> '.33'."""
+    return f"{round(value, 2):g}".lstrip("0") or "0"
+
+
+def _digits(values: np.ndarray, top: float) -> str:
+    """Quantizes 0..top to single digits 0-9 and run-length encodes them."""
+    levels = np.clip(np.rint(np.nan_to_num(values) / top * 9), 0, 9).astype(int)
+    return _run_length([str(level) for level in levels])
+
+
+def _voice_streams(data: NoteArray, fields: Tuple[str, ...]) -> List[str]:
+    """Per voice: the chord at each onset as pitches and as beats, bar by bar, each bar run-length encoded."""
+    lines = []
+    notes = data.notes
+    for voice, name in enumerate(data.voices):
+        mine = notes[notes["voice"] == voice]
+        if not len(mine):
+            continue
+        onsets, starts = np.unique(mine["onset"], return_index=True)
+        ends = np.r_[starts[1:], len(mine)]
+        measures = mine["measure"][starts]
+        pitch_bars: Dict[int, List[str]] = {}
+        beat_bars: Dict[int, List[str]] = {}
+        for start, end, measure in zip(starts, ends, measures):
+            chord = mine[start:end]
+            pitch_bars.setdefault(int(measure), []).append("+".join(pitch_name(midi) for midi in np.sort(chord["midi"])))
+            beat_bars.setdefault(int(measure), []).append(_beats(float(chord["duration"].max())))
+        if PITCH in fields:
+            lines.append(f"{name} pitch: " + _bars(list(pitch_bars.values())))
+        if DURATION in fields:
+            lines.append(f"{name} beats: " + _bars(list(beat_bars.values())))
+    return lines
+
+
+def _short(text: str) -> str:
+    """'G Major (one sharp: F#)' -> 'G Major'."""
+    return (text or "").split("(")[0].strip() or "?"
+
+
+def _clip(text: str) -> str:
+    text = " ".join((text or "").split())
+    return text if len(text) <= MAX_DESCRIPTION_CHARS else text[:MAX_DESCRIPTION_CHARS].rsplit(" ", 1)[0] + "..."
+
+
+def encode_features(features: MusicFeatures, style: Optional[str] = None) -> str:
+    """
+    Dense, mapping-oriented text for the image prompts, in place of the full
+    features JSON: the score header, then only the field groups the style's
+    mapping rules use (STYLE_FIELDS; every group for unknown styles). Note
+    streams are run-length encoded per bar and loudness is quantized to one
+    digit per measure, so a style usually costs a fraction of the JSON tokens.
+    """
+    fields = STYLE_FIELDS.get(style or "", ALL_FIELDS)
+    tempo = " ".join(part for part in (features.initial_tempo.term, features.initial_tempo.bpm and f"{features.initial_tempo.bpm}bpm") if part)
+    lines = [f"SCORE key={_short(features.key_signature)}; meter={_short(features.time_signature)}; tempo={tempo or '?'}"]
+    if MOOD in fields and features.overall_mood:
+        lines.append(f"MOOD {_clip(features.overall_mood)}")
+    if DYNAMICS in fields or ARTICULATION in fields:
+        opening = " ".join(part for part in (
+            DYNAMICS in fields and features.initial_dynamics.level,
+            ARTICULATION in fields and features.initial_dynamics.articulation,
+        ) if part)
+        if opening:
+            lines.append(f"START {opening}")
+
+    data = note_array(features.notes_sample, features.time_signature, features.initial_dynamics.level or "mf",
+                      features.beat_unit)
+    if len(data):
+        lines.append(f"VOICES {','.join(data.voices)}; {len(data)} notes from measure {int(data.notes['measure'].min())}")
+        lines.extend(_voice_streams(data, fields))
+        if DYNAMICS in fields:
+            lines.append(f"LOUDNESS {_digits(data.dynamics_curve(), 1.0)}")
+        if DENSITY in fields:
+            density = data.density()
+            lines.append(f"DENSITY notes/beat per measure: {_run_length([_beats(value) for value in density])}")
+        if CONTOUR in fields:
+            statistics = note_statistics(features)
+            if statistics:
+                lines.append(f"CONTOUR {statistics.lowest_note}-{statistics.highest_note}, {statistics.melody_direction}, "
+                             f"peak m{statistics.melody_peak_measure}")
+
+    if SECTIONS in fields:
+        for section in features.structural_analysis:
+            lines.append(f"SECTION {section.section_id} [{section.feature_focus}] {_clip(section.description)}")
+    if MOTIFS in fields:
+        for motif in features.repeating_motifs:
+            label = " ".join(part for part in (motif.type, motif.duration and f"({motif.duration})") if part)
+            lines.append(f"MOTIF {label + ': ' if label else ''}{_clip(motif.description)}")
+    if len(data) and (PITCH in fields or DURATION in fields or DYNAMICS in fields):
+        lines.append(LEGEND)
+    return "\n".join(lines)
+
+
+def count_prompt_tokens(client: Any, model: str, prompt: str) -> Optional[int]:
+    """Input tokens for a prompt via client.models.count_tokens; None (and a warning) if the call fails."""
+    try:
+        return client.models.count_tokens(model=model, contents=[prompt]).total_tokens
+    except Exception as e:
+        print(f"WARNING: Could not count prompt tokens: {e}")
+        return None
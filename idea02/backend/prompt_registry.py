@@ -0,0 +1,92 @@
+import hashlib
+import pathlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Tuple
+
+# Marks where the score data goes in every template
+PLACEHOLDER = "JSON_DATA_STRING_FOR_MAPPING"
+TEMPLATE_DIR = pathlib.Path(__file__).with_name("prompt_templates")
+
+
+@dataclass(frozen=True, slots=True)
+class PromptTemplate:
+    """One style's image prompt, pre-split at the data placeholder."""
+    name: str
+    text: str
+    parts: Tuple[str, ...]
+    version: str  # First 12 hex digits of the template's sha256
+
+    def render(self, data: str) -> str:
+        return data.join(self.parts)
+
+
+class PromptRegistry:
+    """
+    The image prompt templates of every style, loaded once from
+    `prompt_templates/<style>.txt` (adding a style is adding a file). Each
+    template is split at its placeholder up front and versioned by content
+    hash, so a cache keyed on the version drops out by itself when a template
+    is edited.
+
+    render() memoizes finished prompts by (template version, data key), where
+    the caller's data key identifies the inserted data (e.g. the features hash
+    and encoding); the most recent `cache_size` prompts are kept.
+    """
+    def __init__(self, directory: pathlib.Path = TEMPLATE_DIR, placeholder: str = PLACEHOLDER, cache_size: int = 256):
+        self.placeholder = placeholder
+        self.cache_size = cache_size
+        self._templates: Dict[str, PromptTemplate] = {}
+        for path in sorted(directory.glob("*.txt")):
+            text = path.read_text(encoding="utf-8").strip()
+            if placeholder not in text:
+                print(f"WARNING: Prompt template {path.name} has no {placeholder} placeholder; the score data will be appended.")
+                text = f"{text}\nRefer {placeholder}."
+            self._templates[path.stem] = PromptTemplate(
+                name=path.stem,
+                text=text,
+                parts=tuple(text.split(placeholder)),
+                version=hashlib.sha256(text.encode("utf-8")).hexdigest()[:12],
+            )
+        self._prompt_list = tuple((template.name, template.text) for template in self._templates.values())
+        # Version of the registry as a whole, for caches spanning all styles
+        self.version = hashlib.sha256("".join(t.version for t in self._templates.values()).encode("utf-8")).hexdigest()[:12]
+        self._rendered: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._templates
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+    def names(self) -> List[str]:
+        return list(self._templates)
+
+    def get(self, name: str) -> PromptTemplate:
+        """Raises KeyError for unknown styles."""
+        return self._templates[name]
+
+    def prompt_list(self) -> List[Tuple[str, str]]:
+        """(name, template text) pairs in name order, with the placeholder in place."""
+        return list(self._prompt_list)
+
+    def render(self, name: str, data_key: str, data: Callable[[], str]) -> str:
+        """The style's prompt with data() inserted; data() only runs when (version, data_key) isn't cached."""
+        template = self._templates[name]
+        key = (template.version, data_key)
+        with self._lock:
+            if key in self._rendered:
+                self._rendered.move_to_end(key)
+                return self._rendered[key]
+        prompt = template.render(data())
+        with self._lock:
+            self._rendered[key] = prompt
+            while len(self._rendered) > self.cache_size:
+                self._rendered.popitem(last=False)
+        return prompt
+
+
+# Loaded once per process
+PROMPTS = PromptRegistry()
@@ -1,12 +1,23 @@
-import json
-from typing import Any, Dict, Optional
+import hashlib
+from typing import Optional, Tuple, Union
 from google import genai
 from google.genai import types
 
+from ..music_features import SCHEMA_VERSION, MusicFeatures, parse_music_features
+
+# Appended to the prompt when the file holds only some pages of a longer score
+CHUNK_PROMPT_NOTE = """
+--- PARTIAL SCORE ---
+This file contains ONLY pages {first_page}-{last_page} of a {total_pages}-page score. Analyze just these pages:
+'initial_tempo' and 'initial_dynamics' describe where these pages begin, and 'structural_analysis' lists every
+section that appears on them, in order. Leave 'title' and 'composer' empty unless they are printed on these pages.
+"""
+
 class MusicAnalyzer:
     """
     AI Service for analyzing sheet music features using a constrained Gemini prompt.
-    This service translates a raw file into structured, machine-readable data (JSON).
+    This service translates a raw file into structured, machine-readable data,
+    returned as a validated MusicFeatures.
     """
     def __init__(self, client: genai.Client, model: str = "gemini-2.5-flash"):
         self.client = client
@@ -31,31 +42,53 @@ GOAL: The analysis must be structured and descriptive, suitable for both human r
         "description": "Melody contour (e.g., 'gently moving up and down like shallow waves.')", 
         "pitch_range_midinotes": "List of typical MIDI notes (e.g., [55, 60, 65, 67])" 
     }}],
-    "repeating_motifs": [{{ "type": "Rhythmic", "description": "A driving, consistent 'long-short-short' beat repeats every two measures.", "duration": "2 measures" }}]
+    "repeating_motifs": [{{ "type": "Rhythmic", "description": "A driving, consistent 'long-short-short' beat repeats every two measures.", "duration": "2 measures" }}],
+    "notes_sample": [{{ "hand": "RH", "measure": 1, "beat": 1, "pitch": "G4", "duration": "dotted quarter note", "dynamic": "p" }}]
 }}
+'notes_sample' lists every note of the first 8 measures (both hands, chords as notes sharing a beat), in order.
+Its 'beat' is where the note starts in its measure, counted from 1 in the main beat: quarter notes in 2/4, 3/4 and 4/4
+(1.5 is the eighth after the downbeat), dotted quarters in 6/8, 9/8 and 12/8 (2 is the second dotted quarter).
 --- END OF RESPONSE FORMAT ---
 Return ONLY the JSON object. Do not include any explanation or markdown text outside the JSON block.
 """
+        # Changes whenever the prompt or schema changes, so cached analyses of older ones are not reused
+        self.prompt_version = hashlib.sha256(
+            f"{self.prompt_template}:{CHUNK_PROMPT_NOTE}:{SCHEMA_VERSION}".encode("utf-8")
+        ).hexdigest()[:12]
+        # Constrained decoding: the model must answer with JSON in the MusicFeatures shape
+        self.config = types.GenerateContentConfig(
+            response_mime_type="application/json",
+            response_schema=MusicFeatures,
+        )
 
-    def extract_features(self, uploaded_file: types.File) -> Optional[Dict[str, Any]]:
-        """Calls the Gemini model to analyze the file and extract structured musical features."""
+    def extract_features(self, uploaded_file: Union[types.File, types.Part],
+                         page_range: Optional[Tuple[int, int, int]] = None) -> Optional[MusicFeatures]:
+        """
+        Calls the Gemini model to analyze the file and extract structured musical features.
+        The score is either a File API upload or, for small files, the bytes
+        themselves as an inline Part (types.Part.from_bytes).
+        Output that is not strict JSON goes through the repair parser rather than
+        being discarded, since re-running the analysis is the expensive part.
+
+        :param page_range: (first_page, last_page, total_pages) when the file is one
+                           chunk of a longer score; see merge_features().
+        """
+        prompt = self.prompt_template
+        if page_range:
+            first_page, last_page, total_pages = page_range
+            prompt += CHUNK_PROMPT_NOTE.format(first_page=first_page, last_page=last_page, total_pages=total_pages)
         try:
             response = self.client.models.generate_content(
                 model=self.model,
-                contents=[uploaded_file, self.prompt_template],
+                contents=[uploaded_file, prompt],
+                config=self.config,
             )
-            
-            raw_text = response.text.strip()
-            
-            # Simple cleanup for common markdown wrapper if present
-            if raw_text.startswith("```"):
-                raw_text = raw_text.lstrip("```json").rstrip("```")
-                
-            return json.loads(raw_text)
-            
-        except json.JSONDecodeError as e:
-            print(f"ERROR: Music Analyzer failed to parse model output as JSON: {e}")
-            return None
         except Exception as e:
             print(f"ERROR: Gemini API call failed during feature extraction: {e}")
             return None
+
+        try:
+            return parse_music_features(response.text or "")
+        except ValueError as e:
+            print(f"ERROR: Music Analyzer failed to parse model output as JSON: {e}")
+            return None
@@ -0,0 +1,312 @@
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+import httpx
+from google import genai
+from google.genai import errors, types
+
+# HTTP status codes worth retrying: throttling, timeouts and server-side failures
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+# Per-model (requests per second, burst) and max concurrent calls; "files" covers the File API
+DEFAULT_RATE_LIMITS: Dict[str, Tuple[float, int]] = {
+    "gemini-2.0-flash-exp-image-generation": (1.0, 3),
+    "files": (5.0, 10),
+}
+DEFAULT_RATE_LIMIT: Tuple[float, int] = (5.0, 10)
+DEFAULT_MAX_CONCURRENCY = 8
+
+# Overall deadline per call, retries included
+DEFAULT_TIMEOUTS: Dict[str, float] = {
+    "gemini-2.0-flash-exp-image-generation": 120.0,
+    "files": 120.0,
+}
+DEFAULT_TIMEOUT = 60.0
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the API while a model's circuit breaker is open."""
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a call (including its retries and rate-limit waits) runs past its deadline."""
+
+
+def is_transient(error: Exception) -> bool:
+    """True for errors a retry may fix: throttling, 5xx responses and network failures."""
+    if isinstance(error, (DeadlineExceeded, CircuitOpenError)):
+        return False
+    if isinstance(error, errors.APIError):
+        return error.code in TRANSIENT_STATUS_CODES
+    return isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError))
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` calls per second with bursts up to `capacity`."""
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline: float) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            if now + wait > deadline:
+                raise DeadlineExceeded("Rate limit wait would exceed the call deadline.")
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing model for `reset_timeout` seconds after
+    `failure_threshold` consecutive transient failures, then lets a single
+    probe call through (half-open) to decide whether to close again.
+    """
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    raise CircuitOpenError("Model temporarily unavailable (circuit open).")
+                self.state = "half_open"
+                self._probe_in_flight = False
+            if self.state == "half_open":
+                if self._probe_in_flight:
+                    raise CircuitOpenError("Model temporarily unavailable (circuit half-open).")
+                self._probe_in_flight = True
+
+    def release_probe(self) -> None:
+        """Frees the half-open probe slot when the call never reached the model."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> bool:
+        """Counts a transient failure; True if it opened the circuit."""
+        with self._lock:
+            self._failures += 1
+            opens = self.state == "half_open" or self._failures >= self.failure_threshold
+            tripped = opens and self.state != "open"
+            if opens:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+            return tripped
+
+
+def _with_timeout(config: Any, config_cls: type, seconds: float) -> Any:
+    """Returns a copy of `config` whose per-request HTTP timeout is `seconds` (never mutates the input)."""
+    timeout_ms = max(1, int(seconds * 1000))
+    if config is None:
+        return config_cls(http_options=types.HttpOptions(timeout=timeout_ms))
+    if isinstance(config, dict):
+        config = config_cls(**config)
+    http_options = (config.http_options or types.HttpOptions()).model_copy(update={"timeout": timeout_ms})
+    return config.model_copy(update={"http_options": http_options})
+
+
+class ResilientClient:
+    """
+    Shared wrapper around genai.Client used by every call site.
+
+    It keeps one underlying client (and so one pooled HTTP connection set) per
+    process, and exposes the same `models` / `files` surface. Each call gets a
+    deadline, waits on a per-model token bucket and concurrency limit, passes
+    a per-model circuit breaker, and retries transient errors with jittered
+    exponential backoff. Anything else (e.g. `caches`, `aio`) is passed through
+    to the underlying client.
+    """
+    def __init__(self, client: genai.Client, max_attempts: int = 4, base_delay: float = 0.5, max_delay: float = 8.0,
+                 rate_limits: Optional[Dict[str, Tuple[float, int]]] = None,
+                 timeouts: Optional[Dict[str, float]] = None, max_concurrency: int = DEFAULT_MAX_CONCURRENCY):
+        self.raw = client
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rate_limits = {**DEFAULT_RATE_LIMITS, **(rate_limits or {})}
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.max_concurrency = max_concurrency
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+        self.models = _ResilientModels(self)
+        self.files = _ResilientFiles(self)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.raw, name)
+
+    def _limits_for(self, key: str) -> Tuple[TokenBucket, CircuitBreaker, threading.BoundedSemaphore, Dict[str, int]]:
+        with self._lock:
+            if key not in self._buckets:
+                rate, burst = self.rate_limits.get(key, DEFAULT_RATE_LIMIT)
+                self._buckets[key] = TokenBucket(rate, burst)
+                self._breakers[key] = CircuitBreaker()
+                self._slots[key] = threading.BoundedSemaphore(self.max_concurrency)
+                self._counters[key] = {"calls": 0, "retries": 0, "failures": 0, "rejected": 0, "circuit_trips": 0}
+            return self._buckets[key], self._breakers[key], self._slots[key], self._counters[key]
+
+    def _count(self, counters: Dict[str, int], name: str) -> None:
+        """Increments a per-model counter under the lock stats() reads them with."""
+        with self._lock:
+            counters[name] += 1
+
+    def call(self, key: str, attempt: Callable[[float], Any], timeout: Optional[float] = None) -> Any:
+        """
+        Runs `attempt(remaining_seconds)` under the resilience policy for `key`
+        (a model name, or 'files' for the File API).
+        """
+        deadline = time.monotonic() + (timeout or self.timeouts.get(key, DEFAULT_TIMEOUT))
+        bucket, breaker, slots, counters = self._limits_for(key)
+        self._count(counters, "calls")
+
+        for attempt_number in range(1, self.max_attempts + 1):
+            try:
+                breaker.before_call()
+            except CircuitOpenError:
+                self._count(counters, "rejected")
+                raise
+            try:
+                bucket.acquire(deadline)
+                if not slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                    raise DeadlineExceeded("Timed out waiting for a free call slot.")
+            except DeadlineExceeded:
+                breaker.release_probe()
+                self._count(counters, "failures")
+                raise
+            try:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise DeadlineExceeded("Call deadline exceeded.")
+                result = attempt(remaining)
+            except DeadlineExceeded:
+                breaker.release_probe()
+                self._count(counters, "failures")
+                raise
+            except Exception as e:
+                if not is_transient(e):
+                    # The service answered (e.g. 400): it is healthy even though this request was not
+                    breaker.record_success()
+                    raise
+                if breaker.record_failure():
+                    self._count(counters, "circuit_trips")
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt_number - 1)))
+                if attempt_number == self.max_attempts or time.monotonic() + delay >= deadline:
+                    self._count(counters, "failures")
+                    raise
+                self._count(counters, "retries")
+                print(f"WARNING: Transient error from {key} ({e}); retry {attempt_number} in {delay:.2f}s")
+                time.sleep(delay)
+                continue
+            finally:
+                slots.release()
+            breaker.record_success()
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {key: {**self._counters[key], "circuit": self._breakers[key].state} for key in self._counters}
+
+
+class _ResilientModels:
+    """`client.models` with the ResilientClient policy applied to every call."""
+    def __init__(self, client: ResilientClient):
+        self._client = client
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client.raw.models, name)
+
+    def generate_content(self, *, model: str, contents: Any, config: Any = None, timeout: Optional[float] = None):
+        return self._client.call(
+            model,
+            lambda remaining: self._client.raw.models.generate_content(
+                model=model, contents=contents, config=_with_timeout(config, types.GenerateContentConfig, remaining)
+            ),
+            timeout,
+        )
+
+    def generate_content_stream(self, *, model: str, contents: Any, config: Any = None,
+                                timeout: Optional[float] = None) -> Iterator[Any]:
+        """Streams chunks; retries apply until the first chunk arrives, never mid-stream."""
+        def open_stream(remaining: float) -> Tuple[Any, Iterator[Any]]:
+            stream = iter(self._client.raw.models.generate_content_stream(
+                model=model, contents=contents, config=_with_timeout(config, types.GenerateContentConfig, remaining)
+            ))
+            return next(stream, None), stream
+
+        first_chunk, stream = self._client.call(model, open_stream, timeout)
+        if first_chunk is not None:
+            yield first_chunk
+            yield from stream
+
+    def count_tokens(self, *, model: str, contents: Any, config: Any = None, timeout: Optional[float] = None):
+        return self._client.call(
+            model,
+            lambda remaining: self._client.raw.models.count_tokens(
+                model=model, contents=contents, config=_with_timeout(config, types.CountTokensConfig, remaining)
+            ),
+            timeout,
+        )
+
+
+class _ResilientFiles:
+    """`client.files` with the ResilientClient policy applied under the 'files' key."""
+    def __init__(self, client: ResilientClient):
+        self._client = client
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client.raw.files, name)
+
+    def upload(self, *, file: Any, config: Any = None, timeout: Optional[float] = None) -> types.File:
+        def attempt(remaining: float) -> types.File:
+            if hasattr(file, "seek"):
+                file.seek(0)  # a retried stream must be re-read from the start
+            return self._client.raw.files.upload(file=file, config=_with_timeout(config, types.UploadFileConfig, remaining))
+        return self._client.call("files", attempt, timeout)
+
+    def get(self, *, name: str, timeout: Optional[float] = None) -> types.File:
+        return self._client.call("files", lambda remaining: self._client.raw.files.get(name=name), timeout)
+
+    def delete(self, *, name: str, timeout: Optional[float] = None) -> Any:
+        return self._client.call("files", lambda remaining: self._client.raw.files.delete(name=name), timeout)
+
+
+_shared_client: Optional[ResilientClient] = None
+_shared_client_lock = threading.Lock()
+
+
+def get_client(**kwargs: Any) -> ResilientClient:
+    """
+    Returns the process-wide ResilientClient, creating it on first use.
+    Keyword arguments are passed to genai.Client (e.g. api_key) on creation.
+    """
+    global _shared_client
+    with _shared_client_lock:
+        if _shared_client is None:
+            _shared_client = ResilientClient(genai.Client(**kwargs))
+        return _shared_client
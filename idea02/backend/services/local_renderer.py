@@ -0,0 +1,298 @@
+import io
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageChops, ImageDraw, ImageFilter
+
+from ..music_features import MusicFeatures
+from ..note_array import NoteArray, note_array
+
+# Fixed pitch-class wheel, C through B, so a note family always has the same colour
+PITCH_CLASS_COLORS = [
+    "#ff3b30", "#ff7a00", "#ffb700", "#f5e400", "#8fd400", "#2ecc71",
+    "#00c2b8", "#00a2ff", "#3a5bff", "#7a3cff", "#c23cff", "#ff2d95",
+]
+# High-contrast voice colours for the waveform, and the two voices of the micro-notation
+WAVE_VOICE_COLORS = ["#e63946", "#1d7fe0", "#f4a261", "#2a9d8f"]
+MICRO_VOICE_COLORS = ["#8b1a1a", "#2f4b6e"]
+
+# Oversampling factor of the PNG rasterizer, for anti-aliased edges
+_SUPERSAMPLE = 2
+
+
+@dataclass(slots=True)
+class RenderedScore:
+    style: str
+    png: bytes
+    svg: str
+
+
+class _Canvas:
+    """
+    Records shapes once and rasterizes them to PNG (Pillow) or serializes them
+    to SVG, so both outputs show the same drawing. Coordinates are rounded to a
+    tenth of a pixel and nothing is random, so the same shapes always give the
+    same bytes.
+    """
+    def __init__(self, width: int, height: int, background: Tuple[str, str]):
+        self.width = width
+        self.height = height
+        self.background = background  # Vertical gradient, top -> bottom
+        self.glows: List[Tuple[float, float, float, str, float]] = []
+        self.shapes: List[tuple] = []
+
+    def glow(self, cx: float, cy: float, r: float, color: str, opacity: float) -> None:
+        self.glows.append((cx, cy, r, color, opacity))
+
+    def circle(self, cx: float, cy: float, r: float, fill: Optional[str], opacity: float = 1.0,
+               stroke: Optional[str] = None, stroke_width: float = 1.0) -> None:
+        self.shapes.append(("circle", (cx, cy, r), fill, opacity, stroke, stroke_width))
+
+    def rect(self, x: float, y: float, w: float, h: float, fill: Optional[str], opacity: float = 1.0,
+             stroke: Optional[str] = None, stroke_width: float = 1.0) -> None:
+        self.shapes.append(("rect", (x, y, w, h), fill, opacity, stroke, stroke_width))
+
+    def polygon(self, points: np.ndarray, fill: Optional[str], opacity: float = 1.0,
+                stroke: Optional[str] = None, stroke_width: float = 1.0) -> None:
+        self.shapes.append(("polygon", np.round(points, 1), fill, opacity, stroke, stroke_width))
+
+    def line(self, points: np.ndarray, stroke: str, width: float = 1.0, opacity: float = 1.0) -> None:
+        self.shapes.append(("line", np.round(points, 1), None, opacity, stroke, width))
+
+    def png(self) -> bytes:
+        s = _SUPERSAMPLE
+        size = (self.width * s, self.height * s)
+        top, bottom = np.array(_rgb(self.background[0])), np.array(_rgb(self.background[1]))
+        ramp = np.linspace(0.0, 1.0, self.height)[:, None, None]
+        column = np.round(top + (bottom - top) * ramp).astype(np.uint8)
+        image = Image.fromarray(column, "RGB").resize((self.width, self.height), Image.NEAREST)
+
+        if self.glows:
+            # Glows are soft anyway, so they are blurred at output resolution
+            layer = Image.new("RGB", image.size, (0, 0, 0))
+            draw = ImageDraw.Draw(layer, "RGBA")
+            for cx, cy, r, color, opacity in self.glows:
+                draw.ellipse(_box(cx, cy, r), fill=_rgba(color, opacity))
+            blur = max(1, round(4 * self.height / 720))
+            image = ImageChops.screen(image, layer.filter(ImageFilter.GaussianBlur(blur)))
+        image = image.resize(size, Image.NEAREST)
+
+        draw = ImageDraw.Draw(image, "RGBA")
+        for kind, geometry, fill, opacity, stroke, stroke_width in self.shapes:
+            fill_rgba = _rgba(fill, opacity) if fill else None
+            outline = _rgba(stroke, opacity) if stroke else None
+            width = max(1, round(stroke_width * s))
+            if kind == "circle":
+                cx, cy, r = geometry
+                draw.ellipse(_box(cx * s, cy * s, r * s), fill=fill_rgba, outline=outline, width=width)
+            elif kind == "rect":
+                x, y, w, h = geometry
+                draw.rectangle((x * s, y * s, (x + w) * s, (y + h) * s), fill=fill_rgba, outline=outline, width=width)
+            elif kind == "polygon":
+                draw.polygon([tuple(point) for point in geometry * s], fill=fill_rgba, outline=outline, width=width)
+            else:
+                draw.line([tuple(point) for point in geometry * s], fill=outline, width=width, joint="curve")
+
+        buffer = io.BytesIO()
+        image.reduce(s).save(buffer, "PNG")
+        return buffer.getvalue()
+
+    def svg(self) -> str:
+        out = [
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{self.width}" height="{self.height}" '
+            f'viewBox="0 0 {self.width} {self.height}">',
+            '<defs><linearGradient id="bg" x1="0" y1="0" x2="0" y2="1">'
+            f'<stop offset="0" stop-color="{self.background[0]}"/><stop offset="1" stop-color="{self.background[1]}"/>'
+            '</linearGradient>'
+            f'<filter id="glow" x="-1" y="-1" width="3" height="3"><feGaussianBlur stdDeviation="{4 * self.height / 720:.1f}"/></filter>'
+            '</defs>',
+            f'<rect width="{self.width}" height="{self.height}" fill="url(#bg)"/>',
+        ]
+        if self.glows:
+            out.append('<g filter="url(#glow)" style="mix-blend-mode:screen">')
+            out.extend(
+                f'<circle cx="{cx:.1f}" cy="{cy:.1f}" r="{r:.1f}" fill="{color}" fill-opacity="{opacity:.2f}"/>'
+                for cx, cy, r, color, opacity in self.glows
+            )
+            out.append("</g>")
+        for kind, geometry, fill, opacity, stroke, stroke_width in self.shapes:
+            paint = (
+                f'fill="{fill or "none"}"' + (f' fill-opacity="{opacity:.2f}"' if fill else "")
+                + (f' stroke="{stroke}" stroke-width="{stroke_width:.1f}" stroke-opacity="{opacity:.2f}"' if stroke else "")
+            )
+            if kind == "circle":
+                cx, cy, r = geometry
+                out.append(f'<circle cx="{cx:.1f}" cy="{cy:.1f}" r="{r:.1f}" {paint}/>')
+            elif kind == "rect":
+                x, y, w, h = geometry
+                out.append(f'<rect x="{x:.1f}" y="{y:.1f}" width="{w:.1f}" height="{h:.1f}" {paint}/>')
+            else:
+                points = " ".join(f"{x:.1f},{y:.1f}" for x, y in geometry)
+                tag = "polygon" if kind == "polygon" else 'polyline stroke-linejoin="round"'
+                out.append(f'<{tag} points="{points}" {paint}/>')
+        out.append("</svg>")
+        return "\n".join(out)
+
+
+def _rgb(color: str) -> Tuple[int, int, int]:
+    return int(color[1:3], 16), int(color[3:5], 16), int(color[5:7], 16)
+
+
+def _rgba(color: str, opacity: float) -> Tuple[int, int, int, int]:
+    return (*_rgb(color), round(255 * min(1.0, max(0.0, opacity))))
+
+
+def _box(cx: float, cy: float, r: float) -> Tuple[float, float, float, float]:
+    return cx - r, cy - r, cx + r, cy + r
+
+
+class _Layout:
+    """Shared data-to-pixel mapping: time runs left to right, pitch bottom to top."""
+    def __init__(self, data: NoteArray, width: int, height: int):
+        self.notes = data.notes
+        self.margin = round(min(width, height) * 0.08)
+        self.width, self.height = width, height
+        self.unit = height / 720  # Sizes are specified for a 720 px tall canvas
+        self.low = int(self.notes["midi"].min()) - 2
+        self.high = int(self.notes["midi"].max()) + 2
+        self.total_beats = data.total_beats
+        self.x = self.x_at(self.notes["onset"])
+        self.x_end = self.x_at(self.notes["onset"] + self.notes["duration"])
+        self.y = self.y_at(self.notes["midi"])
+
+    def x_at(self, beats: np.ndarray) -> np.ndarray:
+        return self.margin + beats / self.total_beats * (self.width - 2 * self.margin)
+
+    def y_at(self, midi: np.ndarray) -> np.ndarray:
+        return self.height - self.margin - (midi - self.low) / (self.high - self.low) * (self.height - 2 * self.margin)
+
+
+def _constellation(data: NoteArray, features: MusicFeatures, width: int, height: int) -> _Canvas:
+    """Stars on a night sky: Y = MIDI pitch, radius and spacing follow duration, glow follows dynamics."""
+    layout = _Layout(data, width, height)
+    notes = layout.notes
+    canvas = _Canvas(width, height, ("#02030d", "#0d1440"))
+
+    # Background stars from a fixed seed, so they never move between renders
+    rng = np.random.default_rng(1729)
+    for x, y, r, opacity in zip(rng.uniform(0, width, 160), rng.uniform(0, height, 160),
+                                rng.uniform(0.4, 1.3, 160) * layout.unit, rng.uniform(0.15, 0.5, 160)):
+        canvas.circle(x, y, r, "#ffffff", opacity)
+
+    # Stardust trails through each voice's melody
+    for voice in range(len(data.voices)):
+        in_voice = notes["voice"] == voice
+        if in_voice.sum() > 1:
+            canvas.line(np.column_stack([layout.x[in_voice], layout.y[in_voice]]), "#a9bcff", 1.2 * layout.unit, 0.35)
+
+    # Whole note = 10 units of radius, on a 2 px unit at 720 px
+    radius = np.clip(notes["duration"] / 4 * 10 * 2 * layout.unit, 2.5 * layout.unit, 30 * layout.unit)
+    for x, y, r, midi, velocity in zip(layout.x, layout.y, radius, notes["midi"], notes["velocity"]):
+        color = PITCH_CLASS_COLORS[int(midi) % 12]
+        canvas.glow(x, y, r * 3, color, float(velocity))
+        canvas.circle(x, y, r, color, 0.95)
+        canvas.circle(x, y, r * 0.35, "#ffffff", 0.9)
+    return canvas
+
+
+def _panoramic_waveform(data: NoteArray, features: MusicFeatures, width: int, height: int) -> _Canvas:
+    """One wave band per voice: crest height = pitch register, segment width = duration, jagged crests for staccato."""
+    layout = _Layout(data, width, height)
+    notes = layout.notes
+    canvas = _Canvas(width, height, ("#0b132b", "#3a506b"))
+    jagged = "stacc" in (features.initial_dynamics.articulation or "").lower()
+    baseline = height - layout.margin / 2
+    steps = np.linspace(0.0, 1.0, 17)
+    crest = np.abs(1 - 2 * np.abs(steps - 0.5) * 2) if jagged else np.sin(np.pi * steps)
+
+    # Higher voices are drawn first, so the lower waves stay visible in front
+    order = sorted(range(len(data.voices)), key=lambda v: -notes["midi"][notes["voice"] == v].mean())
+    for voice in order:
+        in_voice = np.flatnonzero(notes["voice"] == voice)
+        # Chords share one segment: keep the highest note of each onset
+        onsets, first = np.unique(notes["onset"][in_voice][::-1], return_index=True)
+        picked = in_voice[::-1][first]
+        heights = (baseline - layout.y[picked]) * 0.85
+        segments = [
+            np.column_stack([
+                layout.x[i] + steps * (layout.x_end[i] - layout.x[i]),
+                baseline - h * (0.55 + 0.45 * crest),
+            ])
+            for i, h in zip(picked, heights)
+        ]
+        crest_line = np.vstack(segments)
+        color = WAVE_VOICE_COLORS[voice % len(WAVE_VOICE_COLORS)]
+        band = np.vstack([crest_line, [[crest_line[-1, 0], baseline], [crest_line[0, 0], baseline]]])
+        canvas.polygon(band, color, 0.45)
+        loudness = float(notes["velocity"][picked].mean())
+        canvas.line(crest_line, color, (1.5 + 3 * loudness) * layout.unit, 0.95)
+    return canvas
+
+
+def _geometric_micro_notation(data: NoteArray, features: MusicFeatures, width: int, height: int) -> _Canvas:
+    """Stems from a central timeline: length = distance from the median pitch, shape = note value, colour = voice."""
+    layout = _Layout(data, width, height)
+    notes = layout.notes
+    canvas = _Canvas(width, height, ("#ffffff", "#ffffff"))
+    axis = height / 2
+    canvas.line(np.array([[layout.margin / 2, axis], [width - layout.margin / 2, axis]]), "#000000", 2 * layout.unit)
+
+    center = float(np.median(notes["midi"]))
+    span = max(float(np.abs(notes["midi"] - center).max()), 1.0)
+    tips = axis - (notes["midi"] - center) / span * (axis - layout.margin)
+    sizes = (2.5 + 2.5 * np.minimum(notes["duration"], 4)) * (0.6 + 0.4 * notes["velocity"]) * layout.unit
+    chord_member = np.concatenate([[False], (np.diff(notes["onset"]) == 0) & (np.diff(notes["voice"]) == 0)])
+    previous_midi: Dict[int, int] = {}
+
+    for i, (x, tip, size) in enumerate(zip(layout.x, tips, sizes)):
+        voice, midi, duration = int(notes["voice"][i]), int(notes["midi"][i]), float(notes["duration"][i])
+        color = MICRO_VOICE_COLORS[voice % len(MICRO_VOICE_COLORS)]
+        canvas.line(np.array([[x, axis], [x, tip]]), "#000000", 1 * layout.unit)
+        if chord_member[i]:
+            canvas.circle(x, tip, size * 0.6, None, 1.0, color, 1.5 * layout.unit)
+        elif duration >= 2:
+            canvas.circle(x, tip, size, color)
+        elif duration >= 1:
+            canvas.rect(x - size, tip - size, 2 * size, 2 * size, color)
+        else:
+            direction = -1 if midi >= previous_midi.get(voice, midi) else 1  # Points up for rising or repeated notes
+            canvas.polygon(np.array([[x, tip + direction * size], [x - size, tip - direction * size],
+                                     [x + size, tip - direction * size]]), color)
+        # Repeated notes are tied by a short horizontal connector
+        if previous_midi.get(voice) == midi and not chord_member[i]:
+            earlier = np.flatnonzero((notes["voice"][:i] == voice) & (notes["midi"][:i] == midi))
+            canvas.line(np.array([[layout.x[earlier[-1]], tip], [x, tip]]), color, 2 * layout.unit, 0.8)
+        previous_midi[voice] = midi
+    return canvas
+
+
+# Styles whose prompts describe exact data mappings, so they can be drawn without the image model
+LOCAL_STYLES: Dict[str, Callable[[NoteArray, MusicFeatures, int, int], _Canvas]] = {
+    "constellation_score": _constellation,
+    "panoramic_waveform_prompt": _panoramic_waveform,
+    "geometric_micro_notation_score": _geometric_micro_notation,
+}
+
+
+def can_render(style: str, features: MusicFeatures) -> bool:
+    """True if `style` has a local renderer and the features carry sampled notes to draw."""
+    return style in LOCAL_STYLES and bool(features.notes_sample)
+
+
+def render_score(style: str, features: MusicFeatures, width: int = 1280, height: int = 720) -> RenderedScore:
+    """
+    Draws a data-mapped style from the sampled notes in milliseconds, as PNG and
+    SVG. The output depends only on the inputs: the same features always give
+    the same bytes, unlike the image model.
+
+    :raises ValueError: For styles without a local renderer, or features without readable notes.
+    """
+    if style not in LOCAL_STYLES:
+        raise ValueError(f"No local renderer for style '{style}'.")
+    data = note_array(features.notes_sample, features.time_signature, features.initial_dynamics.level or "mf",
+                      features.beat_unit)
+    if not len(data):
+        raise ValueError("The features contain no notes with readable pitches.")
+    canvas = LOCAL_STYLES[style](data, features, width, height)
+    return RenderedScore(style=style, png=canvas.png(), svg=canvas.svg())
@@ -0,0 +1,336 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from google import genai
+from google.genai import types
+
+from ..music_features import MusicFeatures
+from ..note_array import note_statistics
+from ..prompt_registry import PROMPTS
+from ..utils.feature_cache import features_hash
+from ..utils.local_db import LocalDatabase
+from ..utils.single_flight import SingleFlight
+
+MAX_NARRATION_WORDS = 70
+# Style prompts can be long; the narration only needs the gist of each
+MAX_STYLE_BRIEF_CHARS = 600
+
+# Runs streamed batch calls, which outlive the request that started them to fill the cache
+_stream_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="narration-stream")
+
+NARRATION_PROMPT_TEMPLATE = """
+Based on the musical summary for '{title}', write one concise narration (max {max_words} words) for EACH graphic style listed below, for a beginner/non-musician/deaf user. Each narration MUST emphasize the STRUCTURAL MAPPING of that style (e.g. 'The waves rise and fall with the pitch contour...') and include the technical term in parentheses next to its beginner-friendly description (e.g. 'soft (p)').
+
+--- MUSIC SUMMARY ---
+Style: {key_mood} Key, {time_signature} time.
+Start: {initial_tempo_desc} ({initial_tempo_term}), {initial_dynamics_desc} ({initial_dynamics_term}), {initial_articulation_term} texture.
+Highlight: {rhythm_highlight}
+Measured: {note_highlight}
+
+--- GRAPHIC STYLES ---
+{styles}
+
+Return one entry per style, using the style name exactly as given.
+"""
+
+
+@dataclass(slots=True)
+class StyleNarration:
+    style: str
+    narration: str
+
+
+class _NarrationStream:
+    """The growing response text of one streamed batch call, readable by any number of followers."""
+    def __init__(self):
+        self.text = ""
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.narrations: Dict[str, str] = {}
+        self._changed = threading.Condition()
+
+    def append(self, text: str) -> None:
+        with self._changed:
+            self.text += text
+            self._changed.notify_all()
+
+    def finish(self, narrations: Optional[Dict[str, str]] = None, error: Optional[BaseException] = None) -> None:
+        with self._changed:
+            self.narrations = narrations or {}
+            self.error = error
+            self.done = True
+            self._changed.notify_all()
+
+    def follow(self) -> Iterator[Tuple[str, bool]]:
+        """Yields (text so far, done) each time the text grows, ending once the call has finished."""
+        seen = -1
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: len(self.text) != seen or self.done)
+                text, done = self.text, self.done
+            seen = len(text)
+            yield text, done
+            if done:
+                return
+
+    def result(self) -> Dict[str, str]:
+        with self._changed:
+            self._changed.wait_for(lambda: self.done)
+        if self.error:
+            raise self.error
+        return self.narrations
+
+
+class NarrationService:
+    """
+    Writes the beginner-friendly narrations for many styles in one model call.
+
+    The music summary is sent once with a short brief of every requested style,
+    and the structured response carries one narration per style. Narrations are
+    cached by (features hash, style, prompt version), where the version covers
+    the narration template and the style's registry template, so a gallery costs a single
+    text round-trip and later regenerations of any style are cache hits. With a
+    LocalDatabase the cache is shared across workers and restarts; without one it
+    lives in memory. Concurrent requests for the same score share one call,
+    streamed or not.
+    """
+    def __init__(self, client: genai.Client, placeholder: str, db: Optional[LocalDatabase] = None,
+                 model: str = "gemini-2.5-flash", ttl_seconds: int = 7 * 24 * 3600):
+        self.client = client
+        self.placeholder = placeholder
+        self.db = db
+        self.model = model
+        self.ttl_seconds = ttl_seconds
+        self.prompt_version = hashlib.sha256(NARRATION_PROMPT_TEMPLATE.encode("utf-8")).hexdigest()[:12]
+        self.flights = SingleFlight()
+        self._memory: Dict[Tuple[str, str, str], str] = {}
+        self._lock = threading.Lock()
+        self._streams: Dict[Tuple[str, Tuple[str, ...]], _NarrationStream] = {}
+        self._counters = {"hits": 0, "misses": 0, "calls": 0, "coalesced_streams": 0}
+        if self.db:
+            with self.db.transaction() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS narration_cache ("
+                    " features_hash TEXT NOT NULL, style TEXT NOT NULL, prompt_version TEXT NOT NULL,"
+                    " narration TEXT NOT NULL, created_at REAL NOT NULL,"
+                    " PRIMARY KEY (features_hash, style, prompt_version))"
+                )
+
+    def narrate(self, sheet_data: MusicFeatures, styles: List[Tuple[str, str]]) -> Dict[str, str]:
+        """
+        Returns {style_name: narration} for the given (name, prompt) styles.
+        Cached styles are served directly; the rest are written in one call.
+        Styles the model leaves out are missing from the result.
+
+        Raises on model or parsing errors, like a single generate_content call.
+        """
+        score_hash = features_hash(sheet_data.to_dict())
+        narrations = self._cached(score_hash, [name for name, _ in styles])
+        missing = [(name, prompt) for name, prompt in styles if name not in narrations]
+        with self._lock:
+            self._counters["hits"] += len(narrations)
+            self._counters["misses"] += len(missing)
+        if missing:
+            flight_key = (score_hash, tuple(sorted(name for name, _ in missing)))
+            with self._lock:
+                stream = self._streams.get(flight_key)
+            if stream:
+                generated = stream.result()
+            else:
+                generated, _ = self.flights.do(flight_key, self._generate, sheet_data, score_hash, missing)
+            narrations.update(generated)
+        return narrations
+
+    def narrate_stream(self, sheet_data: MusicFeatures, styles: List[Tuple[str, str]], focus: str) -> Iterator[str]:
+        """
+        Streams the narration of the `focus` style as text deltas while the
+        batched call for all uncached styles is still running, and ends as soon
+        as that narration is complete (clipped to MAX_NARRATION_WORDS exactly as
+        the cached copy is). The focus style is requested first, so its text
+        arrives with the first chunks; the call itself runs on in the background
+        and caches every style's narration like narrate(). Concurrent streams
+        for the same score and styles follow one call.
+
+        Raises the call's error if it fails before the focus narration is complete.
+        """
+        score_hash = features_hash(sheet_data.to_dict())
+        cached = self._cached(score_hash, [name for name, _ in styles])
+        if focus in cached:
+            with self._lock:
+                self._counters["hits"] += 1
+            yield cached[focus]
+            return
+
+        missing = sorted((style for style in styles if style[0] not in cached), key=lambda style: style[0] != focus)
+        flight_key = (score_hash, tuple(sorted(name for name, _ in missing)))
+        with self._lock:
+            stream = self._streams.get(flight_key)
+            if stream:
+                self._counters["coalesced_streams"] += 1
+            else:
+                stream = self._streams[flight_key] = _NarrationStream()
+                self._counters["misses"] += len(missing)
+                self._counters["calls"] += 1
+                _stream_pool.submit(self._run_stream, stream, flight_key, sheet_data, score_hash, missing)
+
+        emitted = ""
+        for text, done in stream.follow():
+            partial, closed = _partial_narration(text, focus)
+            words = list(re.finditer(r"\S+", partial))
+            if closed or len(words) > MAX_NARRATION_WORDS:
+                narration = _clip_narration(partial)
+                if narration[len(emitted):]:
+                    yield narration[len(emitted):]
+                return
+            # Hold back what the final clipping could still strip: trailing spaces, and punctuation after the last allowed word
+            safe = partial[:words[-1].end()] if words else ""
+            if len(words) == MAX_NARRATION_WORDS:
+                safe = safe.rstrip(",;:")
+            safe = safe.lstrip()
+            if len(safe) > len(emitted):
+                yield safe[len(emitted):]
+                emitted = safe
+            if done and stream.error:
+                raise stream.error
+
+    def _run_stream(self, stream: _NarrationStream, flight_key: Tuple[str, Tuple[str, ...]], sheet_data: MusicFeatures,
+                    score_hash: str, styles: List[Tuple[str, str]]) -> None:
+        """Runs one streamed batch call to the end, publishing its text to `stream` and caching the result."""
+        narrations, error = None, None
+        try:
+            response = self.client.models.generate_content_stream(
+                model=self.model,
+                contents=[self._prompt(sheet_data, styles)],
+                config=self._config(),
+            )
+            for chunk in response:
+                stream.append(chunk.text or "")
+            narrations = self._parse(stream.text, styles)
+            self._store(score_hash, narrations)
+        except Exception as e:
+            print(f"ERROR: Streamed narration call failed: {e}")
+            error = e
+        finally:
+            with self._lock:
+                self._streams.pop(flight_key, None)
+            stream.finish(narrations, error)
+
+    def _prompt(self, sheet_data: MusicFeatures, styles: List[Tuple[str, str]]) -> str:
+        statistics = note_statistics(sheet_data)
+        return NARRATION_PROMPT_TEMPLATE.format(
+            max_words=MAX_NARRATION_WORDS,
+            styles="\n".join(f"- {name}: {self._style_brief(style_prompt)}" for name, style_prompt in styles),
+            note_highlight=statistics.describe() if statistics else "No note data.",
+            **sheet_data.narration_summary(),
+        )
+
+    @staticmethod
+    def _config() -> types.GenerateContentConfig:
+        return types.GenerateContentConfig(
+            response_mime_type="application/json",
+            response_schema=list[StyleNarration],
+        )
+
+    def _style_brief(self, prompt: str) -> str:
+        brief = re.sub(r"\s+", " ", prompt.replace(self.placeholder, "the music data")).strip()
+        if len(brief) > MAX_STYLE_BRIEF_CHARS:
+            brief = brief[:MAX_STYLE_BRIEF_CHARS].rsplit(" ", 1)[0] + " ..."
+        return brief
+
+    def _generate(self, sheet_data: MusicFeatures, score_hash: str, styles: List[Tuple[str, str]]) -> Dict[str, str]:
+        with self._lock:
+            self._counters["calls"] += 1
+        response = self.client.models.generate_content(
+            model=self.model,
+            contents=[self._prompt(sheet_data, styles)],
+            config=self._config(),
+        )
+        narrations = self._parse(response.text, styles)
+        self._store(score_hash, narrations)
+        return narrations
+
+    @staticmethod
+    def _parse(text: str, styles: List[Tuple[str, str]]) -> Dict[str, str]:
+        """Maps the structured response to {style: narration}, clipped to the word limit."""
+        requested = {name for name, _ in styles}
+        narrations = {}
+        for entry in json.loads(text):
+            style, narration = entry.get("style"), (entry.get("narration") or "").strip()
+            if style in requested and narration:
+                narrations[style] = _clip_narration(narration)
+        return narrations
+
+    def _version(self, style: str) -> str:
+        """Narration template version, plus the style template's version for registry styles."""
+        return f"{self.prompt_version}:{PROMPTS.get(style).version}" if style in PROMPTS else self.prompt_version
+
+    def _cached(self, score_hash: str, style_names: List[str]) -> Dict[str, str]:
+        if not self.db:
+            return {
+                name: self._memory[(score_hash, name, self._version(name))]
+                for name in style_names if (score_hash, name, self._version(name)) in self._memory
+            }
+        rows = self.db.execute(
+            "SELECT style, prompt_version, narration FROM narration_cache WHERE features_hash = ? AND created_at >= ?",
+            (score_hash, time.time() - self.ttl_seconds),
+        ).fetchall()
+        wanted = {name: self._version(name) for name in style_names}
+        return {style: narration for style, version, narration in rows if wanted.get(style) == version}
+
+    def _store(self, score_hash: str, narrations: Dict[str, str]) -> None:
+        if not self.db:
+            with self._lock:
+                for name, narration in narrations.items():
+                    self._memory[(score_hash, name, self._version(name))] = narration
+            return
+        now = time.time()
+        try:
+            with self.db.transaction() as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO narration_cache (features_hash, style, prompt_version, narration, created_at)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    [(score_hash, name, self._version(name), narration, now) for name, narration in narrations.items()],
+                )
+                conn.execute("DELETE FROM narration_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        except Exception as e:
+            print(f"WARNING: Failed to store narrations in cache: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+
+def _clip_narration(narration: str) -> str:
+    """Cuts a narration after MAX_NARRATION_WORDS words, keeping its own spacing up to there."""
+    narration = narration.strip()
+    words = list(re.finditer(r"\S+", narration))
+    if len(words) <= MAX_NARRATION_WORDS:
+        return narration
+    return narration[:words[MAX_NARRATION_WORDS - 1].end()].rstrip(",;:") + "..."
+
+
+def _partial_narration(text: str, style: str) -> Tuple[str, bool]:
+    """
+    Extracts the (possibly unfinished) narration of `style` from a partial JSON
+    response, decoding only complete characters so escapes are never split.
+    Returns (narration so far, whether its string has closed).
+    """
+    match = re.search(r'"style"\s*:\s*' + re.escape(json.dumps(style)) + r'\s*,\s*"narration"\s*:\s*"', text)
+    if not match:
+        return "", False
+    rest, end = text[match.end():], 0
+    while end < len(rest) and rest[end] != '"':
+        if rest[end] == "\\":
+            step = 6 if rest[end + 1:end + 2] == "u" else 2
+            if end + step > len(rest):
+                break
+            end += step
+        else:
+            end += 1
+    return json.loads('"' + rest[:end] + '"'), end < len(rest) and rest[end] == '"'
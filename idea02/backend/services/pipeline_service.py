@@ -0,0 +1,283 @@
+import hashlib
+import io
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from google.genai import types
+
+from ..music_features import MusicFeatures, merge_features
+from ..note_array import prompt_features
+from ..utils.file_management import INLINE_REQUEST_LIMIT_BYTES, FileManagement, SpooledUpload
+from ..utils.feature_cache import FeatureCache
+from ..utils.file_registry import RemoteFileRegistry
+from ..utils.job_queue import Job
+from ..utils.pdf_chunks import PdfChunk, split_pdf
+from ..utils.single_flight import SingleFlight
+from .analysis_service import MusicAnalyzer
+from .symbolic_analysis import SymbolicAnalyzer, symbolic_format
+from .visualization_service import VisualizationGenerator
+
+# Shared by all pipelines so concurrent jobs don't each spawn threads for their chunks
+_chunk_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="analysis-chunk")
+
+
+class MusicPipeline:
+    """
+    Runs the full FileManagement -> MusicAnalyzer -> VisualizationGenerator chain
+    for one uploaded score, reporting per-stage progress on the given Job.
+
+    Concurrent uploads of the same file share one upload and analysis: later
+    callers wait on the first one's in-flight call instead of repeating it.
+
+    PDFs longer than `pages_per_chunk` pages are split into page ranges that are
+    uploaded and analyzed in parallel, then merged with merge_features(), so
+    analysis latency follows the slowest chunk rather than the page count and
+    long scores keep all their sections. 0 analyzes every file whole.
+
+    MusicXML (.musicxml/.xml/.mxl) and MIDI uploads skip the upload and model
+    analysis: SymbolicAnalyzer reads the features straight from the file.
+
+    With a `file_registry`, uploads (whole files and chunks) are kept and
+    reused by content hash instead of being deleted after the analysis, so
+    analyzing the same score again, e.g. with another model, skips the upload.
+
+    Files (and chunks) of at most `inline_max_bytes` skip the File API
+    altogether: their bytes go inline with the analysis request, saving the
+    upload and delete round-trips. The job's upload stage reads "inline",
+    "reused" or "done" for the path taken, and upload_stats() counts them.
+    """
+    STAGES = ["upload", "analysis", "visualization"]
+
+    def __init__(self, file_manager: FileManagement, analyzer: MusicAnalyzer, generator: VisualizationGenerator,
+                 feature_cache: Optional[FeatureCache] = None, pages_per_chunk: int = 0,
+                 executor: Optional[ThreadPoolExecutor] = None, symbolic_analyzer: Optional[SymbolicAnalyzer] = None,
+                 file_registry: Optional[RemoteFileRegistry] = None, inline_max_bytes: int = 0):
+        self.file_manager = file_manager
+        self.analyzer = analyzer
+        self.generator = generator
+        self.feature_cache = feature_cache
+        self.pages_per_chunk = pages_per_chunk
+        self.executor = executor or _chunk_pool
+        self.symbolic_analyzer = symbolic_analyzer or SymbolicAnalyzer()
+        self.file_registry = file_registry
+        # Base64 makes inline bytes a third larger, and the prompt needs room too
+        inline_limit = INLINE_REQUEST_LIMIT_BYTES * 3 // 4 - 1024 * 1024
+        if inline_max_bytes > inline_limit:
+            print(f"WARNING: Inline upload threshold of {inline_max_bytes} bytes exceeds the request limit; using {inline_limit}.")
+            inline_max_bytes = inline_limit
+        self.inline_max_bytes = inline_max_bytes
+        self.analysis_flights = SingleFlight()
+        self._upload_paths = {"inline": 0, "file_api": 0, "reused": 0}
+        self._stats_lock = threading.Lock()
+
+    def run(self, job: Job, upload: SpooledUpload,
+            on_features: Optional[Callable[[MusicFeatures], None]] = None) -> Optional[Tuple[MusicFeatures, Dict[str, Any]]]:
+        """
+        Processes a buffered upload and releases its buffer when done.
+
+        :param on_features: Called with the extracted features before visualization
+                            starts, so they are kept even if image generation fails.
+        :return: (music_features, visualization_result) on success. On failure
+                 the job is failed with an error message and None is returned, so
+                 the caller only has to store state and finish the job.
+        """
+        try:
+            music_features = self._extract_features(job, upload)
+        finally:
+            upload.close()
+        if not music_features:
+            return None
+        if on_features:
+            on_features(music_features)
+
+        # 3. Visualization Generation (AI Service 2)
+        job.start_stage("visualization")
+        music_features_raw_string = json.dumps(prompt_features(music_features))
+        # Narration fragments and the image are published as they arrive, for clients streaming the job
+        result = self.generator.generate_visualization(music_features, music_features_raw_string, on_event=job.publish)
+
+        if result.get("status") != 200:
+            job.fail(result.get("error"), result.get("status"))
+            return None
+        job.complete_stage("visualization")
+        return music_features, result
+
+    def _extract_features(self, job: Job, upload: SpooledUpload) -> Optional[MusicFeatures]:
+        """Returns cached features for identical uploads, otherwise uploads and analyzes the file (once per in-flight upload)."""
+        upload.file.seek(0)
+        score_format = symbolic_format(upload.filename, upload.file.read(1024))
+        upload.file.seek(0)
+        if score_format:
+            return self._analyze_symbolic(job, upload, score_format)
+
+        cache_key = None
+        if self.feature_cache:
+            # Chunked and whole-file analyses of the same score are cached separately
+            analysis_version = f"{self.analyzer.prompt_version}:pages{self.pages_per_chunk}"
+            cache_key = FeatureCache.make_key(upload.sha256, self.analyzer.model, analysis_version)
+            cached_features = self.feature_cache.get(cache_key)
+            if cached_features:
+                job.skip_stage("upload")
+                job.skip_stage("analysis", "cached")
+                return MusicFeatures.from_dict(cached_features)
+
+        flight_key = (cache_key or upload.sha256, "analysis")
+        music_features, shared = self.analysis_flights.do(flight_key, self._upload_and_analyze, job, upload, cache_key)
+        if shared:
+            if not music_features:
+                job.fail("Failed to extract structured musical features.", 500)
+                return None
+            job.skip_stage("upload")
+            job.skip_stage("analysis", "coalesced")
+        return music_features
+
+    def _upload_and_analyze(self, job: Job, upload: SpooledUpload, cache_key: Optional[str]) -> Optional[MusicFeatures]:
+        """Uploads and analyzes one file, reporting stages on the job of the caller that runs it."""
+        chunks = split_pdf(upload.file, self.pages_per_chunk) if upload.mime_type == "application/pdf" else []
+        if chunks:
+            music_features, complete = self._analyze_chunks(job, chunks)
+        else:
+            music_features, complete = self._analyze_whole(job, upload), True
+        if not music_features:
+            return None
+
+        # A merge missing some chunks is still shown, but not cached as the score's analysis
+        if cache_key and complete:
+            self.feature_cache.put(cache_key, music_features.to_dict())
+        return music_features
+
+    def _analyze_symbolic(self, job: Job, upload: SpooledUpload, score_format: str) -> Optional[MusicFeatures]:
+        # Symbolic scores are parsed locally in milliseconds; nothing is uploaded or cached
+        job.skip_stage("upload", "local")
+        job.start_stage("analysis")
+        music_features = self.symbolic_analyzer.extract_features(upload.file, score_format)
+        if not music_features:
+            job.fail(f"Could not read the {score_format.upper()} file.", 400)
+            return None
+        job.complete_stage("analysis")
+        return music_features
+
+    def upload_stats(self) -> Dict[str, int]:
+        """How many files and chunks went inline, through a File API upload, or reused a registered upload."""
+        with self._stats_lock:
+            return dict(self._upload_paths)
+
+    def _count_upload(self, path: str, count: int = 1) -> None:
+        with self._stats_lock:
+            self._upload_paths[path] += count
+
+    def _analyze_whole(self, job: Job, upload: SpooledUpload) -> Optional[MusicFeatures]:
+        if upload.size <= self.inline_max_bytes:
+            return self._analyze_inline(job, upload)
+
+        # 1. API File Upload (Non-AI), streamed straight from the upload buffer, unless this score is already uploaded
+        reused = False
+        if self.file_registry:
+            uploaded_file = self.file_registry.get(upload.sha256)
+            reused = uploaded_file is not None
+        if reused:
+            job.skip_stage("upload", "reused")
+            self._count_upload("reused")
+        else:
+            job.start_stage("upload")
+            if self.file_registry:
+                uploaded_file = self.file_registry.upload(upload.sha256, upload.file, upload.mime_type)
+            else:
+                uploaded_file = self.file_manager.upload_to_api(upload.file, mime_type=upload.mime_type)
+            if not uploaded_file:
+                job.fail("Failed to upload file to processing API.", 500)
+                return None
+            job.complete_stage("upload")
+            self._count_upload("file_api")
+
+        # 2. Feature Extraction (AI Service 1)
+        job.start_stage("analysis")
+        music_features = self.analyzer.extract_features(uploaded_file)
+
+        if not self.file_registry:
+            self.file_manager.delete_api_file(uploaded_file)  # Clean up the Gemini File API resource
+        elif not music_features and reused:
+            # The handle may have been deleted remotely; the next attempt uploads afresh
+            self.file_registry.forget(uploaded_file, upload.sha256)
+
+        if not music_features:
+            job.fail("Failed to extract structured musical features.", 500)
+            return None
+        job.complete_stage("analysis")
+        return music_features
+
+    def _analyze_inline(self, job: Job, upload: SpooledUpload) -> Optional[MusicFeatures]:
+        # Small files ride along with the analysis request; nothing to upload or delete
+        job.skip_stage("upload", "inline")
+        self._count_upload("inline")
+        job.start_stage("analysis")
+        music_features = self.analyzer.extract_features(
+            types.Part.from_bytes(data=upload.read_bytes(), mime_type=upload.mime_type)
+        )
+        if not music_features:
+            job.fail("Failed to extract structured musical features.", 500)
+            return None
+        job.complete_stage("analysis")
+        return music_features
+
+    def _analyze_chunks(self, job: Job, chunks: List[PdfChunk]) -> Tuple[Optional[MusicFeatures], bool]:
+        """
+        Map-reduce analysis of a long PDF: all chunks are uploaded in parallel, then
+        analyzed in parallel, and the successful ones are merged in page order.
+        Returns (features, complete); features is None only if every chunk failed.
+        """
+        chunk_hashes = [hashlib.sha256(chunk.data).hexdigest() for chunk in chunks]
+        inline = [len(chunk.data) <= self.inline_max_bytes for chunk in chunks]
+        if all(inline):
+            job.skip_stage("upload", "inline")
+        else:
+            job.start_stage("upload")
+
+        def upload_chunk(chunk: PdfChunk, chunk_hash: str, is_inline: bool):
+            """Returns (file or inline part, reused)."""
+            if is_inline:
+                self._count_upload("inline")
+                return types.Part.from_bytes(data=chunk.data, mime_type="application/pdf"), False
+            if self.file_registry:
+                uploaded_file, reused = self.file_registry.acquire(chunk_hash, io.BytesIO(chunk.data), "application/pdf")
+            else:
+                uploaded_file, reused = self.file_manager.upload_to_api(io.BytesIO(chunk.data), mime_type="application/pdf"), False
+            if uploaded_file:
+                self._count_upload("reused" if reused else "file_api")
+            return uploaded_file, reused
+        uploaded_files, reused = zip(*self.executor.map(upload_chunk, chunks, chunk_hashes, inline))
+        if not any(uploaded_files):
+            job.fail("Failed to upload file to processing API.", 500)
+            return None, False
+        if not all(inline):
+            job.complete_stage("upload")
+
+        job.start_stage("analysis")
+
+        def analyze(chunk: PdfChunk, chunk_hash: str, is_inline: bool, was_reused: bool, uploaded_file) -> Optional[MusicFeatures]:
+            if not uploaded_file:
+                return None
+            features = None
+            try:
+                features = self.analyzer.extract_features(uploaded_file, (chunk.first_page, chunk.last_page, chunk.total_pages))
+                return features
+            finally:
+                # Inline chunks left nothing behind on the File API
+                if not is_inline and not self.file_registry:
+                    self.file_manager.delete_api_file(uploaded_file)
+                elif was_reused and not features:
+                    # Same policy as whole files: only a reused handle is suspect
+                    self.file_registry.forget(uploaded_file, chunk_hash)
+        results = list(self.executor.map(analyze, chunks, chunk_hashes, inline, reused, uploaded_files))
+
+        parts = [(chunk.first_page, chunk.last_page, features) for chunk, features in zip(chunks, results) if features]
+        if not parts:
+            job.fail("Failed to extract structured musical features.", 500)
+            return None, False
+        missing = [f"{chunk.first_page}-{chunk.last_page}" for chunk, features in zip(chunks, results) if not features]
+        if missing:
+            print(f"WARNING: Analysis failed for pages {', '.join(missing)}; merging the remaining chunks.")
+        job.complete_stage("analysis")
+        return merge_features(parts), not missing
@@ -0,0 +1,185 @@
+import json
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ..music_features import MusicFeatures
+from ..note_array import prompt_features
+from ..prompt_registry import PROMPTS
+from ..utils.local_db import LocalDatabase
+from .visualization_service import VisualizationGenerator
+
+
+class StylePrefetcher:
+    """
+    Speculatively generates alternate styles for a session's score so that
+    /api/regenerate can answer from a buffer instead of waiting on the models.
+
+    Up to `buffer_size` styles are kept ready per session, and at most
+    `budget_per_score` generations are spent on each uploaded score. All
+    session state lives in the shared database: the score being prefetched
+    for, the budget spent, and one row per style, which is a claim while the
+    style is being generated and holds the result once it is ready. So any
+    worker can serve, top up or cancel a session's prefetches, whichever
+    worker started them. Results carry the score id they were generated for
+    and are ignored once the session moves on to another score or expires.
+    """
+    def __init__(self, generator: VisualizationGenerator, db: LocalDatabase,
+                 is_current: Callable[[str, str], bool], buffer_size: int = 2, budget_per_score: int = 4,
+                 max_workers: int = 2, ttl_seconds: int = 3600):
+        self.generator = generator
+        self.db = db
+        self.is_current = is_current
+        self.buffer_size = buffer_size
+        self.budget_per_score = budget_per_score
+        self.ttl_seconds = ttl_seconds
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="style-prefetch")
+        # Generations queued by this process, so cancel() can drop the ones not started yet
+        self._futures: Dict[str, List[Future]] = {}
+        # Re-entrant: a future that is already done runs its callback inside _top_up
+        self._lock = threading.RLock()
+        with self.db.transaction() as conn:
+            # Superseded by prefetch_styles, whose rows also stand for generations in flight
+            conn.execute("DROP TABLE IF EXISTS prefetched_styles")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS prefetch_sessions ("
+                " session_id TEXT PRIMARY KEY, score_id TEXT NOT NULL, features TEXT NOT NULL,"
+                " generated INTEGER NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS prefetch_styles ("
+                " session_id TEXT NOT NULL, score_id TEXT NOT NULL, prompt_name TEXT NOT NULL,"
+                " result TEXT, created_at REAL NOT NULL, PRIMARY KEY (session_id, prompt_name))"
+            )
+
+    def start(self, session_id: str, score_id: str, features: MusicFeatures, shown_prompt: Optional[str]) -> None:
+        """Begins prefetching for a freshly analyzed score, replacing any earlier prefetches."""
+        if self.buffer_size <= 0:
+            return
+        self.cancel(session_id)
+        self.db.execute(
+            "INSERT OR REPLACE INTO prefetch_sessions (session_id, score_id, features, generated, created_at)"
+            " VALUES (?, ?, ?, 0, ?)",
+            (session_id, score_id, json.dumps(features.to_dict()), time.time()),
+        )
+        self._top_up(session_id, shown_prompt)
+
+    def take(self, session_id: str, score_id: str, exclude_prompt: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Pops a ready result for the session's current score, or None if the buffer is empty."""
+        self._sweep_expired()
+        with self.db.transaction() as conn:
+            conn.execute("DELETE FROM prefetch_styles WHERE session_id = ? AND score_id != ?", (session_id, score_id))
+            row = conn.execute(
+                "SELECT prompt_name, result FROM prefetch_styles"
+                " WHERE session_id = ? AND prompt_name != ? AND result IS NOT NULL ORDER BY created_at LIMIT 1",
+                (session_id, exclude_prompt or ""),
+            ).fetchone()
+            if row:
+                conn.execute("DELETE FROM prefetch_styles WHERE session_id = ? AND prompt_name = ?", (session_id, row[0]))
+
+        if row:
+            self._top_up(session_id, row[0])
+            return json.loads(row[1])
+        return None
+
+    def cancel(self, session_id: str) -> None:
+        """Drops buffered results and claims, e.g. when a new score is uploaded; generations in flight are discarded."""
+        with self._lock:
+            futures = self._futures.pop(session_id, [])
+        for future in futures:
+            future.cancel()
+        with self.db.transaction() as conn:
+            conn.execute("DELETE FROM prefetch_sessions WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM prefetch_styles WHERE session_id = ?", (session_id,))
+
+    def _top_up(self, session_id: str, shown_prompt: Optional[str]) -> None:
+        """Claims new styles until the buffer is full or the score's budget is spent, and queues them here."""
+        with self.db.transaction() as conn:
+            session = conn.execute(
+                "SELECT score_id, features, generated FROM prefetch_sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if not session:
+                return
+            score_id, features_json, generated = session
+            taken = {name for (name,) in conn.execute(
+                "SELECT prompt_name FROM prefetch_styles WHERE session_id = ? AND score_id = ?", (session_id, score_id)
+            )}
+            excluded = taken | {shown_prompt}
+            candidates = [p for p in PROMPTS.prompt_list() if p[0] not in excluded]
+            random.shuffle(candidates)
+            claimed = []
+            while candidates and len(taken) + len(claimed) < self.buffer_size and generated + len(claimed) < self.budget_per_score:
+                claimed.append(candidates.pop())
+            if not claimed:
+                return
+            now = time.time()
+            conn.executemany(
+                "INSERT INTO prefetch_styles (session_id, score_id, prompt_name, result, created_at) VALUES (?, ?, ?, NULL, ?)",
+                [(session_id, score_id, name, now) for name, _ in claimed],
+            )
+            conn.execute("UPDATE prefetch_sessions SET generated = generated + ? WHERE session_id = ?",
+                         (len(claimed), session_id))
+
+        features = MusicFeatures.from_dict(json.loads(features_json))
+        features_raw_string = json.dumps(prompt_features(features))
+        with self._lock:
+            futures = self._futures.setdefault(session_id, [])
+            for prompt in claimed:
+                future = self._pool.submit(self._generate, session_id, score_id, features, features_raw_string, prompt)
+                futures.append(future)
+                future.add_done_callback(lambda done, sid=session_id: self._forget(sid, done))
+
+    def _forget(self, session_id: str, future: Future) -> None:
+        with self._lock:
+            futures = self._futures.get(session_id)
+            if futures and future in futures:
+                futures.remove(future)
+                if not futures:
+                    del self._futures[session_id]
+
+    def _claimed(self, session_id: str, score_id: str, prompt_name: str) -> bool:
+        return self.db.execute(
+            "SELECT 1 FROM prefetch_styles WHERE session_id = ? AND score_id = ? AND prompt_name = ? AND result IS NULL",
+            (session_id, score_id, prompt_name),
+        ).fetchone() is not None
+
+    def _generate(self, session_id: str, score_id: str, features: MusicFeatures, features_raw_string: str,
+                  prompt: Tuple[str, str]) -> None:
+        # The session may have expired, moved on or been cancelled (by any worker) while this job was queued
+        if not self._claimed(session_id, score_id, prompt[0]) or not self.is_current(session_id, score_id):
+            return
+        try:
+            result = self.generator.generate_visualization(features, features_raw_string, prompt_to_use=prompt)
+        except Exception as e:
+            print(f"WARNING: Prefetching style {prompt[0]} failed: {e}")
+            result = {}
+        if result.get("status") != 200:
+            # Free the claim so a later top-up can try another style
+            self.db.execute(
+                "DELETE FROM prefetch_styles WHERE session_id = ? AND score_id = ? AND prompt_name = ? AND result IS NULL",
+                (session_id, score_id, prompt[0]),
+            )
+            return
+        result.setdefault("metadata", {})["prefetched"] = True
+        # A no-op if the claim was cancelled meanwhile
+        self.db.execute(
+            "UPDATE prefetch_styles SET result = ?, created_at = ?"
+            " WHERE session_id = ? AND score_id = ? AND prompt_name = ? AND result IS NULL",
+            (json.dumps(result), time.time(), session_id, score_id, prompt[0]),
+        )
+
+    def _sweep_expired(self) -> None:
+        """Forgets sessions that expired, and drops results nobody collected (or claims never filled) within the TTL."""
+        sessions = self.db.execute("SELECT session_id, score_id FROM prefetch_sessions").fetchall()
+        for session_id, score_id in sessions:
+            if not self.is_current(session_id, score_id):
+                self.cancel(session_id)
+        self.db.execute("DELETE FROM prefetch_styles WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+
+    def stats(self) -> Dict[str, int]:
+        in_flight, buffered = self.db.execute(
+            "SELECT COUNT(*) - COUNT(result), COUNT(result) FROM prefetch_styles"
+        ).fetchone()
+        return {"in_flight": in_flight, "buffered": buffered}
@@ -0,0 +1,238 @@
+import threading
+import time
+import uuid
+from typing import Any, BinaryIO, Dict, List, Optional, Union
+
+from google import genai
+from google.genai import types
+
+from ..utils.file_management import FileManagement
+from ..utils.file_registry import RemoteFileRegistry
+
+QA_SYSTEM_INSTRUCTION = """
+You are an expert musician and a patient teacher. The user is a novice who may not read music.
+Answer questions about the attached sheet music only, in plain language, naming the technical
+term in parentheses the first time you use it (e.g. 'getting louder (crescendo)').
+Refer to places in the score by measure number where you can.
+"""
+
+
+class ScoreQASession:
+    """
+    A conversation about one uploaded score. The file and the system
+    instruction live in an explicit context cache, so each question only sends
+    the question itself; the cache's TTL is extended while questions keep
+    coming, and close() deletes both the cache and the uploaded file.
+
+    If the cache can't be created (e.g. the score is below the model's minimum
+    cacheable size), the session still works by sending the file with every
+    question; `cached` tells which mode is in use.
+    """
+    def __init__(self, service: "ScoreQAService", uploaded_file: types.File, owner: str = "", registered: bool = False):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.service = service
+        self.uploaded_file = uploaded_file
+        # Registered uploads belong to the RemoteFileRegistry and outlive the session
+        self.registered = registered
+        self.cache: Optional[types.CachedContent] = None
+        self.expires_at = 0.0
+        self.last_used = time.time()
+        self.closed = False
+        self.questions = 0
+        self.usage = {"prompt_tokens": 0, "cached_tokens": 0, "output_tokens": 0}
+        self._lock = threading.Lock()
+
+    @property
+    def cached(self) -> bool:
+        return self.cache is not None
+
+    def ask(self, question: str) -> str:
+        """Answers one question about the score; raises on model errors or if the session is closed."""
+        with self._lock:
+            if self.closed:
+                raise RuntimeError("Q&A session is closed.")
+            self.service._keep_cache_alive(self)
+            if self.cache:
+                contents: List[Any] = [question]
+                config = types.GenerateContentConfig(cached_content=self.cache.name)
+            else:
+                contents = [self.uploaded_file, question]
+                config = types.GenerateContentConfig(system_instruction=self.service.system_instruction)
+        response = self.service.client.models.generate_content(model=self.service.model, contents=contents, config=config)
+        with self._lock:
+            self.questions += 1
+            self.last_used = time.time()
+            usage = getattr(response, "usage_metadata", None)
+            if usage:
+                self.usage["prompt_tokens"] += usage.prompt_token_count or 0
+                self.usage["cached_tokens"] += usage.cached_content_token_count or 0
+                self.usage["output_tokens"] += usage.candidates_token_count or 0
+        return (response.text or "").strip()
+
+    def close(self) -> None:
+        """Releases the cached context and the uploaded file; safe to call more than once."""
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            cache, self.cache = self.cache, None
+        self.service._release(self, cache)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.id,
+            "cached": self.cached,
+            "expires_at": self.expires_at if self.cached else None,
+            "questions": self.questions,
+            "usage": dict(self.usage),
+        }
+
+    def __enter__(self) -> "ScoreQASession":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+class ScoreQAService:
+    """
+    Opens and tracks ScoreQASessions. Sessions idle for longer than
+    `ttl_seconds` are closed (releasing their cache and file) the next time
+    any session is opened or looked up; the cache's own TTL matches, so
+    nothing outlives an abandoned session for long even if this process dies.
+
+    With a `file_registry`, a score that was already uploaded (e.g. for its
+    analysis) is not uploaded again, and its file is left to the registry.
+
+    Works with any client exposing files.upload/delete, caches.create/update/delete
+    and models.generate_content, so a local stand-in can replace the Gemini client.
+    """
+    def __init__(self, client: genai.Client, model: str = "gemini-2.5-flash", ttl_seconds: int = 600,
+                 system_instruction: str = QA_SYSTEM_INSTRUCTION, max_sessions: int = 100,
+                 file_registry: Optional[RemoteFileRegistry] = None):
+        self.client = client
+        self.file_manager = FileManagement(client)
+        self.file_registry = file_registry
+        self.model = model
+        self.ttl_seconds = ttl_seconds
+        self.system_instruction = system_instruction.strip()
+        self.max_sessions = max_sessions
+        self._sessions: Dict[str, ScoreQASession] = {}
+        self._lock = threading.Lock()
+        self._counters = {"opened": 0, "cached": 0, "uncached": 0, "closed": 0, "expired": 0}
+
+    def open(self, source: Union[str, BinaryIO], mime_type: Optional[str] = None, owner: str = "",
+             content_hash: Optional[str] = None) -> Optional[ScoreQASession]:
+        """
+        Uploads the score and caches it with the system instruction; None if the upload fails.
+        Pass the sha256 of the score as `content_hash` to reuse its registered upload.
+        """
+        self.sweep()
+        with self._lock:
+            if len(self._sessions) >= self.max_sessions:
+                print("WARNING: Too many open Q&A sessions; closing the least recently used one.")
+                oldest = min(self._sessions.values(), key=lambda session: session.last_used)
+            else:
+                oldest = None
+        if oldest:
+            self.close(oldest.id)
+
+        registered = bool(self.file_registry and content_hash)
+        if registered:
+            uploaded_file, _ = self.file_registry.acquire(content_hash, source, mime_type)
+        else:
+            uploaded_file = self.file_manager.upload_to_api(source, mime_type=mime_type)
+        if not uploaded_file:
+            return None
+        session = ScoreQASession(self, uploaded_file, owner, registered)
+        self._create_cache(session)
+        with self._lock:
+            self._sessions[session.id] = session
+            self._counters["opened"] += 1
+            self._counters["cached" if session.cached else "uncached"] += 1
+        return session
+
+    def get(self, session_id: str, owner: Optional[str] = None) -> Optional[ScoreQASession]:
+        """The open session with this id (and owner, if given); None if unknown, closed or expired."""
+        self.sweep()
+        with self._lock:
+            session = self._sessions.get(session_id)
+        if not session or (owner is not None and session.owner != owner):
+            return None
+        return session
+
+    def close(self, session_id: str) -> bool:
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if not session:
+            return False
+        session.close()
+        with self._lock:
+            self._counters["closed"] += 1
+        return True
+
+    def close_all(self) -> None:
+        with self._lock:
+            session_ids = list(self._sessions)
+        for session_id in session_ids:
+            self.close(session_id)
+
+    def sweep(self) -> int:
+        """Closes sessions idle for longer than the TTL; returns how many were closed."""
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            expired = [session_id for session_id, session in self._sessions.items() if session.last_used < cutoff]
+        for session_id in expired:
+            self.close(session_id)
+        with self._lock:
+            self._counters["expired"] += len(expired)
+        return len(expired)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._counters, "open": len(self._sessions)}
+
+    def _create_cache(self, session: ScoreQASession) -> None:
+        try:
+            session.cache = self.client.caches.create(
+                model=self.model,
+                config=types.CreateCachedContentConfig(
+                    contents=[session.uploaded_file],
+                    system_instruction=self.system_instruction,
+                    display_name=f"score-qa-{session.id[:8]}",
+                    ttl=f"{self.ttl_seconds}s",
+                ),
+            )
+            session.expires_at = time.time() + self.ttl_seconds
+            print(f"Context cache created for Q&A session: {session.cache.name}")
+        except Exception as e:
+            print(f"WARNING: Could not cache the score, questions will resend it: {e}")
+            session.cache = None
+
+    def _keep_cache_alive(self, session: ScoreQASession) -> None:
+        """Extends the cache once less than half its TTL is left, or recreates it if it already expired."""
+        if not session.cache:
+            return
+        remaining = session.expires_at - time.time()
+        if remaining <= 0:
+            session.cache = None
+            self._create_cache(session)
+        elif remaining < self.ttl_seconds / 2:
+            try:
+                self.client.caches.update(
+                    name=session.cache.name, config=types.UpdateCachedContentConfig(ttl=f"{self.ttl_seconds}s")
+                )
+                session.expires_at = time.time() + self.ttl_seconds
+            except Exception as e:
+                print(f"WARNING: Could not extend context cache {session.cache.name}: {e}")
+
+    def _release(self, session: ScoreQASession, cache: Optional[types.CachedContent]) -> None:
+        if cache:
+            try:
+                self.client.caches.delete(name=cache.name)
+                print(f"Context cache deleted: {cache.name}")
+            except Exception as e:
+                print(f"WARNING: Failed to delete context cache {cache.name}: {e}")
+        if not session.registered:
+            self.file_manager.delete_api_file(session.uploaded_file)
@@ -0,0 +1,583 @@
+import json
+import math
+import os
+import struct
+import zipfile
+import xml.etree.ElementTree as ET
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from ..music_features import SCHEMA_VERSION, Change, Dynamics, Motif, MusicFeatures, Note, Section, Tempo
+from ..note_array import beat_length, pitch_name
+
+MUSICXML, MXL, MIDI = "musicxml", "mxl", "midi"
+SYMBOLIC_EXTENSIONS = {".musicxml": MUSICXML, ".xml": MUSICXML, ".mxl": MXL, ".mid": MIDI, ".midi": MIDI}
+
+_MAJOR_KEYS = ["Cb", "Gb", "Db", "Ab", "Eb", "Bb", "F", "C", "G", "D", "A", "E", "B", "F#", "C#"]
+_MINOR_KEYS = ["Ab", "Eb", "Bb", "F", "C", "G", "D", "A", "E", "B", "F#", "C#", "G#", "D#", "A#"]
+_STEPS = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11}
+
+# (highest bpm, term, beginner description)
+_TEMPO_TERMS = [
+    (60, "Largo", "very slow and broad"), (76, "Adagio", "slow and calm"), (108, "Andante", "a walking pace"),
+    (120, "Moderato", "a moderate, steady speed"), (168, "Allegro", "fast and lively"), (math.inf, "Presto", "very fast"),
+]
+_DYNAMIC_DESCRIPTIONS = {
+    "ppp": "extremely soft", "pp": "very soft", "p": "soft", "mp": "moderately soft",
+    "mf": "moderately loud", "f": "loud", "ff": "very loud", "fff": "extremely loud",
+}
+# Direction words that mark a change of pace rather than a tempo
+_TEMPO_CHANGES = ("rit", "rall", "accel", "a tempo", "tempo i", "poco a poco", "stringendo", "allargando")
+# (upper MIDI velocity bound, dynamic marking)
+_VELOCITY_LEVELS = [(32, "pp"), (48, "p"), (64, "mp"), (80, "mf"), (96, "f"), (128, "ff")]
+# Note value names by length in quarter notes, for readable durations
+_DURATION_NAMES = {
+    4.0: "whole note", 3.0: "dotted half note", 2.0: "half note", 1.5: "dotted quarter note",
+    1.0: "quarter note", 0.75: "dotted eighth note", 0.5: "eighth note", 0.375: "dotted sixteenth note",
+    0.25: "sixteenth note", 0.125: "thirty-second note",
+}
+_TYPE_BEATS = {"whole": 4.0, "half": 2.0, "quarter": 1.0, "eighth": 0.5, "16th": 0.25, "32nd": 0.125, "64th": 0.0625}
+
+
+def symbolic_format(filename: str, head: bytes) -> Optional[str]:
+    """
+    Identifies MusicXML, compressed MusicXML (.mxl) and Standard MIDI uploads
+    from their leading bytes, using the extension only to tell plain XML
+    apart. Returns None for anything else (PDFs, images, ...).
+    """
+    if head.startswith(b"MThd"):
+        return MIDI
+    ext = os.path.splitext(filename or "")[1].lower()
+    if head.startswith(b"PK") and SYMBOLIC_EXTENSIONS.get(ext) == MXL:
+        return MXL
+    if (b"<score-partwise" in head or b"<!DOCTYPE score-partwise" in head
+            or (head.lstrip().startswith(b"<") and SYMBOLIC_EXTENSIONS.get(ext) == MUSICXML)):
+        return MUSICXML
+    return None
+
+
+@dataclass(slots=True)
+class _ParsedNote:
+    part: str
+    measure: int
+    onset: float  # Quarter notes from the start of the score
+    beat: float  # Quarter notes from the start of its measure, 1-based
+    duration: float
+    midi: int
+    dynamic: str
+    type_name: str = ""
+    staccato: bool = False
+
+
+@dataclass(slots=True)
+class _ParsedScore:
+    title: str = ""
+    composer: str = ""
+    fifths: Optional[int] = None
+    mode: str = "major"
+    time_signature: Optional[Tuple[int, int]] = None
+    bpm: Optional[float] = None
+    tempo_words: str = ""
+    notes: List[_ParsedNote] = field(default_factory=list)
+    # (measure, kind, text) for dynamics and tempo changes after the opening
+    changes: List[Tuple[int, str, str]] = field(default_factory=list)
+    boundaries: set = field(default_factory=set)  # Measures that start a new section
+    slurred_notes: int = 0
+
+
+class SymbolicAnalyzer:
+    """
+    Builds MusicFeatures straight from symbolic scores (MusicXML, .mxl, MIDI)
+    without the File API or a model call, so they are analyzed in milliseconds
+    and keep exact note data. Files are read incrementally: MusicXML through
+    iterparse with each measure discarded once read, MIDI one track at a time.
+
+    Descriptions are derived with fixed rules (tempo ranges, key mode, melodic
+    contour), so the same file always gives the same features.
+    """
+    def __init__(self, sample_measures: int = 8):
+        self.sample_measures = sample_measures
+        self.model = "symbolic-parser"
+        # Part of the feature cache key: bump when the parser's output changes (2: beats in the main beat, 3: change lists)
+        self.prompt_version = f"3:{SCHEMA_VERSION}"
+
+    def extract_features(self, stream: BinaryIO, fmt: str) -> Optional[MusicFeatures]:
+        """Parses a MUSICXML, MXL or MIDI stream; returns None (and logs) if the file can't be read."""
+        try:
+            stream.seek(0)
+            if fmt == MIDI:
+                score = self._parse_midi(stream)
+            elif fmt == MXL:
+                with zipfile.ZipFile(stream) as archive, archive.open(self._mxl_root(archive)) as xml_stream:
+                    score = self._parse_musicxml(xml_stream)
+            else:
+                score = self._parse_musicxml(stream)
+        except (ET.ParseError, zipfile.BadZipFile, KeyError, IndexError, ValueError, struct.error) as e:
+            print(f"ERROR: Could not parse {fmt} score: {e}")
+            return None
+        if not score.notes:
+            print(f"ERROR: No notes found in {fmt} score.")
+            return None
+        return self._features(score)
+
+    # ------------------------------------------------------------------
+    # MusicXML
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _mxl_root(archive: zipfile.ZipFile) -> str:
+        """The score inside an .mxl archive, as named by META-INF/container.xml."""
+        try:
+            container = ET.fromstring(archive.read("META-INF/container.xml"))
+            for element in container.iter():
+                if _local(element.tag) == "rootfile" and element.get("full-path"):
+                    return element.get("full-path")
+        except KeyError:
+            pass
+        names = [name for name in archive.namelist() if name.endswith((".xml", ".musicxml")) and not name.startswith("META-INF")]
+        if not names:
+            raise ValueError("No score found in .mxl archive")
+        return names[0]
+
+    def _parse_musicxml(self, stream: BinaryIO) -> _ParsedScore:
+        score = _ParsedScore()
+        part_names: Dict[str, str] = {}
+        staves: Dict[str, int] = {}
+        divisions = 1.0
+        part = ""
+        measure_number = 0
+        measure_start = 0.0
+        cursor = 0.0  # Position inside the current measure, in quarter notes
+        measure_length = 0.0
+        last_onset = 0.0
+        dynamic = "mf"
+        open_ties: Dict[Tuple[str, int], _ParsedNote] = {}
+
+        for event, element in ET.iterparse(stream, events=("start", "end")):
+            tag = _local(element.tag)
+            if event == "start":
+                if tag == "part" and element.get("id") is not None:
+                    part = element.get("id")
+                    measure_start, dynamic = 0.0, "mf"
+                elif tag == "measure":
+                    measure_number = _int(element.get("number"), measure_number + 1)
+                    cursor = measure_length = 0.0
+                continue
+
+            if tag in ("work-title", "movement-title") and not score.title:
+                score.title = (element.text or "").strip()
+            elif tag == "creator" and element.get("type") == "composer" and not score.composer:
+                score.composer = (element.text or "").strip()
+            elif tag == "score-part":
+                part_names[element.get("id", "")] = (_child_text(element, "part-name") or element.get("id", "")).strip()
+            elif tag == "attributes":
+                divisions = float(_child_text(element, "divisions") or divisions)
+                staves[part] = _int(_child_text(element, "staves"), staves.get(part, 1))
+                key, time = _child(element, "key"), _child(element, "time")
+                if key is not None and score.fifths is None:
+                    score.fifths = _int(_child_text(key, "fifths"), 0)
+                    score.mode = (_child_text(key, "mode") or "major").lower()
+                if time is not None and score.time_signature is None:
+                    score.time_signature = (_int(_child_text(time, "beats"), 4), _int(_child_text(time, "beat-type"), 4))
+                element.clear()
+            elif tag in ("backup", "forward"):
+                step = float(_child_text(element, "duration") or 0) / divisions
+                cursor = max(0.0, cursor - step) if tag == "backup" else cursor + step
+                measure_length = max(measure_length, cursor)
+                element.clear()
+            elif tag == "direction":
+                level, words, bpm = None, "", None
+                for child in element.iter():
+                    child_tag = _local(child.tag)
+                    if child_tag in _DYNAMIC_DESCRIPTIONS:
+                        level = child_tag
+                    elif child_tag == "words" and child.text:
+                        words = child.text.strip()
+                    elif child_tag == "per-minute" and child.text:
+                        bpm = _float(child.text)
+                    elif child_tag == "sound" and child.get("tempo"):
+                        bpm = _float(child.get("tempo"))
+                    elif child_tag == "rehearsal" and measure_number > 1:
+                        score.boundaries.add(measure_number)
+                if level:
+                    if measure_number > 1 and level != dynamic:
+                        score.changes.append((measure_number, "Dynamics", level))
+                    dynamic = level
+                if score.bpm is None and bpm:
+                    score.bpm = bpm
+                if _tempo_term(words) or words.lower().startswith(_TEMPO_CHANGES):
+                    if measure_number <= 1 and not score.tempo_words:
+                        score.tempo_words = words
+                    elif measure_number > 1:
+                        score.changes.append((measure_number, "Tempo", words))
+                element.clear()
+            elif tag == "barline":
+                if _child_text(element, "bar-style") in ("light-light", "light-heavy", "heavy-heavy"):
+                    score.boundaries.add(measure_number + (0 if element.get("location") == "left" else 1))
+                element.clear()
+            elif tag == "note":
+                duration = float(_child_text(element, "duration") or 0) / divisions
+                is_chord = _child(element, "chord") is not None
+                onset_in_measure = last_onset if is_chord else cursor
+                if not is_chord:
+                    cursor += duration
+                    measure_length = max(measure_length, cursor)
+                pitch = _child(element, "pitch")
+                if pitch is None or _child(element, "grace") is not None:
+                    element.clear()
+                    continue
+                last_onset = onset_in_measure
+                midi = (_int(_child_text(pitch, "octave"), 4) + 1) * 12 + _STEPS.get(_child_text(pitch, "step") or "C", 0) \
+                    + round(_float(_child_text(pitch, "alter")) or 0)
+                ties = {tie.get("type") for tie in element.iter() if _local(tie.tag) in ("tie", "tied")}
+                staff = _int(_child_text(element, "staff"), 1)
+                hand = ("RH" if staff == 1 else "LH") if staves.get(part, 1) == 2 else part_names.get(part, part)
+                tie_key = (hand, midi)
+                if "stop" in ties and tie_key in open_ties:
+                    # Tied continuation: lengthen the note it continues instead of adding one
+                    open_ties[tie_key].duration += duration
+                    if "start" not in ties:
+                        del open_ties[tie_key]
+                    element.clear()
+                    continue
+                type_name = _child_text(element, "type") or ""
+                dots = sum(1 for child in element if _local(child.tag) == "dot")
+                note = _ParsedNote(
+                    part=hand, measure=measure_number, onset=measure_start + onset_in_measure,
+                    beat=1 + onset_in_measure, duration=duration, midi=midi, dynamic=dynamic,
+                    type_name=(("dotted " * dots) + type_name).strip() if type_name else "",
+                    staccato=any(_local(child.tag) in ("staccato", "staccatissimo") for child in element.iter()),
+                )
+                if any(_local(child.tag) == "slur" for child in element.iter()):
+                    score.slurred_notes += 1
+                if "start" in ties:
+                    open_ties[tie_key] = note
+                score.notes.append(note)
+                element.clear()
+            elif tag == "measure":
+                measure_start += measure_length
+                element.clear()
+
+        score.notes.sort(key=lambda note: (note.onset, note.part, note.midi))
+        return score
+
+    # ------------------------------------------------------------------
+    # MIDI
+    # ------------------------------------------------------------------
+    def _parse_midi(self, stream: BinaryIO) -> _ParsedScore:
+        score = _ParsedScore()
+        chunk_type, length = struct.unpack(">4sI", stream.read(8))
+        if chunk_type != b"MThd":
+            raise ValueError("Not a Standard MIDI file")
+        _, track_count, division = struct.unpack(">HHH", stream.read(6))
+        stream.read(length - 6)
+        if division & 0x8000:
+            raise ValueError("SMPTE time division is not supported")
+
+        tracks: List[Tuple[str, List[Tuple[int, int, int, int]]]] = []  # (name, [(start, end, pitch, velocity)])
+        for index in range(track_count):
+            header = stream.read(8)
+            if len(header) < 8:
+                break
+            chunk_type, length = struct.unpack(">4sI", header)
+            data = stream.read(length)
+            if chunk_type == b"MTrk":
+                tracks.append(self._midi_track(data, score, index))
+
+        # Named tracks keep their names; a lone piano track is split at middle C
+        note_tracks = [(name, notes) for name, notes in tracks if notes]
+        if len(note_tracks) == 1:
+            name, notes = note_tracks[0]
+            note_tracks = [("RH", [n for n in notes if n[2] >= 60]), ("LH", [n for n in notes if n[2] < 60])]
+        elif len(note_tracks) == 2 and not all(name for name, _ in note_tracks):
+            note_tracks = [("RH", note_tracks[0][1]), ("LH", note_tracks[1][1])]
+
+        beats, beat_type = score.time_signature or (4, 4)
+        measure_length = beats * 4 / beat_type
+        for number, (name, notes) in enumerate(note_tracks, start=1):
+            hand = name or f"Track {number}"
+            for start, end, pitch, velocity in notes:
+                onset = _quantize(start / division)
+                measure = int(onset // measure_length) + 1
+                score.notes.append(_ParsedNote(
+                    part=hand, measure=measure, onset=onset, beat=1 + onset - (measure - 1) * measure_length,
+                    duration=max(_quantize((end - start) / division), 1 / 48), midi=pitch,
+                    dynamic=next(level for bound, level in _VELOCITY_LEVELS if velocity < bound),
+                ))
+        score.notes.sort(key=lambda note: (note.onset, note.part, note.midi))
+
+        # Notes held for less than 60% of the gap to the next note in their part sound detached
+        by_part: Dict[str, List[_ParsedNote]] = {}
+        for note in score.notes:
+            by_part.setdefault(note.part, []).append(note)
+        for notes in by_part.values():
+            for note, following in zip(notes, notes[1:]):
+                gap = following.onset - note.onset
+                note.staccato = gap > 0 and note.duration < 0.6 * gap
+        # Velocities vary note to note, so changes are tracked on each measure's most common level
+        current = ""
+        for measure, group in sorted(_group(score.notes, lambda note: note.measure).items()):
+            level = Counter(note.dynamic for note in group).most_common(1)[0][0]
+            if current and level != current:
+                score.changes.append((measure, "Dynamics", level))
+            current = level
+        return score
+
+    @staticmethod
+    def _midi_track(data: bytes, score: _ParsedScore, index: int) -> Tuple[str, List[Tuple[int, int, int, int]]]:
+        """Reads one MTrk chunk: returns (track name, [(start, end, pitch, velocity)]) and fills score metadata."""
+        position, tick, status, name = 0, 0, 0, ""
+        open_notes: Dict[Tuple[int, int], List[Tuple[int, int]]] = {}
+        notes: List[Tuple[int, int, int, int]] = []
+        while position < len(data):
+            delta, position = _read_varlen(data, position)
+            tick += delta
+            if data[position] & 0x80:
+                status = data[position]
+                position += 1
+            if status == 0xFF:
+                meta_type = data[position]
+                length, position = _read_varlen(data, position + 1)
+                payload = data[position:position + length]
+                position += length
+                if meta_type == 0x03 and not name:
+                    name = payload.decode("latin-1").strip()
+                elif meta_type == 0x51 and score.bpm is None and length == 3:
+                    score.bpm = round(60_000_000 / int.from_bytes(payload, "big"), 1)
+                elif meta_type == 0x58 and score.time_signature is None and length >= 2:
+                    score.time_signature = (payload[0], 2 ** payload[1])
+                elif meta_type == 0x59 and score.fifths is None and length == 2:
+                    score.fifths = struct.unpack("b", payload[:1])[0]
+                    score.mode = "minor" if payload[1] else "major"
+                elif meta_type == 0x2F:
+                    break
+            elif status in (0xF0, 0xF7):
+                length, position = _read_varlen(data, position)
+                position += length
+            else:
+                kind, channel = status & 0xF0, status & 0x0F
+                if kind in (0xC0, 0xD0):
+                    position += 1
+                    continue
+                pitch, velocity = data[position], data[position + 1]
+                position += 2
+                if kind == 0x90 and velocity > 0:
+                    open_notes.setdefault((channel, pitch), []).append((tick, velocity))
+                elif kind == 0x80 or (kind == 0x90 and velocity == 0):
+                    started = open_notes.get((channel, pitch))
+                    if started:
+                        start, start_velocity = started.pop(0)
+                        notes.append((start, tick, pitch, start_velocity))
+        if index == 0 and name and not notes:
+            score.title = name  # In type-1 files the first (tempo) track usually carries the song title
+            name = ""
+        return name, sorted(notes)
+
+    # ------------------------------------------------------------------
+    # Features
+    # ------------------------------------------------------------------
+    def _features(self, score: _ParsedScore) -> MusicFeatures:
+        notes = score.notes
+        beats, beat_type = score.time_signature or (4, 4)
+        term, tempo_description = _tempo_from(score.bpm, score.tempo_words)
+        opening = notes[0].dynamic
+        staccato_share = sum(note.staccato for note in notes) / len(notes)
+        articulation = "sharp/staccato" if staccato_share > 0.5 else "smoothly (legato)"
+        key = "Unknown"
+        if score.fifths is not None and -7 <= score.fifths <= 7:
+            names = _MINOR_KEYS if score.mode == "minor" else _MAJOR_KEYS
+            key = f"{names[score.fifths + 7]} {'Minor' if score.mode == 'minor' else 'Major'}"
+
+        changes = sorted(dict.fromkeys(score.changes))  # Parts repeat the same marks
+        first_measure = notes[0].measure
+        # Beats are counted in the main beat (dotted quarters in 6/8), as the analysis prompt asks the model to
+        unit = beat_length(f"{beats}/{beat_type}")
+        sample = [
+            Note(hand=note.part, measure=note.measure, beat=round(1 + (note.beat - 1) / unit, 3), pitch=pitch_name(note.midi),
+                 duration=_note_duration_name(note),
+                 dynamic=note.dynamic)
+            for note in notes if note.measure < first_measure + self.sample_measures
+        ]
+        return MusicFeatures(
+            title=score.title,
+            composer=score.composer or "Unknown",
+            key_signature=key,
+            time_signature=f"{beats}/{beat_type}",
+            initial_tempo=Tempo(bpm=f"{score.bpm:g}" if score.bpm else "", description=tempo_description, term=term),
+            initial_dynamics=Dynamics(level=opening, description=_DYNAMIC_DESCRIPTIONS.get(opening, ""), articulation=articulation),
+            overall_mood=_mood(score.mode, score.bpm or 100),
+            structural_analysis=self._sections(score),
+            repeating_motifs=self._motifs(notes),
+            tempo_changes=[Change(measure=measure, description=text) for measure, kind, text in changes if kind == "Tempo"],
+            dynamic_changes=[Change(measure=measure, description=_DYNAMIC_DESCRIPTIONS[text], level=text)
+                             for measure, kind, text in changes if kind == "Dynamics"],
+            notes_sample=sample,
+            beat_unit=unit,
+        )
+
+    def _sections(self, score: _ParsedScore) -> List[Section]:
+        """Sections between double bars / rehearsal marks (or every 8 measures), plus tempo and dynamics changes."""
+        last_measure = max(note.measure for note in score.notes)
+        first_measure = min(note.measure for note in score.notes)
+        starts = sorted({first_measure} | {m for m in score.boundaries if first_measure < m <= last_measure})
+        if len(starts) == 1 and last_measure - first_measure >= 16:
+            starts = list(range(first_measure, last_measure + 1, 8))
+        melody_part = max({note.part for note in score.notes},
+                          key=lambda part: sum(n.midi for n in score.notes if n.part == part) / sum(1 for n in score.notes if n.part == part))
+
+        sections: List[Section] = []
+        letters: Dict[Tuple[int, ...], str] = {}
+        for start, end in zip(starts, starts[1:] + [last_measure + 1]):
+            melody = [n.midi for n in score.notes if n.part == melody_part and start <= n.measure < end]
+            if not melody:
+                continue
+            signature = tuple(melody[:8])
+            letters.setdefault(signature, chr(ord("A") + min(len(letters), 25)))
+            common = sorted(pitch for pitch, _ in Counter(melody).most_common(4))
+            sections.append(Section(
+                section_id=letters[signature],
+                feature_focus="Melody",
+                description=f"Measures {start}-{end - 1}: {_contour(melody)}",
+                pitch_range_midinotes=json.dumps(common),
+            ))
+        for measure, kind, text in dict.fromkeys(score.changes):  # Parts repeat the same marks
+            description = (f"The volume changes to {_DYNAMIC_DESCRIPTIONS[text]} ({text})." if kind == "Dynamics"
+                           else f"The pace changes: {text.rstrip('.')}.")
+            sections.append(Section(section_id=f"{kind} (m. {measure})", feature_focus=kind, description=description))
+        return sections
+
+    @staticmethod
+    def _motifs(notes: List[_ParsedNote]) -> List[Motif]:
+        motifs = []
+        # Rhythm: the most common sequence of note lengths within a measure, per part
+        rhythms: Counter = Counter()
+        for (part, measure), group in _group(notes, lambda note: (note.part, note.measure)).items():
+            onsets = sorted({note.onset for note in group})
+            lengths = tuple(round(b - a, 3) for a, b in zip(onsets, onsets[1:] + [max(n.onset + n.duration for n in group)]))
+            rhythms[lengths] += 1
+        if rhythms:
+            # Ties go to the busier pattern: a held accompaniment chord is rarely the motif
+            pattern, count = max(rhythms.items(), key=lambda item: (item[1], len(item[0])))
+            if count >= 2:
+                motifs.append(Motif(
+                    type="Rhythmic",
+                    description=f"The rhythm {' - '.join(_duration_name(length) for length in pattern)} repeats "
+                                f"in {count} measures across the parts.",
+                    duration="1 measure",
+                ))
+        # Melody: the most common four-note figure (as intervals) in any part
+        figures: Counter = Counter()
+        for part, group in _group(notes, lambda note: note.part).items():
+            line = [note.midi for note in sorted(group, key=lambda note: (note.onset, -note.midi))]
+            for i in range(len(line) - 3):
+                figures[tuple(b - a for a, b in zip(line[i:i + 4], line[i + 1:i + 4]))] += 1
+        if figures:
+            figure, count = figures.most_common(1)[0]
+            if count >= 3 and any(figure):
+                motifs.append(Motif(
+                    type="Melodic",
+                    description=f"A four-note figure (steps {', '.join(f'{step:+d}' for step in figure)} semitones) returns {count} times.",
+                    duration="4 notes",
+                ))
+        return motifs
+
+
+def _local(tag) -> str:
+    """Tag name without an XML namespace."""
+    return tag.rsplit("}", 1)[-1] if isinstance(tag, str) else ""
+
+
+def _child(element: ET.Element, name: str) -> Optional[ET.Element]:
+    return next((child for child in element if _local(child.tag) == name), None)
+
+
+def _child_text(element: ET.Element, name: str) -> Optional[str]:
+    child = _child(element, name)
+    return child.text.strip() if child is not None and child.text else None
+
+
+def _int(value: Optional[str], default: int) -> int:
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return default
+
+
+def _float(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _read_varlen(data: bytes, position: int) -> Tuple[int, int]:
+    value = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value, position
+
+
+def _quantize(quarters: float) -> float:
+    """Snaps to the nearest 1/48 of a quarter note, which covers triplets and 32nds."""
+    return round(quarters * 48) / 48
+
+
+def _duration_name(quarters: float) -> str:
+    for length, name in _DURATION_NAMES.items():
+        if abs(quarters - length) < 0.01:
+            return name
+    return f"{round(quarters, 3):g}"  # Beats, as note_array.duration_beats() reads them
+
+
+def _note_duration_name(note: _ParsedNote) -> str:
+    """The printed type (e.g. 'dotted quarter note') if it is the note's exact length; else the exact length."""
+    *dots, base = note.type_name.split(" ") if note.type_name else [""]
+    if base in _TYPE_BEATS:
+        printed = _TYPE_BEATS[base] * (2 - 0.5 ** len(dots))
+        # Ties and tuplets make the sounding length differ from the printed type
+        if abs(printed - note.duration) < 0.01:
+            return f"{note.type_name} note"
+    return _duration_name(note.duration)
+
+
+def _tempo_term(words: str) -> Optional[str]:
+    lowered = (words or "").lower()
+    return next((term for _, term, _ in _TEMPO_TERMS if term.lower() in lowered), None)
+
+
+def _tempo_from(bpm: Optional[float], words: str) -> Tuple[str, str]:
+    """(term, description) from a written tempo word, else from the metronome mark."""
+    term = _tempo_term(words)
+    if term:
+        description = next(description for _, name, description in _TEMPO_TERMS if name == term)
+        return term, description
+    if bpm:
+        _, term, description = next(entry for entry in _TEMPO_TERMS if bpm <= entry[0])
+        return term, description
+    return "Moderato", "a moderate, steady speed"
+
+
+def _mood(mode: str, bpm: float) -> str:
+    fast = bpm >= 108
+    if mode == "minor":
+        return "Restless and dramatic" if fast else "Melancholy and reflective"
+    return "Bright and lively" if fast else "Calm and warm"
+
+
+def _contour(melody: List[int]) -> str:
+    steps = [abs(b - a) for a, b in zip(melody, melody[1:])]
+    motion = "moving mostly by step" if steps and sorted(steps)[len(steps) // 2] <= 2 else "moving in leaps"
+    change = melody[-1] - melody[0]
+    direction = "rises" if change > 2 else "falls" if change < -2 else "circles around"
+    return (f"the melody {direction} between {pitch_name(min(melody))} and {pitch_name(max(melody))}, "
+            f"{motion}.")
+
+
+def _group(notes: List[_ParsedNote], key) -> Dict:
+    groups: Dict = {}
+    for note in notes:
+        groups.setdefault(key(note), []).append(note)
+    return groups
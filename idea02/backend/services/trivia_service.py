@@ -0,0 +1,107 @@
+import itertools
+import json
+import re
+import threading
+from typing import List, Optional
+from google import genai
+from google.genai import types
+
+FALLBACK_TRIVIA = "Music is the space between the notes. - Claude Debussy"
+
+
+class TriviaPool:
+    """
+    Server-side pool of music trivia, refilled by a background thread.
+
+    Each model call fetches a whole batch of facts, which are deduplicated and
+    appended; beyond `max_size` the oldest facts are dropped, so the pool keeps
+    rotating. Serving a fact is an O(1) in-memory read, so polling clients never
+    trigger model calls.
+    """
+    def __init__(self, client: genai.Client, model: str = "gemini-2.5-flash", batch_size: int = 20,
+                 min_size: int = 10, max_size: int = 200, refresh_interval: float = 900.0, retry_interval: float = 30.0):
+        self.client = client
+        self.model = model
+        self.batch_size = batch_size
+        self.min_size = min_size
+        self.max_size = max_size
+        self.refresh_interval = refresh_interval
+        self.retry_interval = retry_interval
+        # Replaced as a whole on refill, so readers can use it without a lock
+        self._facts: List[str] = []
+        self._seen = set()
+        self._cursor = itertools.count()
+        self._wake = threading.Event()
+        self._write_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Starts the background refill thread (idempotent)."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._refill_loop, name="trivia-refill", daemon=True)
+            self._thread.start()
+
+    def next(self) -> Optional[str]:
+        """Returns the next fact in rotation, or None while the pool is empty."""
+        facts = self._facts
+        if len(facts) < self.min_size:
+            self._wake.set()
+        if not facts:
+            return None
+        return facts[next(self._cursor) % len(facts)]
+
+    def _refill_loop(self) -> None:
+        while True:
+            added = self.refill()
+            # Top up again soon if the pool is still small, otherwise rotate in fresh facts occasionally
+            if len(self._facts) < self.min_size:
+                wait = self.retry_interval if added == 0 else 0
+            else:
+                wait = self.refresh_interval
+            self._wake.wait(timeout=wait)
+            self._wake.clear()
+
+    @staticmethod
+    def _normalize(fact: str) -> str:
+        """Key used to spot the same fact with different punctuation or casing."""
+        return re.sub(r"\W+", " ", fact).strip().lower()
+
+    def refill(self) -> int:
+        """Fetches one batch of facts and adds the new ones; returns how many were added."""
+        prompt = (
+            f"Generate {self.batch_size} different, single 10-second digestible snippets/trivia from the music world. "
+            "Cover different eras, genres, instruments and cultures. Start each directly with the fact, "
+            "no salutations, numbering or headings."
+        )
+        try:
+            response = self.client.models.generate_content(
+                model=self.model,
+                contents=[prompt],
+                config=types.GenerateContentConfig(
+                    response_mime_type="application/json",
+                    response_schema=list[str],
+                ),
+            )
+            batch = json.loads(response.text)
+        except Exception as e:
+            print(f"Trivia error: {e}")
+            return 0
+
+        with self._write_lock:
+            facts = list(self._facts)
+            added = 0
+            for fact in batch:
+                if not isinstance(fact, str) or not fact.strip():
+                    continue
+                key = self._normalize(fact)
+                if key in self._seen:
+                    continue
+                self._seen.add(key)
+                facts.append(fact.strip())
+                added += 1
+
+            # Rotate: drop the oldest facts beyond the cap so they can come back in later batches
+            for dropped in facts[:-self.max_size]:
+                self._seen.discard(self._normalize(dropped))
+            self._facts = facts[-self.max_size:]
+        return added
@@ -1,103 +1,314 @@
-import json
+import base64
+import copy
+import hashlib
+import queue
 import random
-from typing import Any, Dict, Optional, Type, Tuple, List
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple, List
 from google import genai
-from google.genai import types
 
 # Use relative import for modularity
-from ..prompts import GraphicScorePrompts, response_art_config
+from ..music_features import MusicFeatures
+from ..prompt_encoder import count_prompt_tokens, encode_features
+from ..prompt_registry import PROMPTS, PromptRegistry
+from ..prompts import response_art_config
+from ..utils.feature_cache import features_hash
+from ..utils.image_store import ImageStore, SVG
+from ..utils.image_variants import ImageVariantProcessor
+from ..utils.single_flight import SingleFlight
+from .local_renderer import can_render, render_score
+from .narration_service import NarrationService
+
+NARRATION_FALLBACK = "[Error generating narrative. Focus on the core structural data.]"
+IMAGE_MODEL = "gemini-2.0-flash-exp-image-generation"
+
+# Shared by all generator instances so concurrent requests don't each spawn threads
+_model_call_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="model-call")
 
 class VisualizationGenerator:
     """
     AI Service for generating the visual representation and narrative 
     based on structured musical analysis data.
+
+    With `local_rendering`, styles the local renderer can draw from the sampled
+    notes get an instant preview, which also stands in for the model image if
+    that call fails or times out.
+
+    With `compact_prompts`, image prompts carry encode_features() for the
+    style instead of the full features JSON. `report_prompt_tokens` logs the
+    input tokens of both forms (one extra count_tokens call each, off the
+    request path).
     """
-    def __init__(self, client: genai.Client):
+    def __init__(self, client: genai.Client, image_store: ImageStore,
+                 variant_processor: Optional[ImageVariantProcessor] = None, narration_timeout: float = 30.0,
+                 image_timeout: float = 120.0, executor: Optional[ThreadPoolExecutor] = None,
+                 narrator: Optional[NarrationService] = None, local_rendering: bool = True,
+                 compact_prompts: bool = True, report_prompt_tokens: bool = False):
         self.client = client
-        self.prompts_class = GraphicScorePrompts
+        self.image_store = image_store
+        self.variant_processor = variant_processor
+        self.prompts: PromptRegistry = PROMPTS
         self.art_config = response_art_config
+        self.narration_timeout = narration_timeout
+        self.image_timeout = image_timeout
+        self.executor = executor or _model_call_pool
+        self.narrator = narrator or NarrationService(client, PROMPTS.placeholder)
+        self.local_rendering = local_rendering
+        self.compact_prompts = compact_prompts
+        self.report_prompt_tokens = report_prompt_tokens
+        self.flights = SingleFlight()
 
-    def _generate_narration(self, data_summary: Dict[str, str]) -> str:
-        """Generates a concise narrative based on the summarized musical features."""
-        narration_prompt_text = f"""
-        Based on the musical summary for '{data_summary['title']}' and the graphic style described below, create a concise narration (max 70 words) for a beginner/non-musician/deaf user. The narration MUST emphasize STRUCTURAL MAPPING and include the technical term in parentheses where appropriate.
-        
-        --- MUSIC SUMMARY --- 
-        Style: {data_summary['key_mood']} Key, {data_summary['time_signature']} time. 
-        Start: {data_summary['initial_tempo_desc']} ({data_summary['initial_tempo_term']}), {data_summary['initial_dynamics_desc']} ({data_summary['initial_dynamics_term']}), {data_summary['initial_articulation_term']} texture. 
-        Highlight: {data_summary['rhythm_highlight']}
+    def _stream_narration(self, sheet_data: MusicFeatures, prompt_to_use: Tuple[str, str], events: queue.Queue,
+                          cancelled: threading.Event) -> Tuple[str, float, Optional[float]]:
         """
+        Streams the narration for one style into `events` as ("narration", delta)
+        items and returns (narration, elapsed ms, first-token ms). A miss narrates
+        every style in one batched call, so regenerating other styles of this
+        score hits the cache.
+        """
+        start = time.perf_counter()
+        name = prompt_to_use[0]
+        styles = self.prompts.prompt_list()
+        if name not in self.prompts:
+            styles.append(prompt_to_use)
+
+        parts: List[str] = []
+        first_token_ms = None
+        for delta in self.narrator.narrate_stream(sheet_data, styles, name):
+            if cancelled.is_set():
+                raise TimeoutError("narration abandoned")
+            if first_token_ms is None:
+                first_token_ms = round((time.perf_counter() - start) * 1000, 1)
+            parts.append(delta)
+            events.put(("narration", delta))
+        narration = "".join(parts).strip()
+        if not narration:
+            raise Exception(f"No narration returned for style {name}.")
+        return narration, round((time.perf_counter() - start) * 1000, 1), first_token_ms
+
+    def _generate_image(self, final_prompt: str) -> Tuple[bytes, str]:
+        """Calls the image model and returns (image_bytes, mime_type) from the first inline part."""
+        response_art = self.client.models.generate_content(
+            model=IMAGE_MODEL,
+            contents=[final_prompt], 
+            config=self.art_config
+        )
+
+        for part in response_art.candidates[0].content.parts:
+            if part.inline_data and part.inline_data.data:
+                image_bytes = part.inline_data.data
+                # The SDK returns raw bytes; older payloads may still carry a base64 string
+                if isinstance(image_bytes, str):
+                    image_bytes = base64.b64decode(image_bytes)
+                return image_bytes, part.inline_data.mime_type or "image/png"
+
+        raise Exception("No image data found in response.")
+
+    def _render_prompt(self, name: str, prompt: str, data_key: str, data: Callable[[], str]) -> str:
+        """Registry styles are rendered (and memoized) by the registry; ad-hoc prompts get a plain substitution."""
+        if name in self.prompts and self.prompts.get(name).text == prompt:
+            return self.prompts.render(name, data_key, data)
+        return prompt.replace(self.prompts.placeholder, data())
+
+    def _report_prompt_tokens(self, name: str, json_prompt: str, final_prompt: str) -> None:
+        before = count_prompt_tokens(self.client, IMAGE_MODEL, json_prompt)
+        after = count_prompt_tokens(self.client, IMAGE_MODEL, final_prompt) if final_prompt != json_prompt else before
+        if before and after:
+            print(f"Prompt tokens for {name}: {before} with JSON data, {after} as sent ({100 * (before - after) / before:.0f}% fewer)")
+
+    def _timed_call(self, fn: Callable[..., Any], *args: Any) -> Tuple[Any, float]:
+        """Runs fn on the worker thread and returns (result, elapsed milliseconds)."""
+        start = time.perf_counter()
+        result = fn(*args)
+        return result, round((time.perf_counter() - start) * 1000, 1)
+
+    def _store_image(self, image_bytes: bytes, image_mime_type: str) -> Dict[str, Any]:
+        """Stores the image and returns the URLs clients fetch it from."""
+        # Images are served by hash from /api/images instead of inlined as base64
+        image_hash = self.image_store.put(image_bytes, image_mime_type)
+        image_variants = {}
+        if self.variant_processor:
+            self.variant_processor.submit(image_hash)
+            image_variants = {
+                variant: self.image_store.url_for(image_hash, variant)
+                for variant in self.variant_processor.variant_names()
+            }
+        return {"image_url": self.image_store.url_for(image_hash), "image_hash": image_hash, "image_variants": image_variants}
+
+    def _render_locally(self, name: str, sheet_data: MusicFeatures) -> Optional[Dict[str, Any]]:
+        """Draws a data-mapped style with the local renderer and stores its PNG (plus SVG variant)."""
         try:
-            response_narration = self.client.models.generate_content(model="gemini-2.5-flash", contents=[narration_prompt_text])
-            return response_narration.text.strip()
-        except Exception as e:
-            print(f"ERROR: Narration generation failed: {e}")
-            return "[Error generating narrative. Focus on the core structural data.]"
+            rendered = render_score(name, sheet_data)
+        except ValueError as e:
+            print(f"WARNING: Local rendering of {name} failed: {e}")
+            return None
+        stored = self._store_image(rendered.png, "image/png")
+        self.image_store.put_variant(stored["image_hash"], SVG, rendered.svg.encode("utf-8"), ".svg")
+        stored["image_variants"][SVG] = self.image_store.url_for(stored["image_hash"], SVG)
+        return stored
 
-    def generate_visualization(self, sheet_data: Dict[str, Any], sheet_data_raw_string: str, prompt_to_use: Optional[Tuple[str, str]] = None) -> Dict[str, Any]:
+    def generate_visualization(self, sheet_data: MusicFeatures, sheet_data_raw_string: str, prompt_to_use: Optional[Tuple[str, str]] = None,
+                               on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> Dict[str, Any]:
         """
         Generates narrative and image for a single, chosen prompt.
         
-        :param sheet_data: The structured JSON output from MusicAnalyzer.
+        :param sheet_data: The validated features from MusicAnalyzer.
         :param sheet_data_raw_string: The stringified JSON data for prompt injection.
         :param prompt_to_use: Optional (name, prompt_string) tuple to force a style.
+        :param on_event: Optional callback receiving the intermediate events of
+                         stream_visualization() ('style', 'narration', 'narration_done', 'image').
+
+        Identical concurrent requests (same features and style, or same features
+        with no style forced) share one generation. Each caller gets its own copy
+        of the result, so annotating it never affects the others; a caller that
+        joined another's generation gets its events replayed from the result.
+        """
+        flight_key = (features_hash(sheet_data.to_dict()), prompt_to_use[0] if prompt_to_use else None)
+        result, shared = self.flights.do(flight_key, self._generate_visualization, sheet_data, sheet_data_raw_string, prompt_to_use, on_event)
+        result = copy.deepcopy(result)
+        if shared and on_event:
+            for event, data in self.result_events(result):
+                if event not in ("done", "error"):
+                    on_event(event, data)
+        return result
+
+    def _generate_visualization(self, sheet_data: MusicFeatures, sheet_data_raw_string: str, prompt_to_use: Optional[Tuple[str, str]],
+                                on_event: Optional[Callable[[str, Dict[str, Any]], None]]) -> Dict[str, Any]:
+        result: Dict[str, Any] = {"error": "Visualization ended without a result.", "status": 500}
+        for event, data in self.stream_visualization(sheet_data, sheet_data_raw_string, prompt_to_use):
+            if event in ("done", "error"):
+                result = data
+            elif on_event:
+                on_event(event, data)
+        return result
+
+    def stream_visualization(self, sheet_data: MusicFeatures, sheet_data_raw_string: str,
+                             prompt_to_use: Optional[Tuple[str, str]] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Generates narrative and image for one prompt, yielding (event, data) pairs as they become available:
+
+        - 'style': prompt_name, visualization_type and title, right away.
+        - 'narration': {'text': delta} for each streamed fragment of the narration.
+        - 'preview': a local rendering (same fields as 'image'), for data-mapped styles only.
+        - 'narration_done': the final narration and its narration_status.
+        - 'image': image_url, image_hash and image_variants once the image is stored.
+        - 'done': the full result (same shape as generate_visualization) as the last event,
+          or 'error': {'error', 'status'} if the image could not be generated.
         """
-        
         # 1. Select the prompt
-        prompt_list = self.prompts_class.get_prompt_list()
-        name, prompt = prompt_to_use if prompt_to_use else random.choice(prompt_list)
-        
-        # 2. Prepare summary for Narration
-        try:
-            data_summary = {
-                "title": sheet_data.get("title", "The Music"),
-                "key_mood": sheet_data.get("key_signature", "Neutral").split(" ")[0],
-                "time_signature": sheet_data.get("time_signature", "N/A").split(" ")[0],
-                "initial_tempo_desc": sheet_data.get("initial_tempo", {}).get("description", "A moderate pace"),
-                "initial_tempo_term": sheet_data.get("initial_tempo", {}).get("term", "Moderato").strip("()"), 
-                "initial_dynamics_desc": sheet_data.get("initial_dynamics", {}).get("description", "Quiet"),
-                "initial_dynamics_term": sheet_data.get("initial_dynamics", {}).get("level", "p"),
-                "initial_articulation_term": sheet_data.get("initial_dynamics", {}).get("articulation", "smoothly"),
-                "rhythm_highlight": sheet_data.get("repeating_motifs", [{}])[0].get("description", "A consistent, simple beat."),
-            }
-        except Exception as e:
-            return {"error": f"Failed to parse features for narration: {e}", "status": 500}
+        name, prompt = prompt_to_use if prompt_to_use else random.choice(self.prompts.prompt_list())
+        result: Dict[str, Any] = {
+            "title": sheet_data.title or "Untitled Score",
+            "visualization_type": name.replace('_', ' ').title(),
+            "prompt_name": name,
+        }
+        yield "style", dict(result)
+
+        # 2. Generate Narration and Image concurrently; both report into one queue, so
+        #    narration fragments reach the client while the image is still rendering
+        score_hash = features_hash(sheet_data.to_dict())
+        json_key = "json:" + hashlib.sha256(sheet_data_raw_string.encode("utf-8")).hexdigest()[:16]
+        if self.compact_prompts:
+            final_prompt = self._render_prompt(name, prompt, f"compact:{score_hash}", lambda: encode_features(sheet_data, name))
+        else:
+            final_prompt = self._render_prompt(name, prompt, json_key, lambda: sheet_data_raw_string)
+        if self.report_prompt_tokens:
+            json_prompt = self._render_prompt(name, prompt, json_key, lambda: sheet_data_raw_string)
+            self.executor.submit(self._report_prompt_tokens, name, json_prompt, final_prompt)
+        events: queue.Queue = queue.Queue()
+        cancelled = threading.Event()
+        dispatched_at = time.perf_counter()
+        narration_future = self.executor.submit(self._stream_narration, sheet_data, (name, prompt), events, cancelled)
+        narration_future.add_done_callback(lambda future: events.put(("narration_done", future)))
+        image_future = self.executor.submit(self._timed_call, self._generate_image, final_prompt)
+        image_future.add_done_callback(lambda future: events.put(("image", future)))
+        timings_ms: Dict[str, float] = {}
+        narration_status = None
+        image_source = "model"
+
+        # Data-mapped styles are drawn locally in milliseconds while the models work
+        local = self._render_locally(name, sheet_data) if self.local_rendering and can_render(name, sheet_data) else None
+        if local:
+            timings_ms["preview"] = round((time.perf_counter() - dispatched_at) * 1000, 1)
+            yield "preview", local
 
-        # 3. Generate Narration and Image concurrently (sequentially here for simplicity)
-        narration = self._generate_narration(data_summary)
-        
         try:
-            # Inject the JSON data string into the specific visualization prompt
-            final_prompt = prompt.replace(self.prompts_class.json_string, sheet_data_raw_string)
-            
-            response_art = self.client.models.generate_content(
-                model="gemini-2.0-flash-exp-image-generation",
-                contents=[final_prompt], 
-                config=self.art_config
-            )
-
-            image_base64 = ""
-            for part in response_art.candidates[0].content.parts:
-                if part.inline_data:
-                    # Retrieve the base64 data
-                    image_base64 = part.inline_data.data
-                    # Convert bytes to utf-8 string for JSON serialization
-                    if isinstance(image_base64, bytes):
-                        image_base64 = image_base64.decode('utf-8') 
-                    break 
-            
-            if not image_base64:
-                 raise Exception("No image data found in response.")
-
-            return {
-                "title": sheet_data.get("title", "Untitled Score"),
-                "visualization_type": name.replace('_', ' ').title(),
-                "narration": narration,
-                "image_base64": image_base64,
-                "prompt_name": name, 
-                "status": 200
-            }
+            while narration_status is None or "image_hash" not in result:
+                deadlines = []
+                if narration_status is None:
+                    deadlines.append(dispatched_at + self.narration_timeout)
+                if "image_hash" not in result:
+                    deadlines.append(dispatched_at + self.image_timeout)
+                try:
+                    kind, payload = events.get(timeout=max(0.0, min(deadlines) - time.perf_counter()))
+                except queue.Empty:
+                    if "image_hash" not in result and time.perf_counter() >= dispatched_at + self.image_timeout:
+                        kind, payload = "image", _timed_out(self.image_timeout)
+                    else:
+                        kind, payload = "narration_done", _timed_out(self.narration_timeout)
+
+                if kind == "narration" and narration_status is None:
+                    yield "narration", {"text": payload}
+                elif kind == "narration_done" and narration_status is None:
+                    # A failed or slow narration still returns the image with a fallback text
+                    try:
+                        result["narration"], timings_ms["narration"], first_token_ms = payload.result()
+                        if first_token_ms is not None:
+                            timings_ms["narration_first_token"] = first_token_ms
+                        narration_status = "ok"
+                    except Exception as e:
+                        cancelled.set()
+                        print(f"ERROR: Narration generation failed: {e}")
+                        result["narration"] = NARRATION_FALLBACK
+                        narration_status = "timeout" if isinstance(e, TimeoutError) else "failed"
+                    yield "narration_done", {"narration": result["narration"], "narration_status": narration_status}
+                elif kind == "image" and "image_hash" not in result:
+                    try:
+                        (image_bytes, image_mime_type), timings_ms["image"] = payload.result()
+                    except Exception as e:
+                        if not local:
+                            print(f"ERROR: Image generation failed for {name}: {e}")
+                            yield "error", {"error": f"Image generation failed: {e}", "status": 500}
+                            return
+                        print(f"WARNING: Image generation failed for {name} ({e}); using the local rendering.")
+                        image_source = "local"
+                        result.update(local)
+                        yield "image", local
+                        continue
+                    stored = self._store_image(image_bytes, image_mime_type)
+                    result.update(stored)
+                    yield "image", stored
+        finally:
+            # Also reached when the consumer stops listening: stop streaming a narration nobody reads
+            cancelled.set()
+            narration_future.cancel()
+            image_future.cancel()
+
+        timings_ms["total"] = round((time.perf_counter() - dispatched_at) * 1000, 1)
+        result.update({
+            "metadata": {"timings_ms": timings_ms, "narration_status": narration_status, "image_source": image_source,
+                         "prompt_chars": len(final_prompt)},
+            "status": 200,
+        })
+        yield "done", result
+
+    @staticmethod
+    def result_events(result: Dict[str, Any]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Replays a finished result as the events stream_visualization() would have yielded."""
+        if result.get("status") != 200:
+            yield "error", {"error": result.get("error"), "status": result.get("status")}
+            return
+        yield "style", {key: result[key] for key in ("title", "visualization_type", "prompt_name")}
+        yield "narration", {"text": result["narration"]}
+        yield "narration_done", {"narration": result["narration"], "narration_status": result["metadata"]["narration_status"]}
+        yield "image", {key: result[key] for key in ("image_url", "image_hash", "image_variants")}
+        yield "done", result
+
 
-        except Exception as e:
-            print(f"ERROR: Image generation failed for {name}: {e}")
-            return {"error": f"Image generation failed: {e}", "status": 500}
+def _timed_out(timeout: float) -> Future:
+    """A failed future standing in for a call that missed its deadline."""
+    future: Future = Future()
+    future.set_exception(TimeoutError(f"no response within {timeout:.0f}s"))
+    return future
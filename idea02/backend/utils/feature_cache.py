@@ -0,0 +1,103 @@
+import hashlib
+import json
+import time
+from typing import Any, Dict, Optional
+
+from .local_db import LocalDatabase
+
+
+def features_hash(features: Dict[str, Any]) -> str:
+    """Stable sha256 of a features dict, used to identify one analyzed score."""
+    return hashlib.sha256(json.dumps(features, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class FeatureCache:
+    """
+    Persistent, content-addressed cache of extracted musical features.
+
+    Entries are keyed by a hash of the uploaded bytes plus the analyzer model and
+    prompt version, so changing either invalidates old results automatically.
+    Entries expire after `ttl_seconds`; beyond `max_entries` or `max_bytes` the
+    least recently used entries are evicted. Hit/miss counters live in the same
+    database so they add up across worker processes.
+    """
+    def __init__(self, db: LocalDatabase, max_entries: int = 1000, max_bytes: int = 50 * 1024 * 1024,
+                 ttl_seconds: int = 7 * 24 * 3600):
+        self.db = db
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        with self.db.transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS feature_cache ("
+                " key TEXT PRIMARY KEY, features TEXT NOT NULL, size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS feature_cache_lru ON feature_cache (last_access)")
+            conn.execute("CREATE TABLE IF NOT EXISTS feature_cache_counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            for name in ("hits", "misses", "evictions"):
+                conn.execute("INSERT OR IGNORE INTO feature_cache_counters (name, value) VALUES (?, 0)", (name,))
+
+    @staticmethod
+    def make_key(content_hash: str, model: str, prompt_version: str) -> str:
+        """Combines the upload hash with the analyzer identity into one cache key."""
+        return hashlib.sha256(f"{content_hash}:{model}:{prompt_version}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Returns the cached features for `key`, or None on a miss or an expired entry."""
+        now = time.time()
+        row = self.db.execute("SELECT features, created_at FROM feature_cache WHERE key = ?", (key,)).fetchone()
+        if row and now - row[1] <= self.ttl_seconds:
+            self.db.execute("UPDATE feature_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._increment("hits")
+            return json.loads(row[0])
+
+        if row:
+            self.db.execute("DELETE FROM feature_cache WHERE key = ?", (key,))
+        self._increment("misses")
+        return None
+
+    def put(self, key: str, features: Dict[str, Any]) -> None:
+        """Stores features under `key`, then evicts expired and least recently used entries."""
+        payload = json.dumps(features)
+        now = time.time()
+        try:
+            with self.db.transaction() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO feature_cache (key, features, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                    (key, payload, len(payload.encode("utf-8")), now, now),
+                )
+                self._evict(conn, now)
+        except Exception as e:
+            print(f"WARNING: Failed to store features in cache: {e}")
+
+    def _evict(self, conn, now: float) -> None:
+        evicted = conn.execute("DELETE FROM feature_cache WHERE created_at < ?", (now - self.ttl_seconds,)).rowcount
+
+        total_entries, total_bytes = 0, 0
+        stale_keys = []
+        for key, size in conn.execute("SELECT key, size FROM feature_cache ORDER BY last_access DESC"):
+            total_entries += 1
+            total_bytes += size
+            if total_entries > self.max_entries or total_bytes > self.max_bytes:
+                stale_keys.append((key,))
+        conn.executemany("DELETE FROM feature_cache WHERE key = ?", stale_keys)
+
+        evicted += len(stale_keys)
+        if evicted:
+            conn.execute("UPDATE feature_cache_counters SET value = value + ? WHERE name = 'evictions'", (evicted,))
+
+    def _increment(self, counter: str) -> None:
+        self.db.execute("UPDATE feature_cache_counters SET value = value + 1 WHERE name = ?", (counter,))
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns hit/miss/eviction counters and the current cache size."""
+        counters = dict(self.db.execute("SELECT name, value FROM feature_cache_counters").fetchall())
+        entries, total_bytes = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM feature_cache").fetchone()
+        lookups = counters.get("hits", 0) + counters.get("misses", 0)
+        return {
+            **counters,
+            "hit_rate": round(counters.get("hits", 0) / lookups, 3) if lookups else 0.0,
+            "entries": entries,
+            "bytes": total_bytes,
+        }
@@ -1,7 +1,38 @@
+import hashlib
+import mimetypes
 import os
+import tempfile
 from google import genai
 from google.genai import types
-from typing import Optional
+from typing import BinaryIO, Optional, Union
+
+# Largest request generate_content accepts; inline bytes travel base64-encoded (4/3 of their size)
+INLINE_REQUEST_LIMIT_BYTES = 20 * 1024 * 1024
+
+
+class SpooledUpload:
+    """
+    An incoming upload buffered in memory, spilling to an anonymous, uniquely
+    named temporary file only when it exceeds the spool threshold. The sha256
+    digest and size are computed while the stream is read.
+    """
+    def __init__(self, file: tempfile.SpooledTemporaryFile, filename: str, mime_type: str, size: int, sha256: str,
+                 in_memory: bool):
+        self.file = file
+        self.filename = filename
+        self.mime_type = mime_type
+        self.size = size
+        self.sha256 = sha256
+        self.in_memory = in_memory
+
+    def read_bytes(self) -> bytes:
+        self.file.seek(0)
+        return self.file.read()
+
+    def close(self) -> None:
+        """Releases the buffer; a spilled temporary file is deleted automatically."""
+        self.file.close()
+
 
 class FileManagement:
     """
@@ -11,11 +42,19 @@ class FileManagement:
     def __init__(self, client: genai.Client):
         self.client = client
 
-    def upload_to_api(self, local_file_path: str) -> Optional[types.File]:
-        """Uploads a local file (e.g., PDF) to the Gemini API for processing."""
+    def upload_to_api(self, source: Union[str, BinaryIO], mime_type: Optional[str] = None) -> Optional[types.File]:
+        """
+        Uploads a file (e.g., PDF) to the Gemini API for processing.
+
+        :param source: A local file path, or a seekable binary stream (mime_type required).
+        :param mime_type: Overrides the mime type guessed from a file path.
+        """
         try:
+            if hasattr(source, "seek"):
+                source.seek(0)
+            config = {"mime_type": mime_type} if mime_type else None
             # client.files.upload() returns a types.File object
-            uploaded_file = self.client.files.upload(file=local_file_path)
+            uploaded_file = self.client.files.upload(file=source, config=config)
             # In a real app, this would use a proper logging system
             print(f"File uploaded. Resource name: {uploaded_file.name}") 
             return uploaded_file
@@ -31,13 +70,35 @@ class FileManagement:
         except Exception as e:
             print(f"WARNING: Failed to delete API file {uploaded_file.name}: {e}")
 
+    def spool_upload(self, file_storage, spool_max_bytes: int, spill_dir: Optional[str] = None,
+                     chunk_size: int = 256 * 1024) -> SpooledUpload:
+        """
+        Buffers an incoming werkzeug FileStorage without writing it to a named path.
+        Uploads above `spool_max_bytes` spill to a unique temporary file in `spill_dir`.
+        """
+        mime_type = (
+            (file_storage.mimetype if file_storage.mimetype != "application/octet-stream" else None)
+            or mimetypes.guess_type(file_storage.filename or "")[0]
+            or "application/pdf"
+        )
+        spooled = tempfile.SpooledTemporaryFile(max_size=spool_max_bytes, dir=spill_dir)
+        digest = hashlib.sha256()
+        size = 0
+        for chunk in iter(lambda: file_storage.stream.read(chunk_size), b""):
+            digest.update(chunk)
+            spooled.write(chunk)
+            size += len(chunk)
+        spooled.seek(0)
+        return SpooledUpload(spooled, file_storage.filename or "", mime_type, size, digest.hexdigest(),
+                             in_memory=size <= spool_max_bytes)
+
     def save_local_file(self, file_stream, filename: str, upload_folder: str) -> str:
         """Saves an incoming file stream temporarily to the local filesystem."""
         filepath = os.path.join(upload_folder, filename)
         file_stream.save(filepath)
         return filepath
-        
+
     def cleanup_local_file(self, filepath: str) -> None:
         """Removes a file from the local filesystem."""
         if os.path.exists(filepath):
-            os.remove(filepath)
\ No newline at end of file
+            os.remove(filepath)
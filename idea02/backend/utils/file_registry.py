@@ -0,0 +1,184 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple, Union
+
+from google.genai import types
+
+from .file_management import FileManagement
+from .local_db import LocalDatabase
+from .single_flight import SingleFlight
+
+# The Gemini File API deletes uploads on its own after 48 hours
+FILE_API_EXPIRY_SECONDS = 48 * 3600
+# Key prefix of handles no longer handed out but still awaiting the janitor
+_RETIRED = "retired:"
+
+
+class RemoteFileRegistry:
+    """
+    Content-addressed registry of files uploaded to the Gemini File API, so each
+    score is uploaded once and its handle reused by every later request (a
+    re-analysis, Q&A about it) in any worker process sharing the database.
+
+    A handle is kept for `ttl_seconds` after its upload, which must stay below
+    the service's own 48 hour expiry. Handles with less than
+    `min_remaining_seconds` left are no longer handed out, so a caller always
+    has that long to use one before the janitor may delete it.
+
+    The janitor is a background thread that, every `janitor_interval` seconds,
+    claims expired handles `batch_size` at a time and deletes the remote files
+    in parallel. Claiming happens in one database transaction, so janitors of
+    different workers never delete the same file twice.
+    """
+    def __init__(self, db: LocalDatabase, file_manager: FileManagement, ttl_seconds: int = 46 * 3600,
+                 min_remaining_seconds: int = 3600, janitor_interval: float = 300.0, batch_size: int = 20):
+        if ttl_seconds >= FILE_API_EXPIRY_SECONDS:
+            print(f"WARNING: Remote file TTL of {ttl_seconds}s is not below the File API expiry; using {FILE_API_EXPIRY_SECONDS - 3600}s.")
+            ttl_seconds = FILE_API_EXPIRY_SECONDS - 3600
+        self.db = db
+        self.file_manager = file_manager
+        self.ttl_seconds = ttl_seconds
+        self.min_remaining_seconds = min(min_remaining_seconds, ttl_seconds // 2)
+        self.janitor_interval = janitor_interval
+        self.batch_size = batch_size
+        # Concurrent uploads of the same bytes within this process share one upload
+        self._upload_flights = SingleFlight()
+        self._delete_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="file-janitor")
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        with self.db.transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS remote_files ("
+                " content_hash TEXT PRIMARY KEY, name TEXT NOT NULL, uri TEXT, mime_type TEXT,"
+                " created_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS remote_files_expiry ON remote_files (expires_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS remote_file_counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            for name in ("reused", "uploaded", "deleted"):
+                conn.execute("INSERT OR IGNORE INTO remote_file_counters (name, value) VALUES (?, 0)", (name,))
+
+    def get(self, content_hash: str) -> Optional[types.File]:
+        """The registered handle for these bytes, if it still has at least min_remaining_seconds to live."""
+        uploaded_file = self._lookup(content_hash)
+        if uploaded_file:
+            self._increment("reused")
+        return uploaded_file
+
+    def upload(self, content_hash: str, source: Union[str, BinaryIO], mime_type: Optional[str] = None) -> Optional[types.File]:
+        """
+        Uploads the bytes and registers the handle; None if the upload fails.
+        A handle registered since the caller's get() (e.g. by a concurrent
+        request for the same score) is returned instead of uploading again.
+        """
+        uploaded_file, _ = self._upload_flights.do(content_hash, self._upload, content_hash, source, mime_type)
+        return uploaded_file
+
+    def acquire(self, content_hash: str, source: Union[str, BinaryIO],
+                mime_type: Optional[str] = None) -> Tuple[Optional[types.File], bool]:
+        """
+        Returns (handle, reused): the registered handle for these bytes, or a
+        fresh upload of `source` if there is none. The handle is None if the
+        upload fails.
+        """
+        uploaded_file = self.get(content_hash)
+        if uploaded_file:
+            return uploaded_file, True
+        return self.upload(content_hash, source, mime_type), False
+
+    def forget(self, uploaded_file: types.File, content_hash: str) -> None:
+        """
+        Stops handing out a handle that failed when reused, so the next request
+        uploads afresh. The remote file is not deleted now, since another
+        request may have just acquired it: its row is kept under a key no
+        lookup matches, and the janitor deletes it when its TTL runs out.
+        Does nothing if the hash has been re-registered with another handle.
+        """
+        self.db.execute(
+            "UPDATE OR IGNORE remote_files SET content_hash = ? WHERE content_hash = ? AND name = ?",
+            (f"{_RETIRED}{uploaded_file.name}", content_hash, uploaded_file.name),
+        )
+
+    def start(self) -> None:
+        """Starts the background janitor thread (idempotent)."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._janitor_loop, name="file-janitor", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def sweep(self) -> int:
+        """Deletes every expired handle, one batch at a time; returns how many were deleted."""
+        deleted = 0
+        while True:
+            batch = self._claim_expired()
+            if not batch:
+                return deleted
+            list(self._delete_pool.map(self.file_manager.delete_api_file, batch))
+            self.db.execute("UPDATE remote_file_counters SET value = value + ? WHERE name = 'deleted'", (len(batch),))
+            deleted += len(batch)
+
+    def stats(self) -> Dict[str, Any]:
+        counters = dict(self.db.execute("SELECT name, value FROM remote_file_counters").fetchall())
+        (live,) = self.db.execute(
+            "SELECT COUNT(*) FROM remote_files WHERE expires_at > ? AND content_hash NOT LIKE ?", (time.time(), f"{_RETIRED}%")
+        ).fetchone()
+        return {**counters, "live": live}
+
+    def _lookup(self, content_hash: str) -> Optional[types.File]:
+        row = self.db.execute(
+            "SELECT name, uri, mime_type FROM remote_files WHERE content_hash = ? AND expires_at > ?",
+            (content_hash, time.time() + self.min_remaining_seconds),
+        ).fetchone()
+        return types.File(name=row[0], uri=row[1], mime_type=row[2]) if row else None
+
+    def _upload(self, content_hash: str, source: Union[str, BinaryIO], mime_type: Optional[str]) -> Optional[types.File]:
+        uploaded_file = self._lookup(content_hash)
+        if uploaded_file:
+            return uploaded_file
+        uploaded_file = self.file_manager.upload_to_api(source, mime_type=mime_type)
+        if not uploaded_file:
+            return None
+        now = time.time()
+        with self.db.transaction() as conn:
+            # Another worker may have registered the same bytes meanwhile (or the old handle is about
+            # to expire); the newer handle wins and the older one is retired for the janitor
+            replaced = conn.execute("SELECT name FROM remote_files WHERE content_hash = ?", (content_hash,)).fetchone()
+            if replaced:
+                conn.execute(
+                    "UPDATE OR REPLACE remote_files SET content_hash = ? WHERE content_hash = ?",
+                    (f"{_RETIRED}{replaced[0]}", content_hash),
+                )
+            conn.execute(
+                "INSERT OR REPLACE INTO remote_files (content_hash, name, uri, mime_type, created_at, expires_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (content_hash, uploaded_file.name, uploaded_file.uri, uploaded_file.mime_type or mime_type,
+                 now, now + self.ttl_seconds),
+            )
+            conn.execute("UPDATE remote_file_counters SET value = value + 1 WHERE name = 'uploaded'")
+        if replaced:
+            print(f"Replaced remote file handle {replaced[0]} with {uploaded_file.name}")
+        return uploaded_file
+
+    def _claim_expired(self) -> List[types.File]:
+        """Removes up to batch_size expired rows in one transaction and returns their handles."""
+        with self.db.transaction() as conn:
+            rows = conn.execute(
+                "SELECT content_hash, name FROM remote_files WHERE expires_at <= ? ORDER BY expires_at LIMIT ?",
+                (time.time(), self.batch_size),
+            ).fetchall()
+            conn.executemany("DELETE FROM remote_files WHERE content_hash = ?", [(row[0],) for row in rows])
+        return [types.File(name=row[1]) for row in rows]
+
+    def _janitor_loop(self) -> None:
+        while not self._stop.wait(timeout=self.janitor_interval):
+            try:
+                deleted = self.sweep()
+                if deleted:
+                    print(f"Deleted {deleted} expired remote file(s).")
+            except Exception as e:
+                print(f"WARNING: Remote file janitor failed: {e}")
+
+    def _increment(self, counter: str) -> None:
+        self.db.execute("UPDATE remote_file_counters SET value = value + 1 WHERE name = ?", (counter,))
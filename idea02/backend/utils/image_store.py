@@ -0,0 +1,77 @@
+import hashlib
+import os
+import re
+import tempfile
+from typing import Optional, Tuple
+
+_DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+# Extension <-> mime type for the formats we store
+IMAGE_TYPES = {
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".webp": "image/webp",
+    ".avif": "image/avif",
+    ".svg": "image/svg+xml",
+}
+
+ORIGINAL = "original"
+# Vector version of a locally rendered image, stored as a variant of its PNG
+SVG = "svg"
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    """Writes via a temp file and rename so readers never see a partially written image."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class ImageStore:
+    """
+    Content-addressed store of generated images on the local filesystem.
+
+    Each image is written once as `<sha256><ext>`, so identical images share one
+    file, files never change after being written, and any worker on the host
+    can serve any image by its hash. Derived variants (thumbnails, WebP, ...)
+    sit next to the original as `<sha256>.<variant><ext>`.
+    """
+    def __init__(self, root: str, url_prefix: str = "/api/images"):
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.url_prefix = url_prefix
+
+    def put(self, data: bytes, mime_type: str = "image/png") -> str:
+        """Stores image bytes (if not already present) and returns their sha256 hex digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        ext = next((ext for ext, mime in IMAGE_TYPES.items() if mime == mime_type), ".png")
+        path = os.path.join(self.root, digest + ext)
+        if not os.path.exists(path):
+            write_atomic(path, data)
+        return digest
+
+    def put_variant(self, digest: str, variant: str, data: bytes, ext: str) -> None:
+        """Stores a rendition of an existing image that was produced alongside it (e.g. its SVG)."""
+        path = self.path_for(digest, variant, ext)
+        if not os.path.exists(path):
+            write_atomic(path, data)
+
+    def path_for(self, digest: str, variant: str, ext: str) -> str:
+        """Returns where a variant of an image lives (or should be written)."""
+        name = digest if variant == ORIGINAL else f"{digest}.{variant}"
+        return os.path.join(self.root, name + ext)
+
+    def find(self, digest: str, variant: str = ORIGINAL) -> Optional[Tuple[str, str]]:
+        """Returns (path, mime_type) for a stored image, or None for unknown or malformed hashes."""
+        if not _DIGEST_PATTERN.match(digest):
+            return None
+        for ext, mime_type in IMAGE_TYPES.items():
+            path = self.path_for(digest, variant, ext)
+            if os.path.exists(path):
+                return path, mime_type
+        return None
+
+    def url_for(self, digest: str, variant: str = ORIGINAL) -> str:
+        url = f"{self.url_prefix}/{digest}"
+        return url if variant == ORIGINAL else f"{url}?variant={variant}"
@@ -0,0 +1,120 @@
+import atexit
+import gc
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image, features
+
+from .image_store import ImageStore, write_atomic
+
+# variant name -> (longest edge in px, Pillow format, extension)
+VARIANT_SPECS: Dict[str, Tuple[int, str, str]] = {
+    "thumb": (320, "WEBP", ".webp"),
+    "web": (1280, "WEBP", ".webp"),
+}
+if features.check("avif"):
+    VARIANT_SPECS["web_avif"] = (1280, "AVIF", ".avif")
+
+
+def _pool_context() -> multiprocessing.context.BaseContext:
+    """
+    Workers come from a forkserver (spawn where there is none), never from a
+    fork of the app process: it runs many threads, and a fork taken while one
+    of them holds a lock leaves that lock held forever in the child.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        # The server only needs this module, not the app's __main__ with its clients and threads
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+def render_variants(store_root: str, digest: str) -> List[str]:
+    """
+    Builds every missing variant of a stored image. Runs in a worker process.
+    Sources that already have the target format and fit the target size are
+    copied byte for byte instead of being re-encoded.
+    """
+    store = ImageStore(store_root)
+    found = store.find(digest)
+    if not found:
+        return []
+    source_path, _ = found
+
+    with open(source_path, "rb") as f:
+        source_bytes = f.read()
+
+    written = []
+    with Image.open(BytesIO(source_bytes)) as image:
+        image.load()
+        for variant, (max_edge, image_format, ext) in VARIANT_SPECS.items():
+            target_path = store.path_for(digest, variant, ext)
+            if os.path.exists(target_path):
+                continue
+
+            if image.format == image_format and max(image.size) <= max_edge:
+                write_atomic(target_path, source_bytes)
+            else:
+                resized = image.copy()
+                resized.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+                buffer = BytesIO()
+                resized.save(buffer, format=image_format, quality=80 if image_format == "WEBP" else 60)
+                write_atomic(target_path, buffer.getvalue())
+            written.append(variant)
+    return written
+
+
+class ImageVariantProcessor:
+    """
+    Produces downsized variants of generated images in a process pool, off the
+    request thread. Until a variant exists, /api/images falls back to the
+    original, so callers never wait on post-processing.
+    """
+    def __init__(self, image_store: ImageStore, max_workers: int = 2):
+        self.image_store = image_store
+        self.max_workers = max_workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def variant_names() -> List[str]:
+        return list(VARIANT_SPECS)
+
+    def submit(self, digest: str) -> None:
+        """Queues variant generation for a stored image; duplicate requests are ignored."""
+        if all(self.image_store.find(digest, variant) for variant in VARIANT_SPECS):
+            return
+        with self._lock:
+            if digest in self._pending:
+                return
+            if self._pool is None:
+                # Created lazily so importing the app never starts worker processes
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=_pool_context())
+                atexit.register(self.close)
+            future = self._pool.submit(render_variants, self.image_store.root, digest)
+            self._pending[digest] = future
+        future.add_done_callback(lambda f: self._on_done(digest, f))
+
+    def close(self) -> None:
+        """Finishes queued variants and stops the workers; a later submit() starts a new pool."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool:
+            # Outside the lock: done callbacks of the finishing jobs take it
+            pool.shutdown(wait=True)
+            # The pool's queues sit in reference cycles; collect them so their semaphores are
+            # released before exit rather than reported as leaked by the resource tracker
+            del pool
+            gc.collect()
+
+    def _on_done(self, digest: str, future: Future) -> None:
+        with self._lock:
+            self._pending.pop(digest, None)
+        if future.exception():
+            print(f"WARNING: Image variant generation failed for {digest}: {future.exception()}")
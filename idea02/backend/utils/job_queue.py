@@ -0,0 +1,370 @@
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from .local_db import LocalDatabase
+
+# How often a worker streaming another worker's job checks the database for new events
+STORED_JOB_POLL_SECONDS = 0.25
+
+
+class QueueFullError(Exception):
+    """Raised when every worker is busy and the waiting queue is at capacity."""
+
+
+class JobStore:
+    """
+    Mirrors job status and event logs into the database shared by every worker
+    process, so a job run by one worker can be polled and streamed from any other.
+
+    Jobs only mark themselves as changed; a background writer saves every
+    changed job every `flush_interval` seconds (at once for finished jobs) in
+    one transaction, outside the job locks, so publishing an event never
+    waits on the database.
+    """
+    def __init__(self, db: LocalDatabase, flush_interval: float = 0.2):
+        self.db = db
+        self.flush_interval = flush_interval
+        self._dirty: Dict[str, "Job"] = {}
+        self._lock = threading.Lock()
+        # Serializes writes, so an older snapshot of a job never overwrites a newer one
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        with self.db.transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " job_id TEXT PRIMARY KEY, status TEXT NOT NULL, payload TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_events ("
+                " job_id TEXT NOT NULL, seq INTEGER NOT NULL, event TEXT NOT NULL, data TEXT NOT NULL,"
+                " PRIMARY KEY (job_id, seq))"
+            )
+
+    def mark(self, job: "Job", urgent: bool = False) -> None:
+        """Queues the job for the next write; `urgent` writes it without waiting out the interval."""
+        with self._lock:
+            self._dirty[job.id] = job
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._writer_loop, name="job-store", daemon=True)
+                self._thread.start()
+        if urgent:
+            self._wake.set()
+
+    def flush(self, jobs: Optional[List["Job"]] = None) -> None:
+        """Writes the given jobs (default: every changed job) now, in the calling thread."""
+        with self._flush_lock:
+            with self._lock:
+                if jobs is None:
+                    jobs = list(self._dirty.values())
+                for job in jobs:
+                    self._dirty.pop(job.id, None)
+            if jobs:
+                self._write(jobs)
+
+    def _write(self, jobs: List["Job"]) -> None:
+        snapshots = [job._snapshot() for job in jobs]
+        try:
+            with self.db.transaction() as conn:
+                for job_id, status, payload, updated_at, first_seq, events in snapshots:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO jobs (job_id, status, payload, updated_at) VALUES (?, ?, ?, ?)",
+                        (job_id, status, json.dumps(payload), updated_at),
+                    )
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO job_events (job_id, seq, event, data) VALUES (?, ?, ?, ?)",
+                        [(job_id, first_seq + offset, event, json.dumps(data)) for offset, (event, data) in enumerate(events)],
+                    )
+        except Exception as e:
+            # Other workers see a stale status until a later write succeeds; this worker is unaffected
+            print(f"WARNING: Could not save {len(jobs)} job(s) to the job store: {e}")
+            for job in jobs:
+                self.mark(job)
+            return
+        for job, (_, _, _, _, first_seq, events) in zip(jobs, snapshots):
+            job._stored(first_seq + len(events))
+
+    def _writer_loop(self) -> None:
+        while True:
+            self._wake.wait(timeout=self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def load(self, job_id: str) -> Optional["StoredJob"]:
+        current = self.status(job_id)
+        return StoredJob(self, job_id, *current) if current else None
+
+    def status(self, job_id: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """(status, to_dict() payload) of a stored job, or None if there is no such job."""
+        row = self.db.execute("SELECT status, payload FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def events(self, job_id: str, cursor: int) -> List[Tuple[str, Any]]:
+        rows = self.db.execute(
+            "SELECT event, data FROM job_events WHERE job_id = ? AND seq >= ? ORDER BY seq", (job_id, cursor)
+        ).fetchall()
+        return [(event, json.loads(data)) for event, data in rows]
+
+    def prune(self, cutoff: float) -> None:
+        """Deletes finished jobs, and their events, last updated before `cutoff`."""
+        with self.db.transaction() as conn:
+            conn.execute(
+                "DELETE FROM job_events WHERE job_id IN"
+                " (SELECT job_id FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?)", (cutoff,)
+            )
+            conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?", (cutoff,))
+
+
+class Job:
+    """
+    Tracks the progress and the final result of one background pipeline run.
+    Stage status moves from 'pending' to 'running' to 'done' (or 'failed'),
+    or straight to 'skipped'/'cached' when a stage did not need to run.
+
+    Every change is also appended to an event log ('stage', 'done', 'error',
+    plus whatever the pipeline publishes), which streaming clients read with
+    wait_events() instead of polling to_dict(). With a `store`, every change
+    is also queued for writing to it.
+    """
+    def __init__(self, stages: List[str], store: Optional[JobStore] = None):
+        self.id = uuid.uuid4().hex
+        self.status = "queued"
+        self.stages: Dict[str, str] = {name: "pending" for name in stages}
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.error_status: Optional[int] = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._events: List[Tuple[str, Any]] = []
+        self._stored_events = 0  # Events already written to the store
+        self._store = store
+
+    def _touch(self) -> None:
+        self.updated_at = time.time()
+
+    def _emit(self, event: str, data: Any) -> None:
+        """Appends an event and wakes waiting readers. Caller must hold the lock."""
+        self._events.append((event, data))
+        self._save(urgent=event in ("done", "error"))
+        self._changed.notify_all()
+
+    def _save(self, urgent: bool = False) -> None:
+        """Queues the job for the store's next write (no database access here)."""
+        if self._store:
+            self._store.mark(self, urgent)
+
+    def _snapshot(self) -> Tuple[str, str, Dict[str, Any], float, int, List[Tuple[str, Any]]]:
+        """(id, status, payload, updated_at, first unsaved seq, unsaved events), taken together for the store."""
+        with self._lock:
+            first_seq = self._stored_events
+            return self.id, self.status, self._payload(), self.updated_at, first_seq, self._events[first_seq:]
+
+    def _stored(self, count: int) -> None:
+        """Called by the store once the first `count` events are written."""
+        with self._lock:
+            self._stored_events = max(self._stored_events, count)
+
+    def publish(self, event: str, data: Any) -> None:
+        """Publishes an intermediate event (e.g. a narration fragment) to streaming clients."""
+        with self._lock:
+            self._emit(event, data)
+
+    def wait_events(self, cursor: int, timeout: float) -> Tuple[List[Tuple[str, Any]], int]:
+        """
+        Returns the events after position `cursor` and the new cursor, waiting up
+        to `timeout` seconds for one if there are none yet. An empty list means
+        the wait timed out.
+        """
+        with self._lock:
+            if cursor >= len(self._events) and not self.finished:
+                self._changed.wait(timeout)
+            events = self._events[cursor:]
+            return events, cursor + len(events)
+
+    def start(self) -> None:
+        with self._lock:
+            self.status = "running"
+            self._touch()
+            self._save()
+
+    def start_stage(self, name: str) -> None:
+        with self._lock:
+            self.stages[name] = "running"
+            self._touch()
+            self._emit("stage", {"name": name, "status": "running"})
+
+    def complete_stage(self, name: str) -> None:
+        with self._lock:
+            self.stages[name] = "done"
+            self._touch()
+            self._emit("stage", {"name": name, "status": "done"})
+
+    def skip_stage(self, name: str, status: str = "skipped") -> None:
+        """Marks a stage that did not need to run, e.g. because of a cache hit."""
+        with self._lock:
+            self.stages[name] = status
+            self._touch()
+            self._emit("stage", {"name": name, "status": status})
+
+    def finish(self, result: Dict[str, Any]) -> None:
+        """Marks the job as done and stores the JSON-serializable result."""
+        with self._lock:
+            self.status = "done"
+            self.result = result
+            self._touch()
+            self._emit("done", result)
+
+    def fail(self, error: str, status: int = 500) -> None:
+        """Marks the job (and whichever stage was running) as failed."""
+        with self._lock:
+            for name, stage_status in self.stages.items():
+                if stage_status == "running":
+                    self.stages[name] = "failed"
+            self.status = "failed"
+            self.error = error
+            self.error_status = status
+            self._touch()
+            self._emit("error", {"error": error, "status": status})
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return self._payload()
+
+    def _payload(self) -> Dict[str, Any]:
+        """Caller must hold the lock."""
+        payload: Dict[str, Any] = {
+            "job_id": self.id,
+            "status": self.status,
+            "stages": [{"name": name, "status": status} for name, status in self.stages.items()],
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+        if self.result is not None:
+            payload["result"] = self.result
+        if self.error is not None:
+            payload["error"] = self.error
+            payload["error_status"] = self.error_status
+        return payload
+
+
+class StoredJob:
+    """
+    Read-only view of a job run by another worker process, loaded from the
+    JobStore. It offers the same status and event reading as Job; wait_events()
+    polls the database instead of waiting on the running job.
+    """
+    def __init__(self, store: JobStore, job_id: str, status: str, payload: Dict[str, Any]):
+        self._store = store
+        self.id = job_id
+        self.status = status
+        self._snapshot = payload
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self._snapshot
+
+    def wait_events(self, cursor: int, timeout: float) -> Tuple[List[Tuple[str, Any]], int]:
+        deadline = time.monotonic() + timeout
+        while True:
+            # Status before events: a job seen finished already has its final event stored
+            current = self._store.status(self.id)
+            if current:
+                self.status, self._snapshot = current
+            events = self._store.events(self.id, cursor)
+            remaining = deadline - time.monotonic()
+            if events or self.finished or not current or remaining <= 0:
+                return events, cursor + len(events)
+            time.sleep(min(STORED_JOB_POLL_SECONDS, remaining))
+
+
+class JobQueue:
+    """
+    Bounded background worker pool for long-running pipeline jobs.
+
+    At most `max_workers` jobs run at once and at most `max_queue_depth` more
+    wait for a worker; anything beyond that is rejected with QueueFullError
+    instead of piling up threads. Finished jobs are kept for `job_ttl_seconds`
+    so clients can poll for the result.
+
+    With a `db` shared by several worker processes, job status and events are
+    also written to it, so get() finds jobs submitted to any of the workers.
+    """
+    def __init__(self, max_workers: int = 2, max_queue_depth: int = 8, job_ttl_seconds: int = 3600,
+                 db: Optional[LocalDatabase] = None):
+        self.max_workers = max_workers
+        self.max_queue_depth = max_queue_depth
+        self.job_ttl_seconds = job_ttl_seconds
+        self._store = JobStore(db) if db else None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job-worker")
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue_depth)
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, stages: List[str], fn: Callable[..., None], *args: Any) -> Job:
+        """
+        Queues `fn(job, *args)` on the worker pool and returns its Job immediately.
+
+        :raises QueueFullError: If the pool and the waiting queue are both full.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise QueueFullError("Job queue is full. Please retry shortly.")
+
+        job = Job(stages, self._store)
+        if self._store:
+            # Written before the job id is handed out, so every worker can find it right away
+            self._store.flush([job])
+        with self._lock:
+            self._prune_finished()
+            self._jobs[job.id] = job
+        try:
+            self._executor.submit(self._run, job, fn, args)
+        except Exception:
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            self._slots.release()
+            raise
+        return job
+
+    def get(self, job_id: str) -> Optional[Union[Job, StoredJob]]:
+        """The job with this id: this worker's own, or one another worker stored."""
+        job = self._jobs.get(job_id)
+        if job or not self._store:
+            return job
+        return self._store.load(job_id)
+
+    def _run(self, job: Job, fn: Callable[..., None], args: tuple) -> None:
+        job.start()
+        try:
+            fn(job, *args)
+            if not job.finished:
+                job.fail("Job ended without producing a result.")
+        except Exception as e:
+            print(f"ERROR: Background job {job.id} failed: {e}")
+            job.fail(f"Unexpected processing error: {e}")
+        finally:
+            self._slots.release()
+
+    def _prune_finished(self) -> None:
+        """Drops finished jobs older than the TTL. Caller must hold the lock."""
+        cutoff = time.time() - self.job_ttl_seconds
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished and job.updated_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+        if self._store:
+            try:
+                self._store.prune(cutoff)
+            except Exception as e:
+                print(f"WARNING: Could not prune the job store: {e}")
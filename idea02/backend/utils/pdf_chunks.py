@@ -0,0 +1,51 @@
+import io
+from dataclasses import dataclass
+from typing import BinaryIO, List
+
+try:
+    from pypdf import PdfReader, PdfWriter
+except ImportError:  # Optional: without pypdf every score is analyzed as one file
+    PdfReader = PdfWriter = None
+
+
+@dataclass(slots=True)
+class PdfChunk:
+    """A page range of a larger PDF, as a standalone PDF document (pages are 1-based, inclusive)."""
+    first_page: int
+    last_page: int
+    total_pages: int
+    data: bytes
+
+
+def split_pdf(source: BinaryIO, pages_per_chunk: int) -> List[PdfChunk]:
+    """
+    Splits a PDF into consecutive chunks of at most `pages_per_chunk` pages.
+
+    Returns an empty list when the document fits in one chunk, when pypdf is not
+    installed, or when the file cannot be read as a PDF; the caller then analyzes
+    the file whole.
+    """
+    if PdfReader is None or pages_per_chunk <= 0:
+        return []
+    try:
+        source.seek(0)
+        reader = PdfReader(source)
+        total_pages = len(reader.pages)
+        if total_pages <= pages_per_chunk:
+            return []
+
+        chunks = []
+        for start in range(0, total_pages, pages_per_chunk):
+            end = min(start + pages_per_chunk, total_pages)
+            writer = PdfWriter()
+            for index in range(start, end):
+                writer.add_page(reader.pages[index])
+            buffer = io.BytesIO()
+            writer.write(buffer)
+            chunks.append(PdfChunk(start + 1, end, total_pages, buffer.getvalue()))
+        return chunks
+    except Exception as e:
+        print(f"WARNING: Could not split PDF into page chunks, analyzing it whole: {e}")
+        return []
+    finally:
+        source.seek(0)
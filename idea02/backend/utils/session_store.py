@@ -0,0 +1,143 @@
+import json
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from .local_db import LocalDatabase
+
+
+class _FrontEntry:
+    """An immutable snapshot of one session's state held in process memory."""
+    __slots__ = ("state", "version", "expires_at", "size", "checked_at", "last_access")
+
+    def __init__(self, state: Dict[str, Any], version: float, expires_at: float, size: int, now: float):
+        self.state = state
+        self.version = version
+        self.expires_at = expires_at
+        self.size = size
+        self.checked_at = now
+        self.last_access = now
+
+
+class SessionStore:
+    """
+    Per-session score state shared by every worker process on the host.
+
+    Sessions live in a SQLite table (WAL mode) so any worker can serve any
+    request, with an in-memory LRU front bounded by `max_entries` and
+    `max_bytes`. Reads never take a Python lock: a front entry younger than
+    `revalidate_seconds` is returned directly, an older one is checked against
+    the stored version (a WAL read, which never waits on writers). Sessions
+    expire `ttl_seconds` after their last update.
+    """
+    def __init__(self, db: LocalDatabase, max_entries: int = 256, max_bytes: int = 32 * 1024 * 1024,
+                 ttl_seconds: int = 3600, revalidate_seconds: float = 2.0):
+        self.db = db
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.revalidate_seconds = revalidate_seconds
+        self._front: Dict[str, _FrontEntry] = {}
+        self._front_bytes = 0
+        self._write_lock = threading.Lock()
+        with self.db.transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " session_id TEXT PRIMARY KEY, state TEXT NOT NULL, version REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_expiry ON sessions (expires_at)")
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Returns the session's state, or None if it is unknown or expired. Treat it as read-only."""
+        now = time.time()
+        entry = self._front.get(session_id)
+        if entry and entry.expires_at > now:
+            entry.last_access = now
+            if now - entry.checked_at < self.revalidate_seconds:
+                return entry.state
+            row = self.db.execute("SELECT version FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if row and row[0] == entry.version:
+                entry.checked_at = now
+                return entry.state
+
+        row = self.db.execute(
+            "SELECT state, version, expires_at FROM sessions WHERE session_id = ? AND expires_at > ?", (session_id, now)
+        ).fetchone()
+        if not row:
+            self._drop_front(session_id)
+            return None
+
+        state = json.loads(row[0])
+        self._remember(session_id, _FrontEntry(state, row[1], row[2], len(row[0]), now))
+        return state
+
+    def put(self, session_id: str, state: Dict[str, Any]) -> None:
+        """Replaces the session's whole state and restarts its TTL."""
+        payload = json.dumps(state)
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        with self.db.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, state, version, expires_at) VALUES (?, ?, ?, ?)",
+                (session_id, payload, now, expires_at),
+            )
+            conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+        self._remember(session_id, _FrontEntry(json.loads(payload), now, expires_at, len(payload), now))
+
+    def update(self, session_id: str, **fields: Any) -> Optional[Dict[str, Any]]:
+        """
+        Merges fields into an existing session's state; returns the new state or None if it has expired.
+        The read, merge and write happen in one transaction on the stored row (not the front entry,
+        which may be stale), so concurrent updates from other workers are never overwritten.
+        """
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        with self.db.transaction() as conn:
+            row = conn.execute(
+                "SELECT state, version FROM sessions WHERE session_id = ? AND expires_at > ?", (session_id, now)
+            ).fetchone()
+            if not row:
+                new_state = None
+            else:
+                new_state = {**json.loads(row[0]), **fields}
+                payload = json.dumps(new_state)
+                # Strictly newer than the row it replaces, even within one clock tick
+                version = max(now, row[1] + 1e-6)
+                conn.execute(
+                    "UPDATE sessions SET state = ?, version = ?, expires_at = ? WHERE session_id = ?",
+                    (payload, version, expires_at, session_id),
+                )
+        if new_state is None:
+            self._drop_front(session_id)
+            return None
+        self._remember(session_id, _FrontEntry(json.loads(payload), version, expires_at, len(payload), now))
+        return new_state
+
+    def delete(self, session_id: str) -> None:
+        self.db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        self._drop_front(session_id)
+
+    def _remember(self, session_id: str, entry: _FrontEntry) -> None:
+        """Publishes a new front entry and evicts least recently used entries over the caps."""
+        with self._write_lock:
+            previous = self._front.get(session_id)
+            if previous:
+                self._front_bytes -= previous.size
+            self._front[session_id] = entry
+            self._front_bytes += entry.size
+
+            while len(self._front) > self.max_entries or self._front_bytes > self.max_bytes:
+                now = time.time()
+                victim = min(
+                    self._front,
+                    key=lambda sid: (self._front[sid].expires_at > now, self._front[sid].last_access),
+                )
+                self._front_bytes -= self._front.pop(victim).size
+                if victim == session_id:
+                    break
+
+    def _drop_front(self, session_id: str) -> None:
+        with self._write_lock:
+            entry = self._front.pop(session_id, None)
+            if entry:
+                self._front_bytes -= entry.size
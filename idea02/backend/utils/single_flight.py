@@ -0,0 +1,55 @@
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    """
+    Collapses concurrent identical calls into one.
+
+    The first caller for a key runs the function; callers arriving with the same
+    key while it is still running wait for it and receive the same result (or
+    the same exception). Nothing is kept once the call finishes, so failures
+    are never cached and the next caller simply tries again. Coalescing is per
+    process; results that should outlive the call belong in a cache.
+    """
+    def __init__(self):
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self._counters = {"calls": 0, "coalesced": 0, "errors": 0}
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args: Any) -> Tuple[Any, bool]:
+        """
+        Runs `fn(*args)` unless a call with the same key is already in flight.
+
+        :return: (result, shared) where `shared` is True if this caller waited on
+                 another caller's call instead of running `fn` itself.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+                self._counters["calls"] += 1
+            else:
+                self._counters["coalesced"] += 1
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            with self._lock:
+                self._calls.pop(key, None)
+                self._counters["errors"] += 1
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._calls.pop(key, None)
+        future.set_result(result)
+        return result, False
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._counters, "in_flight": len(self._calls)}
@@ -72,26 +72,118 @@ const LoadingSpinner = ({ loadingMessage }) => {
 };
 
 // --- Main App Component ---
+const JOB_POLL_INTERVAL_MS = 1500;
+
+// Polls a background processing job until it is done, returning its result
+const pollJob = async (statusUrl) => {
+  while (true) {
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+    const response = await fetch(statusUrl);
+    const job = await response.json();
+
+    if (!response.ok) {
+      throw new Error(job.error || 'Lost track of the processing job.');
+    }
+    if (job.status === 'done') return job.result;
+    if (job.status === 'failed') throw new Error(job.error || 'Server error during processing.');
+  }
+};
+
+// Follows a job over Server-Sent Events, passing each event to onEvent; resolves with the
+// final result. Rejects with `connectionLost` set if the stream itself fails (poll instead).
+const streamJob = (eventsUrl, onEvent) => new Promise((resolve, reject) => {
+  const source = new EventSource(eventsUrl);
+  const forward = (name) => source.addEventListener(name, (e) => onEvent(name, JSON.parse(e.data)));
+  ['stage', 'style', 'preview', 'narration', 'narration_done', 'image'].forEach(forward);
+  source.addEventListener('done', (e) => {
+    source.close();
+    resolve(JSON.parse(e.data));
+  });
+  source.addEventListener('error', (e) => {
+    source.close();
+    // Server-sent 'error' events carry data; a dropped connection does not
+    if (e.data) {
+      reject(new Error(JSON.parse(e.data).error || 'Server error during processing.'));
+    } else {
+      reject(Object.assign(new Error('Lost the event stream.'), { connectionLost: true }));
+    }
+  });
+});
+
+// Reads a text/event-stream response body (EventSource cannot POST), passing each event
+// to onEvent; resolves with the data of the final 'done' event.
+const readEventStream = async (response, onEvent) => {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) throw new Error('The stream ended before the visualization was ready.');
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const block = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      let name = 'message';
+      let data = '';
+      block.split('\n').forEach((line) => {
+        if (line.startsWith('event: ')) name = line.slice(7);
+        else if (line.startsWith('data: ')) data += line.slice(6);
+      });
+      if (!data) continue; // Keep-alive comment
+      const payload = JSON.parse(data);
+      if (name === 'done') return payload;
+      if (name === 'error') throw new Error(payload.error || 'Server error during regeneration.');
+      onEvent(name, payload);
+    }
+  }
+};
+
+// PDFs go to the model; MusicXML and MIDI are parsed on the server without it
+const ACCEPTED_EXTENSIONS = ['.pdf', '.musicxml', '.xml', '.mxl', '.mid', '.midi'];
+
+const isAcceptedScore = (selectedFile) =>
+  selectedFile.type === "application/pdf" ||
+  ACCEPTED_EXTENSIONS.some((ext) => selectedFile.name.toLowerCase().endsWith(ext));
+
 const App = () => {
   const [file, setFile] = useState(null);
   const [result, setResult] = useState(null);
   const [isLoading, setIsLoading] = useState(false);
+  // True from the first streamed event until the image and narration are both in
+  const [isStreaming, setIsStreaming] = useState(false);
   const fileInputRef = useRef(null);
   const [error, setError] = useState(null);
 
   const handleFileChange = (e) => {
     const selectedFile = e.target.files[0];
-    if (selectedFile && selectedFile.type === "application/pdf") {
+    if (selectedFile && isAcceptedScore(selectedFile)) {
       setFile(selectedFile);
       setResult(null);
       setError(null);
     } else {
       // Custom modal replacement for alert()
-      setError("File must be a PDF. Please select your sheet music file again.");
+      setError("File must be a PDF, MusicXML or MIDI file. Please select your sheet music file again.");
       setFile(null);
     }
   };
 
+  // Builds the result up from streamed events, so the style and narration show while the image renders
+  const handleStreamEvent = useCallback((name, data) => {
+    if (name === 'style') {
+      setResult({ ...data, narration: '' });
+      setIsLoading(false);
+      setIsStreaming(true);
+    } else if (name === 'narration') {
+      setResult((prev) => prev && { ...prev, narration: prev.narration + data.text });
+    } else if (name === 'preview') {
+      setResult((prev) => prev && { ...prev, preview_url: data.image_url });
+    } else if (name === 'narration_done' || name === 'image') {
+      setResult((prev) => prev && { ...prev, ...data });
+    }
+  }, []);
+
   const processFile = useCallback(async (isRegenerate = false) => {
     if (!file && !isRegenerate) return; 
     setIsLoading(true);
@@ -113,17 +205,36 @@ const App = () => {
         headers['Content-Type'] = 'application/json';
       }
 
+      // Regeneration streams its events straight back in the response
+      if (isRegenerate && window.ReadableStream) endpoint = 'regenerate/stream';
+
       const response = await fetch(`/api/${endpoint}`, {
         method: method,
         headers: headers,
         body: body,
       });
 
-      const data = await response.json();
+      let data;
+      if (response.ok && response.headers.get('Content-Type')?.startsWith('text/event-stream')) {
+        data = await readEventStream(response, handleStreamEvent);
+      } else {
+        data = await response.json();
+      }
 
       if (!response.ok || data.error) {
         throw new Error(data.error || `Server error during ${isRegenerate ? 'regeneration' : 'processing'}.`);
       }
+
+      // Uploads are processed as a background job: follow its event stream, or poll without one
+      if (data.job_id) {
+        try {
+          if (!window.EventSource) throw Object.assign(new Error('No EventSource'), { connectionLost: true });
+          data = await streamJob(`/api/jobs/${data.job_id}/events`, handleStreamEvent);
+        } catch (e) {
+          if (!e.connectionLost) throw e;
+          data = await pollJob(data.status_url);
+        }
+      }
       
       setResult(data);
 
@@ -134,8 +245,9 @@ const App = () => {
       setError(`Processing failed: ${e.message}.`);
     } finally {
       setIsLoading(false);
+      setIsStreaming(false);
     }
-  }, [file]);
+  }, [file, handleStreamEvent]);
 
   // Automatically start processing when a valid file is selected
   useEffect(() => {
@@ -161,13 +273,13 @@ const App = () => {
         className="w-full flex items-center justify-center px-6 py-3 border border-transparent text-lg font-semibold rounded-xl text-white bg-indigo-600 hover:bg-indigo-700 transition duration-150 ease-in-out shadow-lg transform hover:scale-[1.02]"
       >
         <Upload className="w-5 h-5 mr-2" />
-        Upload Sheet Music (PDF Only)
+        Upload Sheet Music (PDF, MusicXML or MIDI)
       </button>
       <input
         type="file"
         ref={fileInputRef}
         onChange={handleFileChange}
-        accept=".pdf"
+        accept={ACCEPTED_EXTENSIONS.join(',')}
         className="hidden"
       />
       {error && <p className="mt-4 text-red-500 text-sm font-medium p-3 bg-red-50 rounded-lg">{error}</p>}
@@ -189,17 +301,29 @@ const App = () => {
       <div className="flex flex-col lg:flex-row">
         {/* Left Side: Image Display */}
         <div className="w-full lg:w-1/2 p-6 flex justify-center items-center bg-gray-50">
-          {result?.image_base64 ? (
+          {result?.image_url ? (
             <div className="w-full h-auto max-w-md aspect-square rounded-xl shadow-xl overflow-hidden transform hover:scale-[1.02] transition-transform duration-300 ring-4 ring-indigo-300/50">
-                {/* The image data is pre-pended with the mime-type */}
+                {/* Viewport-sized WebP variant (falls back to the original); cached by content hash */}
                 <img 
-                    src={`data:image/png;base64,${result.image_base64}`} 
+                    src={result.image_variants?.web || result.image_url} 
                     alt={`Visualization of ${result.title} in ${result.visualization_type} style`}
                     className="w-full h-full object-cover"
                 />
             </div>
+          ) : result?.preview_url ? (
+            <div className="w-full h-auto max-w-md aspect-square rounded-xl shadow-xl overflow-hidden relative ring-4 ring-indigo-300/50">
+                {/* Local, data-exact rendering shown until the model image arrives */}
+                <img 
+                    src={result.preview_url} 
+                    alt={`Preview of ${result.title} in ${result.visualization_type} style`}
+                    className="w-full h-full object-cover opacity-80"
+                />
+                <span className="absolute bottom-2 right-2 text-xs bg-white/80 text-gray-700 px-2 py-1 rounded">Instant preview</span>
+            </div>
           ) : (
-            <div className="w-full h-64 flex items-center justify-center text-gray-400">Image not available</div>
+            <div className="w-full h-64 flex items-center justify-center text-gray-400">
+              {isStreaming ? 'Rendering image...' : 'Image not available'}
+            </div>
           )}
         </div>
 
@@ -208,14 +332,14 @@ const App = () => {
           <div>
             <h3 className="text-xl font-bold text-gray-800 mb-3 border-b pb-2">Narrative for Non-Musicians:</h3>
             <p className="text-lg text-gray-700 italic leading-relaxed bg-indigo-50 p-4 rounded-lg border-l-4 border-indigo-500">
-              {result?.narration || 'Narrative not available.'}
+              {result?.narration || (isStreaming ? 'Writing the narrative...' : 'Narrative not available.')}
             </p>
           </div>
           
           <div className="mt-6 pt-4 border-t border-gray-200">
             <button
               onClick={() => processFile(true)}
-              disabled={isLoading}
+              disabled={isLoading || isStreaming}
               className="w-full flex items-center justify-center px-6 py-3 text-lg font-semibold rounded-xl text-white bg-green-600 hover:bg-green-700 disabled:bg-gray-400 transition duration-150 ease-in-out shadow-md"
             >
               <Wand className="w-5 h-5 mr-2" />
@@ -0,0 +1,7 @@
+import pathlib
+import sys
+
+# The backend is a namespace package run as `python -m backend.app` from idea02/
+_IDEA02_DIR = pathlib.Path(__file__).resolve().parents[1]
+if str(_IDEA02_DIR) not in sys.path:
+    sys.path.insert(0, str(_IDEA02_DIR))
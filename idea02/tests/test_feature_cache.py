@@ -0,0 +1,65 @@
+import time
+
+import pytest
+
+from backend.utils.feature_cache import FeatureCache, features_hash
+from backend.utils.local_db import LocalDatabase
+
+
+@pytest.fixture
+def db(tmp_path):
+    return LocalDatabase(str(tmp_path / "cache.db"))
+
+
+def test_hit_after_put_and_miss_otherwise(db):
+    cache = FeatureCache(db)
+    key = FeatureCache.make_key("abc", "model", "1")
+    assert cache.get(key) is None
+    cache.put(key, {"title": "T"})
+    assert cache.get(key) == {"title": "T"}
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+def test_key_changes_with_model_and_prompt_version():
+    keys = {FeatureCache.make_key("abc", model, version) for model in ("a", "b") for version in ("1", "2")}
+    assert len(keys) == 4
+
+
+def test_features_hash_ignores_key_order():
+    assert features_hash({"a": 1, "b": 2}) == features_hash({"b": 2, "a": 1})
+
+
+def test_expired_entries_miss_and_are_removed(db):
+    cache = FeatureCache(db, ttl_seconds=60)
+    cache.put("k", {"title": "T"})
+    db.execute("UPDATE feature_cache SET created_at = ?", (time.time() - 120,))
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entries_are_evicted(db):
+    cache = FeatureCache(db, max_entries=2)
+    cache.put("old", {"n": 1})
+    cache.put("used", {"n": 2})
+    db.execute("UPDATE feature_cache SET last_access = last_access - 10 WHERE key = 'old'")
+    cache.get("used")
+    cache.put("new", {"n": 3})
+    assert cache.get("old") is None
+    assert cache.get("used") == {"n": 2} and cache.get("new") == {"n": 3}
+    assert cache.stats()["evictions"] == 1
+
+
+def test_byte_limit_evicts_but_keeps_the_newest_entry(db):
+    cache = FeatureCache(db, max_bytes=30)
+    cache.put("a", {"text": "x" * 10})
+    db.execute("UPDATE feature_cache SET last_access = last_access - 10")
+    cache.put("b", {"text": "y" * 10})
+    assert cache.get("a") is None and cache.get("b") == {"text": "y" * 10}
+
+
+def test_counters_are_shared_between_instances(db, tmp_path):
+    FeatureCache(db).put("k", {"title": "T"})
+    other = FeatureCache(LocalDatabase(str(tmp_path / "cache.db")))
+    other.get("k")
+    assert FeatureCache(db).stats()["hits"] == 1
@@ -0,0 +1,72 @@
+import threading
+
+import pytest
+
+from backend.utils.job_queue import JobQueue, QueueFullError, StoredJob
+from backend.utils.local_db import LocalDatabase
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "jobs.db")
+
+
+def _wait_for(job, cursor=0):
+    events = []
+    while True:
+        batch, cursor = job.wait_events(cursor, timeout=2.0)
+        events += batch
+        if not batch and job.finished:
+            return events
+
+
+def test_another_worker_streams_the_job_from_the_database(db_path):
+    owner, other = JobQueue(db=LocalDatabase(db_path)), JobQueue(db=LocalDatabase(db_path))
+    release = threading.Event()
+
+    def body(job):
+        job.start_stage("analysis")
+        for word in ("one", "two", "three"):
+            job.publish("narration", {"text": word})
+        release.wait(5)
+        job.complete_stage("analysis")
+        job.finish({"ok": True})
+
+    job = owner.submit(["analysis"], body)
+    # The job row is written before submit returns, so other workers find it at once
+    stored = other.get(job.id)
+    assert isinstance(stored, StoredJob)
+    release.set()
+    events = _wait_for(stored)
+    assert [event for event, _ in events] == ["stage", "narration", "narration", "narration", "stage", "done"]
+    assert stored.to_dict()["result"] == {"ok": True}
+    assert other.get("unknown") is None
+
+
+def test_publishing_does_not_write_to_the_database(db_path, monkeypatch):
+    queue = JobQueue(db=LocalDatabase(db_path))
+    published = threading.Event()
+    release = threading.Event()
+
+    def body(job):
+        job.publish("narration", {"text": "hi"})
+        published.set()
+        release.wait(5)
+        job.finish({})
+
+    writes = []
+    job = queue.submit([], body)
+    monkeypatch.setattr(queue._store, "_write", lambda jobs: writes.append(threading.current_thread().name))
+    assert published.wait(2)
+    release.set()
+    _wait_for(job)
+    assert "job-worker" not in " ".join(writes)
+
+
+def test_full_queue_is_rejected():
+    queue = JobQueue(max_workers=1, max_queue_depth=0)
+    release = threading.Event()
+    queue.submit([], lambda job: release.wait(5))
+    with pytest.raises(QueueFullError):
+        queue.submit([], lambda job: None)
+    release.set()
@@ -0,0 +1,52 @@
+from backend.music_features import Change, Dynamics, MusicFeatures, Motif, Section, Tempo, merge_features
+
+
+def _chunk(**kwargs):
+    return MusicFeatures(**kwargs)
+
+
+FIRST = _chunk(
+    title="Toile", time_signature="6/8",
+    initial_tempo=Tempo(term="Andante", description="walking pace"),
+    initial_dynamics=Dynamics(level="p", description="soft"),
+    structural_analysis=[Section(section_id="A", description="Opening")],
+    repeating_motifs=[Motif(type="Rhythm", description="Two  dotted quarters")],
+    tempo_changes=[Change(measure=8, description="rit.")],
+)
+SECOND = _chunk(
+    composer="Anon",
+    initial_tempo=Tempo(term="Allegro", description="fast"),
+    initial_dynamics=Dynamics(level="P", description="soft"),
+    structural_analysis=[Section(section_id="A", description="Return")],
+    repeating_motifs=[Motif(type="rhythm", description="two dotted quarters"), Motif(type="Melody", description="Rising")],
+    dynamic_changes=[Change(measure=20, description="louder", level="f")],
+)
+
+
+def test_merge_is_independent_of_completion_order():
+    in_order = merge_features([(1, 2, FIRST), (3, 3, SECOND)])
+    assert merge_features([(3, 3, SECOND), (1, 2, FIRST)]) == in_order
+
+
+def test_identity_comes_from_the_earliest_chunk_that_has_it():
+    merged = merge_features([(1, 2, FIRST), (3, 3, SECOND)])
+    assert (merged.title, merged.composer, merged.time_signature) == ("Toile", "Anon", "6/8")
+    assert merged.initial_tempo.term == "Andante"
+
+
+def test_sections_are_tagged_with_their_pages_and_changes_marked():
+    merged = merge_features([(1, 2, FIRST), (3, 3, SECOND)])
+    assert [s.section_id for s in merged.structural_analysis] == ["A (pp. 1-2)", "Tempo (p. 3)", "A (p. 3)"]
+    # 'p' and 'P' are the same level, so no Dynamics section
+    assert merged.structural_analysis[1].description == "The pace changes to fast (Allegro)."
+
+
+def test_motifs_are_deduplicated_and_changes_concatenated():
+    merged = merge_features([(1, 2, FIRST), (3, 3, SECOND)])
+    assert [m.description for m in merged.repeating_motifs] == ["Two  dotted quarters", "Rising"]
+    assert merged.tempo_changes == FIRST.tempo_changes
+    assert merged.dynamic_changes == SECOND.dynamic_changes
+
+
+def test_merging_nothing_gives_empty_features():
+    assert merge_features([]) == MusicFeatures()
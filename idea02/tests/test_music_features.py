@@ -0,0 +1,76 @@
+import pytest
+
+from backend.music_features import Change, MusicFeatures, Tempo, parse_music_features, repair_json
+
+
+def test_from_dict_keeps_older_field_spellings():
+    features = MusicFeatures.from_dict({
+        "initial_tempo": {"description": "Andante", "bpm_approx": 72, "note_value": "dotted quarter note"},
+        "repeating_motifs": [{"motif_name": "Steady Pulse", "description": "Two dotted quarters", "measures": "Throughout"}],
+        "tempo_changes": [{"measure": 23, "description": "ritardando"}],
+        "dynamic_changes": [{"measure": "m. 33", "level": "pp", "description": "very soft"}],
+        "notes_overview": "Two dotted quarter notes per measure.",
+    })
+    assert features.initial_tempo == Tempo(bpm="72", description="Andante", note_value="dotted quarter note")
+    assert (features.repeating_motifs[0].name, features.repeating_motifs[0].duration) == ("Steady Pulse", "Throughout")
+    assert features.tempo_changes == [Change(measure=23, description="ritardando")]
+    assert features.dynamic_changes == [Change(measure=33, description="very soft", level="pp")]
+    assert features.notes_overview == "Two dotted quarter notes per measure."
+
+
+def test_from_dict_prefers_the_current_spelling():
+    assert MusicFeatures.from_dict({"initial_tempo": {"bpm": "90", "bpm_approx": 72}}).initial_tempo.bpm == "90"
+
+
+def test_from_dict_warns_about_dropped_keys(capsys):
+    MusicFeatures.from_dict({"title": "T", "mystery": 1, "notes_sample": [{"pitch": "C4", "finger": 2}]})
+    warning = capsys.readouterr().out
+    assert "mystery" in warning and "notes_sample.finger" in warning
+
+
+def test_round_trip_is_silent_and_lossless(capsys):
+    features = MusicFeatures.from_dict({"title": "T", "tempo_changes": [{"measure": 4, "description": "rit."}]})
+    assert MusicFeatures.from_dict(features.to_dict()) == features
+    assert capsys.readouterr().out == ""
+
+
+def test_repair_json_strips_fences_and_prose():
+    text = 'Here is the analysis:\n```json\n{"title": "T"}\n```\nHope this helps! {"not": "this"}'
+    assert repair_json(text) == {"title": "T"}
+
+
+def test_repair_json_drops_trailing_commas_and_comments():
+    text = '{"a": [1, 2, ], // the pair\n "b": {"c": 3,},}'
+    assert repair_json(text) == {"a": [1, 2], "b": {"c": 3}}
+
+
+def test_repair_json_replaces_smart_quote_delimiters_only():
+    text = '{\u201ctitle\u201d: \u201cLa \u2018Toile\u2019\u201d, "mood": "a \u201cdreamy\u201d, calm piece // softly"}'
+    assert repair_json(text) == {"title": "La \u2018Toile\u2019", "mood": "a \u201cdreamy\u201d, calm piece // softly"}
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"title": "La To', {"title": "La To"}),
+    ('{"sections": [{"id": "A"}, {"id": "B', {"sections": [{"id": "A"}, {"id": "B"}]}),
+    ('{"title": "T", "composer":', {"title": "T", "composer": None}),
+    ('{"title": "T", "comp', {"title": "T"}),
+])
+def test_repair_json_closes_truncated_output(text, expected):
+    assert repair_json(text) == expected
+
+
+def test_repair_json_rejects_output_without_an_object():
+    with pytest.raises(ValueError):
+        repair_json("Sorry, I cannot read this score.")
+
+
+def test_parse_music_features_uses_strict_json_when_it_can():
+    text = '{"title": "a \u201cquoted\u201d, title", "beat_unit": 1.5}'
+    features = parse_music_features(text)
+    assert features.title == "a \u201cquoted\u201d, title"
+    assert features.beat_unit is None
+
+
+def test_parse_music_features_falls_back_to_repair():
+    features = parse_music_features('```json\n{"title": "T", "tempo_changes": [{"measure": 3, "description": "rit."},]\n```')
+    assert features.title == "T" and features.tempo_changes == [Change(measure=3, description="rit.")]
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from backend.music_features import MusicFeatures, Note, parse_music_features
+from backend.note_array import measure_beats, note_array, note_statistics
+
+# Opening of idea01/inaccessible-toile.json as the model returned it: 6/8 with beats counted in dotted quarters
+TOILE_6_8 = [
+    Note(hand="RH", measure=1, beat=1, pitch="G4", duration="dotted quarter note"),
+    Note(hand="RH", measure=1, beat=2, pitch="G4", duration="dotted quarter note"),
+    Note(hand="LH", measure=1, beat=1, pitch="G2", duration="dotted quarter note"),
+    Note(hand="LH", measure=1, beat=2, pitch="G2", duration="dotted quarter note"),
+    Note(hand="RH", measure=2, beat=1, pitch="B4", duration="dotted quarter note"),
+    Note(hand="RH", measure=2, beat=2, pitch="B4", duration="dotted quarter note"),
+    Note(hand="LH", measure=2, beat=1, pitch="C3", duration="dotted quarter note"),
+    Note(hand="LH", measure=2, beat=2, pitch="C3", duration="dotted quarter note"),
+]
+
+
+def _voice(data, index):
+    notes = data.notes[data.notes["voice"] == index]
+    return notes["onset"].tolist(), notes["duration"].tolist()
+
+
+def test_measure_beats():
+    assert measure_beats("6/8 (two dotted-quarter beats)") == 3.0
+    assert measure_beats("4/4") == 4.0
+    assert measure_beats("") is None
+
+
+def test_model_6_8_sample_keeps_dotted_quarter_onsets():
+    data = note_array(TOILE_6_8, "6/8")
+    for voice in range(2):
+        onsets, durations = _voice(data, voice)
+        assert onsets == [0.0, 1.5, 3.0, 4.5]
+        assert durations == [1.5] * 4
+    assert data.measure_length == 3.0
+
+
+def test_model_6_8_sample_has_no_overlapping_notes():
+    data = note_array(TOILE_6_8, "6/8")
+    for voice in range(2):
+        onsets, durations = _voice(data, voice)
+        assert all(end <= start for end, start in zip(np.add(onsets, durations)[:-1], onsets[1:]))
+
+
+def test_model_6_8_statistics_count_notes_per_quarter():
+    statistics = note_statistics(MusicFeatures(time_signature="6/8", notes_sample=TOILE_6_8))
+    assert statistics.notes_per_beat == [1.33, 1.33]
+
+
+def test_written_positions_keep_rests_when_beat_unit_is_known():
+    # Quarter rest on beat 2: the third note starts on beat 3, not right after the first
+    notes = [
+        Note(hand="RH", measure=1, beat=1, pitch="C4", duration="quarter"),
+        Note(hand="RH", measure=1, beat=3, pitch="E4", duration="quarter"),
+        Note(hand="RH", measure=1, beat=4, pitch="G4", duration="quarter"),
+    ]
+    assert _voice(note_array(notes, "4/4", beat_unit=1.0), 0)[0] == [0.0, 2.0, 3.0]
+    assert _voice(note_array(notes, "4/4"), 0)[0] == [0.0, 1.0, 2.0]
+
+
+def test_out_of_range_beats_fall_back_to_the_running_sum():
+    notes = [Note(hand="RH", measure=1, beat=beat, pitch="C4", duration="quarter") for beat in (1, 2, 9)]
+    assert _voice(note_array(notes, "4/4", beat_unit=1.0), 0)[0] == [0.0, 1.0, 2.0]
+
+
+def test_unreadable_pitches_are_dropped():
+    notes = [Note(hand="RH", measure=1, beat=1, pitch="??", duration="quarter"),
+             Note(hand="RH", measure=1, beat=2, pitch="A4", duration="quarter")]
+    data = note_array(notes, "4/4")
+    assert len(data) == 1 and data.notes["midi"][0] == 69
+
+
+@pytest.mark.parametrize("beat_unit", [0.5, "0.5"])
+def test_model_output_cannot_claim_written_positions(beat_unit):
+    features = parse_music_features(f'{{"time_signature": "6/8", "beat_unit": {beat_unit!r}}}'.replace("'", '"'))
+    assert features.beat_unit is None
+    assert MusicFeatures.from_dict({"beat_unit": beat_unit}).beat_unit == 0.5
@@ -0,0 +1,67 @@
+import threading
+import time
+
+from backend.music_features import MusicFeatures
+from backend.services.prefetch_service import StylePrefetcher
+from backend.utils.local_db import LocalDatabase
+
+
+class FakeGenerator:
+    def __init__(self, gate=None):
+        self.gate = gate
+        self.calls = []
+
+    def generate_visualization(self, features, features_raw_string, prompt_to_use):
+        if self.gate:
+            self.gate.wait(5)
+        self.calls.append(prompt_to_use[0])
+        return {"status": 200, "prompt_name": prompt_to_use[0]}
+
+
+def _wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def _workers(tmp_path, gate=None, **kwargs):
+    path = str(tmp_path / "prefetch.db")
+    generators = FakeGenerator(gate), FakeGenerator()
+    workers = [StylePrefetcher(generator, LocalDatabase(path), lambda sid, score: True, **kwargs)
+               for generator in generators]
+    return workers, generators
+
+
+def test_any_worker_serves_and_tops_up(tmp_path):
+    (first, second), (first_generator, second_generator) = _workers(tmp_path, buffer_size=2, budget_per_score=3)
+    first.start("s", "score", MusicFeatures(title="T"), shown_prompt=None)
+    _wait_until(lambda: first.stats()["buffered"] == 2)
+
+    result = second.take("s", "score", exclude_prompt=None)
+    assert result["metadata"]["prefetched"] and result["prompt_name"] in first_generator.calls
+    # The worker that served the take claims the next style, within the score's budget
+    _wait_until(lambda: second.stats()["buffered"] == 2)
+    assert len(second_generator.calls) == 1
+    second.take("s", "score", exclude_prompt=None)
+    time.sleep(0.1)
+    assert len(first_generator.calls) + len(second_generator.calls) == 3
+
+
+def test_cancel_on_another_worker_discards_generations_in_flight(tmp_path):
+    gate = threading.Event()
+    (first, second), _ = _workers(tmp_path, gate=gate, buffer_size=2)
+    first.start("s", "score", MusicFeatures(title="T"), shown_prompt=None)
+    assert first.stats()["in_flight"] == 2
+    second.cancel("s")
+    gate.set()
+    time.sleep(0.2)
+    assert first.stats() == {"in_flight": 0, "buffered": 0}
+    assert first.take("s", "score", exclude_prompt=None) is None
+
+
+def test_results_for_an_older_score_are_not_served(tmp_path):
+    (first, second), _ = _workers(tmp_path, buffer_size=1)
+    first.start("s", "old", MusicFeatures(title="T"), shown_prompt=None)
+    _wait_until(lambda: first.stats()["buffered"] == 1)
+    assert second.take("s", "new", exclude_prompt=None) is None
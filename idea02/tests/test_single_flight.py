@@ -0,0 +1,63 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from backend.utils.single_flight import SingleFlight
+
+
+def _wait_for_waiters(flight, count, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while flight.stats()["coalesced"] < count:
+        assert time.monotonic() < deadline, "callers never joined the flight"
+        time.sleep(0.001)
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow(value):
+        calls.append(value)
+        release.wait(5)
+        return value * 2
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futures = [pool.submit(flight.do, "key", slow, 21) for _ in range(4)]
+        # Let every caller join the flight before the leader finishes
+        _wait_for_waiters(flight, 3)
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert calls == [21]
+    assert sorted(results, key=lambda r: r[1]) == [(42, False)] + [(42, True)] * 3
+    assert flight.stats() == {"calls": 1, "coalesced": 3, "errors": 0, "in_flight": 0}
+
+
+def test_different_keys_run_separately():
+    flight = SingleFlight()
+    assert flight.do("a", str.upper, "x") == ("X", False)
+    assert flight.do("b", str.upper, "y") == ("Y", False)
+    assert flight.stats()["calls"] == 2
+
+
+def test_failures_reach_waiters_and_are_not_cached():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def failing():
+        release.wait(5)
+        raise RuntimeError("boom")
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        futures = [pool.submit(flight.do, "key", failing) for _ in range(2)]
+        _wait_for_waiters(flight, 1)
+        release.set()
+        for future in futures:
+            with pytest.raises(RuntimeError, match="boom"):
+                future.result()
+
+    assert flight.stats()["errors"] == 1
+    assert flight.do("key", lambda: "ok") == ("ok", False)
@@ -0,0 +1,54 @@
+import io
+
+from backend.music_features import MusicFeatures, Note
+from backend.note_array import beat_length, note_array
+from backend.services.symbolic_analysis import MUSICXML, SymbolicAnalyzer
+
+
+def _musicxml(beats: int, beat_type: int, notes: str) -> io.BytesIO:
+    return io.BytesIO(f"""<?xml version="1.0"?>
+<score-partwise><part-list><score-part id="P1"><part-name>RH</part-name></score-part></part-list>
+<part id="P1"><measure number="1">
+<attributes><divisions>2</divisions><time><beats>{beats}</beats><beat-type>{beat_type}</beat-type></time></attributes>
+{notes}
+</measure></part></score-partwise>""".encode())
+
+
+def _note(step: str, duration: int, type_name: str, dots: int = 0) -> str:
+    return (f"<note><pitch><step>{step}</step><octave>4</octave></pitch><duration>{duration}</duration>"
+            f"<type>{type_name}</type>{'<dot/>' * dots}</note>")
+
+
+def _rest(duration: int) -> str:
+    return f"<note><rest/><duration>{duration}</duration></note>"
+
+
+def test_beat_length():
+    assert beat_length("4/4") == 1.0
+    assert beat_length("2/2") == 2.0
+    assert beat_length("3/8") == 0.5
+    assert beat_length("6/8") == 1.5
+    assert beat_length("12/8") == 1.5
+    assert beat_length("") is None
+
+
+def test_6_8_beats_match_the_model_convention():
+    score = _musicxml(6, 8, _note("G", 3, "quarter", dots=1) + _note("B", 3, "quarter", dots=1))
+    features = SymbolicAnalyzer().extract_features(score, MUSICXML)
+    assert [note.beat for note in features.notes_sample] == [1.0, 2.0]
+    assert features.beat_unit == 1.5
+
+    model = MusicFeatures(time_signature="6/8", notes_sample=[
+        Note(hand="RH", measure=1, beat=beat, pitch=pitch, duration="dotted quarter note")
+        for beat, pitch in ((1, "G4"), (2, "B4"))
+    ])
+    parsed = note_array(features.notes_sample, features.time_signature, beat_unit=features.beat_unit)
+    assert parsed.notes["onset"].tolist() == note_array(model.notes_sample, model.time_signature).notes["onset"].tolist()
+
+
+def test_rests_keep_their_place_in_parsed_scores():
+    score = _musicxml(4, 4, _note("C", 2, "quarter") + _rest(2) + _note("E", 2, "quarter") + _note("G", 2, "quarter"))
+    features = SymbolicAnalyzer().extract_features(score, MUSICXML)
+    assert [note.beat for note in features.notes_sample] == [1.0, 3.0, 4.0]
+    data = note_array(features.notes_sample, features.time_signature, beat_unit=features.beat_unit)
+    assert data.notes["onset"].tolist() == [0.0, 2.0, 3.0]